@@ -2,10 +2,15 @@
 from RGTools.GenomicElements import GenomicElements
 from RGTools.ListFile import ListFile
 from RGTools.BedTable import BedTable3, BedRegion
-from RGTools.ExogeneousSequences import ExogeneousSequences
+
+from ge_utils import GEUtils
+from gebin import GEBin
+from fasta_utils import IndexedFasta
 
 import numpy as np
-import re
+import pandas as pd
+import os
+import mmap
 
 class GenomicElementImport:
     @staticmethod
@@ -27,6 +32,12 @@ class GenomicElementImport:
         )
         GenomicElementImport.set_parser_allele_expanded_es(parser_allele_expanded_es)
 
+        parser_gebin = subparsers.add_parser(
+            "gebin",
+            help="Import a binary gebin region file as a text region file.",
+        )
+        GenomicElementImport.set_parser_gebin(parser_gebin)
+
     @staticmethod
     def set_parser_stat_list(parser):
         GenomicElements.set_parser_genomic_element_region(parser)
@@ -45,7 +56,13 @@ class GenomicElementImport:
                             help="Dtype of the outputted array.",
                             default="str",
                             type=str,
-                            choices=["str", "np.int32", "np.int64", "np.float32", "np.float64"],
+                            choices=["str"] + list(GEUtils.get_numeric_dtype_dict().keys()),
+                            )
+
+        parser.add_argument("--chunk_size",
+                            help="Number of lines parsed at a time for numeric dtypes with npy output.",
+                            type=int,
+                            default=1000000,
                             )
 
         return parser
@@ -85,48 +102,195 @@ class GenomicElementImport:
                             )
         return parser
 
+    @staticmethod
+    def set_parser_gebin(parser):
+        parser.add_argument("--inpath", "-I",
+                            help="Input path of the gebin region file.",
+                            required=True,
+                            )
+
+        parser.add_argument("--opath",
+                            help="Output path of the region file.",
+                            required=True,
+                            )
+
+        parser.add_argument("--chunk_size",
+                            help="If given, convert the regions in chunks of this many regions.",
+                            type=int,
+                            default=None,
+                            )
+        return parser
+
     @staticmethod
     def get_informat_options():
-        return ["stat_list", "allele_expanded_ES"]
-
-    @staticmethod
-    def _parse_allele_expanded_seq_id(seq_id):
-        ref_match = re.match(r"^(.+)_(\d+)_(\d+)_ref$", seq_id)
-        if ref_match:
-            return {
-                "chrom": ref_match.group(1),
-                "start": int(ref_match.group(2)),
-                "end": int(ref_match.group(3)),
-                "is_ref": True,
-                "snp_pos": None,
-            }
-
-        alt_match = re.match(r"^(.+)_(\d+)_(\d+)_(\d+):([A-Za-z])2([A-Za-z])$", seq_id)
-        if alt_match:
-            return {
-                "chrom": alt_match.group(1),
-                "start": int(alt_match.group(2)),
-                "end": int(alt_match.group(3)),
-                "is_ref": False,
-                "snp_pos": int(alt_match.group(4)),
-            }
-
-        raise ValueError(
-            f"Invalid allele_expanded_ES FASTA header '{seq_id}'. "
-            "Expected 'chrom_start_end_ref' or 'chrom_start_end_<snp_position>:<ref_base>2<alt_base>'."
-        )
+        return ["stat_list", "allele_expanded_ES", "gebin"]
 
     @staticmethod
-    def _select_alt_stat(ref_stat, alt_stats, method):
+    def get_allele_expanded_index_path(inpath):
         '''
-        Used in `import_allele_expanded_es` to select the alt stat value based on the reference stat value and the method.
+        Path of the record index written by `export allele_expanded_ES` next to the FASTA file.
         '''
-        if len(alt_stats) == 0:
-            return np.nan
-        if method == "max_abs_fc":
-            alt_stats = np.asarray(alt_stats)
-            return alt_stats[np.argmax(np.abs(alt_stats - ref_stat))]
-        raise ValueError(f"Unsupported stat_selection_method: {method}")
+        return inpath + ".index.tsv"
+
+    @staticmethod
+    def parse_allele_expanded_seq_ids(seq_ids):
+        '''
+        Parse allele_expanded_ES FASTA headers in bulk.
+
+        Keyword arguments:
+        - seq_ids: FASTA headers, 'chrom_start_end_ref' or 'chrom_start_end_<snp_position>:<ref_base>2<alt_base>'.
+
+        Returns:
+        - record_df: DataFrame with chrom, start, end and is_ref columns, one row per header.
+        '''
+        seq_id_ser = pd.Series(seq_ids, dtype=object).astype(str)
+        field_df = seq_id_ser.str.rsplit("_", n=3, expand=True).reindex(columns=range(4))
+
+        is_ref_arr = (field_df[3] == "ref").to_numpy()
+        is_valid_arr = field_df[1].str.isdigit().fillna(False).to_numpy(dtype=bool) & \
+                       field_df[2].str.isdigit().fillna(False).to_numpy(dtype=bool) & \
+                       (field_df[0].str.len().fillna(0).to_numpy() > 0) & \
+                       (is_ref_arr | field_df[3].str.fullmatch(r"\d+:[A-Za-z]2[A-Za-z]").fillna(False).to_numpy(dtype=bool))
+        if not is_valid_arr.all():
+            raise ValueError(
+                f"Invalid allele_expanded_ES FASTA header '{seq_id_ser.iat[np.argmin(is_valid_arr)]}'. "
+                "Expected 'chrom_start_end_ref' or 'chrom_start_end_<snp_position>:<ref_base>2<alt_base>'."
+            )
+
+        return pd.DataFrame({"chrom": field_df[0].to_numpy(),
+                             "start": field_df[1].to_numpy().astype(np.int64),
+                             "end": field_df[2].to_numpy().astype(np.int64),
+                             "is_ref": is_ref_arr,
+                             })
+
+    @staticmethod
+    def read_allele_expanded_index(inpath):
+        '''
+        Read the record index of `export allele_expanded_ES` next to a FASTA file.
+        The index is only used if it is not older than the FASTA file and its last byte offset
+        points at the last record of the file.
+
+        Returns:
+        - index_df: DataFrame with chrom, start, end and snp_pos columns, None if there is no usable index.
+        '''
+        index_path = GenomicElementImport.get_allele_expanded_index_path(inpath)
+        if not IndexedFasta.is_index_current(inpath, index_path):
+            return None
+
+        index_df = pd.read_csv(index_path,
+                               sep="\t",
+                               usecols=["byte_offset", "chrom", "start", "end", "snp_pos"],
+                               dtype={"byte_offset": np.int64, "chrom": str, "start": np.int64, "end": np.int64, "snp_pos": np.int64},
+                               )
+        if len(index_df) == 0:
+            return index_df if os.path.getsize(inpath) == 0 else None
+
+        # The last record must start at its offset and run to the end of the file
+        last_byte_offset = int(index_df["byte_offset"].iat[-1])
+        if last_byte_offset >= os.path.getsize(inpath):
+            return None
+        with open(inpath, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as fasta_mmap:
+            if fasta_mmap[last_byte_offset:last_byte_offset + 1] != b">" or fasta_mmap.find(b"\n>", last_byte_offset) >= 0:
+                return None
+
+        return index_df
+
+    @staticmethod
+    def read_allele_expanded_records(inpath):
+        '''
+        Read the region and reference/alternate status of each record of an allele_expanded_ES FASTA file.
+        The record index of `export allele_expanded_ES` is used if it matches the FASTA file (see
+        read_allele_expanded_index), otherwise the FASTA headers are parsed. Sequences are never loaded.
+
+        Returns:
+        - record_df: DataFrame with chrom, start, end and is_ref columns, one row per FASTA record.
+        '''
+        index_df = GenomicElementImport.read_allele_expanded_index(inpath)
+        if index_df is not None:
+            return pd.DataFrame({"chrom": index_df["chrom"].to_numpy(),
+                                 "start": index_df["start"].to_numpy(),
+                                 "end": index_df["end"].to_numpy(),
+                                 "is_ref": (index_df["snp_pos"] < 0).to_numpy(),
+                                 })
+
+        return GenomicElementImport.parse_allele_expanded_seq_ids(IndexedFasta.scan_seq_ids(inpath))
+
+    @staticmethod
+    def get_allele_expanded_groups(record_df):
+        '''
+        Group allele_expanded_ES records by region.
+
+        Keyword arguments:
+        - record_df: DataFrame with chrom, start, end and is_ref columns.
+
+        Returns:
+        - region_df: DataFrame of chrom, start and end of the regions, in order of first appearance.
+        - group_arr: Region index of each record.
+        - ref_index_arr: Record index of the reference sequence of each region.
+        '''
+        group_arr, region_index = pd.MultiIndex.from_arrays([record_df["chrom"], record_df["start"], record_df["end"]],
+                                                            names=["chrom", "start", "end"],
+                                                            ).factorize()
+        region_df = region_index.to_frame(index=False)
+        is_ref_arr = record_df["is_ref"].to_numpy()
+
+        num_refs_arr = np.bincount(group_arr[is_ref_arr], minlength=len(region_df))
+        if (num_refs_arr > 1).any():
+            key = tuple(region_df.iloc[np.argmax(num_refs_arr > 1)])
+            raise ValueError(f"Duplicate reference FASTA entry for region {key}.")
+        if (num_refs_arr == 0).any():
+            missing_ref = [tuple(r) for r in region_df[num_refs_arr == 0].itertuples(index=False)]
+            raise ValueError(f"Missing reference FASTA entry for regions: {missing_ref}")
+
+        ref_index_arr = np.empty(len(region_df), dtype=np.int64)
+        ref_index_arr[group_arr[is_ref_arr]] = np.flatnonzero(is_ref_arr)
+
+        return region_df, group_arr, ref_index_arr
+
+    @staticmethod
+    def select_alt_record_indices(stat_mat, group_arr, ref_index_arr, alt_record_idx, method):
+        '''
+        Select the representative alternate record of each region for several stats at once.
+        Used in `import_allele_expanded_es`.
+
+        Keyword arguments:
+        - stat_mat: (num_records, num_stats) array of stat values.
+        - group_arr: Region index of each record.
+        - ref_index_arr: Record index of the reference sequence of each region.
+        - alt_record_idx: Record indices of the alternate sequences.
+        - method: Selection method. max_abs_fc picks the alternate with the largest absolute
+            difference to the reference, the first one in file order on ties.
+
+        Returns:
+        - alt_group_arr: Regions with at least one alternate record.
+        - selected_record_mat: (len(alt_group_arr), num_stats) record indices of the selected alternates.
+        '''
+        if method != "max_abs_fc":
+            raise ValueError(f"Unsupported stat_selection_method: {method}")
+
+        num_stats = stat_mat.shape[1]
+        if len(alt_record_idx) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, num_stats), dtype=np.int64)
+
+        # Alternates grouped by region, in file order within a region
+        alt_record_idx = alt_record_idx[np.argsort(group_arr[alt_record_idx], kind="stable")]
+        record_group_arr = group_arr[alt_record_idx]
+        is_seg_start_arr = np.concatenate(([True], record_group_arr[1:] != record_group_arr[:-1]))
+        seg_start_arr = np.flatnonzero(is_seg_start_arr)
+        seg_arr = np.cumsum(is_seg_start_arr) - 1
+
+        fc_mat = np.abs(stat_mat[alt_record_idx] - stat_mat[ref_index_arr[record_group_arr]])
+        # NaN differences are selected first, as np.argmax does
+        fc_mat[np.isnan(fc_mat)] = np.inf
+
+        seg_max_mat = np.maximum.reduceat(fc_mat, seg_start_arr, axis=0)
+        pos_mat = np.where(fc_mat == seg_max_mat[seg_arr],
+                           np.arange(len(alt_record_idx))[:, None],
+                           len(alt_record_idx),
+                           )
+        seg_first_mat = np.minimum.reduceat(pos_mat, seg_start_arr, axis=0)
+
+        return record_group_arr[seg_start_arr], alt_record_idx[seg_first_mat]
 
     @staticmethod
     def import_allele_expanded_es(args):
@@ -136,35 +300,17 @@ class GenomicElementImport:
                 f"Got {len(args.stat_name)}, {len(args.stat_npy)}, and {len(args.stat_selection_method)}."
             )
 
-        input_es = ExogeneousSequences(args.inpath)
-        seq_ids = list(input_es.get_sequence_ids())
-        if len(seq_ids) == 0:
+        record_df = GenomicElementImport.read_allele_expanded_records(args.inpath)
+        if len(record_df) == 0:
             raise ValueError(f"No FASTA entries found in {args.inpath}")
 
-        group_dict = {}
-        ordered_keys = []
-        for i, seq_id in enumerate(seq_ids):
-            parsed_id = GenomicElementImport._parse_allele_expanded_seq_id(str(seq_id))
-            key = (parsed_id["chrom"], parsed_id["start"], parsed_id["end"])
-            if key not in group_dict:
-                group_dict[key] = {"ref_index": None, "alt_indices": []}
-                ordered_keys.append(key)
-
-            if parsed_id["is_ref"]:
-                if group_dict[key]["ref_index"] is not None:
-                    raise ValueError(f"Duplicate reference FASTA entry for region {key}.")
-                group_dict[key]["ref_index"] = i
-            else:
-                group_dict[key]["alt_indices"].append(i)
-
-        missing_ref = [k for k, v in group_dict.items() if v["ref_index"] is None]
-        if len(missing_ref) > 0:
-            raise ValueError(f"Missing reference FASTA entry for regions: {missing_ref}")
+        region_df, group_arr, ref_index_arr = GenomicElementImport.get_allele_expanded_groups(record_df)
+        alt_record_idx = np.flatnonzero(~record_df["is_ref"].to_numpy())
 
         bed3_path = args.anno_oheader + ".bed3"
         output_bt = BedTable3(enable_sort=True)
         output_bt.load_from_bed_regions([
-            BedRegion(chrom=k[0], start=k[1], end=k[2]) for k in ordered_keys
+            BedRegion(chrom=chrom, start=int(start), end=int(end)) for chrom, start, end in region_df.itertuples(index=False)
         ])
         output_bt.write(bed3_path)
 
@@ -172,8 +318,9 @@ class GenomicElementImport:
                                     region_file_type="bed3",
                                     fasta_path=None,
                                     )
-        num_fasta_records = len(seq_ids)
-        for stat_name, stat_npy, stat_method in zip(args.stat_name, args.stat_npy, args.stat_selection_method):
+        num_fasta_records = len(record_df)
+        stat_arr_list = []
+        for stat_npy in args.stat_npy:
             stat_arr = np.load(stat_npy, allow_pickle=False)
             if hasattr(stat_arr, "files"):
                 keys = list(stat_arr.keys())
@@ -190,19 +337,36 @@ class GenomicElementImport:
                     f"Stat array length {len(stat_arr)} in {stat_npy} does not match "
                     f"number of FASTA entries {num_fasta_records} in {args.inpath}"
                 )
+            stat_arr_list.append(stat_arr)
+
+        # Select the alternates of all stats sharing a selection method at once
+        selected_record_dict = {}
+        for stat_method in set(args.stat_selection_method):
+            stat_idx_list = [i for i, m in enumerate(args.stat_selection_method) if m == stat_method]
+            stat_mat = np.stack([stat_arr_list[i] for i in stat_idx_list], axis=1).astype(np.float64)
+            alt_group_arr, selected_record_mat = GenomicElementImport.select_alt_record_indices(stat_mat,
+                                                                                              group_arr,
+                                                                                              ref_index_arr,
+                                                                                              alt_record_idx,
+                                                                                              stat_method,
+                                                                                              )
+            for j, i in enumerate(stat_idx_list):
+                selected_record_dict[i] = (alt_group_arr, selected_record_mat[:, j])
+
+        for i, stat_name in enumerate(args.stat_name):
+            stat_arr = stat_arr_list[i]
+            alt_group_arr, selected_record_arr = selected_record_dict[i]
+
+            ref_stats = stat_arr[ref_index_arr]
+            if len(alt_group_arr) == len(region_df):
+                alt_stats = stat_arr[selected_record_arr]
+            else:
+                # Regions without alternates get NaN
+                alt_stats = np.full(len(region_df), np.nan, dtype=np.result_type(stat_arr.dtype, np.float64))
+                alt_stats[alt_group_arr] = stat_arr[selected_record_arr]
 
-            ref_stats = []
-            alt_stats = []
-            for key in ordered_keys:
-                ref_index = group_dict[key]["ref_index"]
-                alt_indices = group_dict[key]["alt_indices"]
-                ref_val = stat_arr[ref_index]
-                alt_val = GenomicElementImport._select_alt_stat(ref_val, stat_arr[alt_indices], stat_method)
-                ref_stats.append(ref_val)
-                alt_stats.append(alt_val)
-
-            output_ge.load_region_stat_from_arr(f"{stat_name}.ref", np.asarray(ref_stats))
-            output_ge.load_region_stat_from_arr(f"{stat_name}.alt", np.asarray(alt_stats))
+            output_ge.load_region_stat_from_arr(f"{stat_name}.ref", ref_stats)
+            output_ge.load_region_stat_from_arr(f"{stat_name}.alt", alt_stats)
             output_ge.save_anno_npy(f"{stat_name}.ref", f"{args.anno_oheader}.{stat_name}.ref.npy")
             output_ge.save_anno_npy(f"{stat_name}.alt", f"{args.anno_oheader}.{stat_name}.alt.npy")
 
@@ -210,11 +374,21 @@ class GenomicElementImport:
     def import_stat_list(args):
         '''
         Import stat annotation values from a list file.
+        Numeric values written to npy are parsed in chunks straight into a memory-mapped output.
         '''
         input_ge = GenomicElements(region_file_path=args.region_file_path,
                                    region_file_type=args.region_file_type,
                                    fasta_path=None,
                                    )
+        if args.dtype in GEUtils.get_numeric_dtype_dict() and args.opath.endswith(".npy"):
+            GenomicElementImport.stream_numeric_list_to_npy(args.inpath,
+                                                            args.opath,
+                                                            GEUtils.get_numeric_dtype_dict()[args.dtype],
+                                                            input_ge.get_num_regions(),
+                                                            getattr(args, "chunk_size", 1000000),
+                                                            )
+            return
+
         lsfile = ListFile()
         lsfile.read_file(args.inpath)
         
@@ -232,11 +406,80 @@ class GenomicElementImport:
         else:
             raise ValueError(f"Invalid output file type: {args.opath}")
 
+    @staticmethod
+    def stream_numeric_list_to_npy(inpath, opath, dtype, num_regions, chunk_size):
+        '''
+        Parse a numeric list file in chunks with the pandas C reader and write the values
+        to a (num_regions, 1) stat npy file through a memmap.
+
+        Keyword arguments:
+        - inpath: Path of the list file, one value per line.
+        - opath: Output npy path.
+        - dtype: NumPy dtype of the output.
+        - num_regions: Expected number of lines.
+        - chunk_size: Number of lines parsed at a time.
+
+        The output only appears at opath once the whole file is parsed and the line count matches.
+        '''
+        tmp_opath = f"{opath}.{os.getpid()}.tmp.npy"
+        try:
+            output_arr = np.lib.format.open_memmap(tmp_opath, mode="w+", dtype=dtype, shape=(num_regions, 1))
+
+            num_lines = 0
+            # pandas cannot parse an empty file
+            chunk_reader = pd.read_csv(inpath,
+                                       sep="\t",
+                                       header=None,
+                                       names=["value"],
+                                       dtype={"value": dtype},
+                                       skip_blank_lines=False,
+                                       chunksize=chunk_size,
+                                       engine="c",
+                                       ) if os.path.getsize(inpath) > 0 else []
+            for chunk_df in chunk_reader:
+                if num_lines + len(chunk_df) <= num_regions:
+                    output_arr[num_lines:num_lines + len(chunk_df), 0] = chunk_df["value"].to_numpy()
+                num_lines += len(chunk_df)
+
+            output_arr.flush()
+            del output_arr
+
+            if num_lines != num_regions:
+                raise ValueError(f"Number of regions in the input file {num_lines} does not match the number of regions in the region file {num_regions}")
+
+            os.replace(tmp_opath, opath)
+        except BaseException:
+            if os.path.exists(tmp_opath):
+                os.remove(tmp_opath)
+            raise
+
+    @staticmethod
+    def import_gebin(args):
+        '''
+        Import a gebin region file as a text region file of the type recorded in the gebin file.
+        '''
+        if args.chunk_size is not None:
+            GEUtils.stream_region_transform(args.inpath, 
+                                            "gebin", 
+                                            args.opath, 
+                                            args.chunk_size, 
+                                            lambda region_df, chunk_offset: region_df, 
+                                            output_region_file_type=GEBin(args.inpath).get_region_file_type(), 
+                                            )
+            return
+
+        GEUtils.write_region_df(GEUtils.read_region_df(args.inpath, "gebin"), 
+                                args.opath, 
+                                GEBin(args.inpath).get_region_file_type(), 
+                                )
+
     @staticmethod
     def main(args):
         if args.informat == "stat_list":
             GenomicElementImport.import_stat_list(args)
         elif args.informat == "allele_expanded_ES":
             GenomicElementImport.import_allele_expanded_es(args)
+        elif args.informat == "gebin":
+            GenomicElementImport.import_gebin(args)
         else:
             raise ValueError(f"Invalid input format: {args.informat}")
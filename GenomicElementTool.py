@@ -13,6 +13,7 @@ from export import GenomicElementExport
 from GenomicElementImport import GenomicElementImport
 from get_context_ge import GetContextGe
 from mask_op import MaskOp
+from pipeline import Pipeline
 
 class GenomicElementTool:
     @staticmethod
@@ -46,7 +47,7 @@ class GenomicElementTool:
         Bed2TssBed.set_parser(parser_bed2tssbed)
 
         parser_onehot = subparsers.add_parser("onehot",
-                                              help="One-hot encode the sequence. Only support elements of the same size.",
+                                              help="One-hot encode the sequence. npy output only supports elements of the same size.",
                                               )
         
         OneHot.set_parser(parser_onehot)
@@ -93,6 +94,13 @@ class GenomicElementTool:
 
         MaskOp.set_parser(parser_mask_op)
 
+        parser_pipeline = subparsers.add_parser(
+            "pipeline",
+            help="Run a chain of region transforms and a terminal step in one invocation.",
+        )
+
+        Pipeline.set_parser(parser_pipeline)
+
     @staticmethod
     def main(args):
         if args.subcommand == "count_single_bw":
@@ -119,6 +127,8 @@ class GenomicElementTool:
             GetContextGe.main(args)
         elif args.subcommand == "mask_op":
             MaskOp.main(args)
+        elif args.subcommand == "pipeline":
+            Pipeline.main(args)
         else:
             raise ValueError("Unknown subcommand: {}".format(args.subcommand))
 
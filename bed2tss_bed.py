@@ -1,12 +1,14 @@
 
-import pandas as pd
+import numpy as np
 
-from RGTools.GenomicElements import GenomicElements
+from RGTools.exceptions import InvalidStrandnessException
+
+from ge_utils import GEUtils
 
 class Bed2TssBed:
     @staticmethod
     def set_parser(parser):
-        GenomicElements.set_parser_genomic_element_region(parser)
+        GEUtils.set_parser_genomic_element_region(parser)
         parser.add_argument("--opath",
                             help="Output path for the TSS BED file",
                             type=str,
@@ -21,6 +23,8 @@ class Bed2TssBed:
                             type=str, 
                             )
 
+        GEUtils.set_parser_chunk_size(parser)
+
     @staticmethod
     def get_output_site_types():
         return ["TSS", "center"]
@@ -37,28 +41,77 @@ class Bed2TssBed:
         
         return site
 
+    @staticmethod
+    def get_output_site_coord_arr(start_arr, end_arr, strand_arr, output_site_type):
+        '''
+        Array version of `get_output_site_coord`.
+
+        Keyword arguments:
+        - start_arr: Array of region starts.
+        - end_arr: Array of region ends.
+        - strand_arr: Array of region strands (None if the regions are unstranded).
+        - output_site_type: The site for output.
+
+        Returns:
+        - site_arr: Array of output sites.
+        '''
+        start_arr = np.asarray(start_arr, dtype=np.int64)
+        end_arr = np.asarray(end_arr, dtype=np.int64)
+
+        if output_site_type == "TSS":
+            if strand_arr is None:
+                raise InvalidStrandnessException("Strand information is required for output site TSS.")
+            strand_arr = np.asarray(strand_arr).astype(str)
+            minus_logical = strand_arr == "-"
+            if not np.all(minus_logical | (strand_arr == "+")):
+                raise InvalidStrandnessException("Strand information is required for output site TSS. "
+                                                 f"Got strands: {np.unique(strand_arr).tolist()}")
+            site_arr = np.where(minus_logical, end_arr - 1, start_arr)
+        elif output_site_type == "center":
+            site_arr = (start_arr + end_arr) // 2
+        else:
+            raise ValueError("Unknown output site type: {}".format(output_site_type))
+
+        return site_arr
+
+    @staticmethod
+    def get_output_site_df(region_df, output_site_type):
+        '''
+        Convert all regions of a region table to 1bp output sites.
+        '''
+        output_site_arr = Bed2TssBed.get_output_site_coord_arr(
+            region_df["start"].to_numpy(dtype=np.int64), 
+            region_df["end"].to_numpy(dtype=np.int64), 
+            region_df["strand"].to_numpy() if "strand" in region_df.columns else None, 
+            output_site_type, 
+        )
+
+        output_df = region_df.copy()
+        output_df["start"] = output_site_arr
+        output_df["end"] = output_site_arr + 1
+
+        return output_df
+
     @staticmethod
     def main(args):
-        genomic_elements = GenomicElements(region_file_path=args.region_file_path,
-                                           region_file_type=args.region_file_type,
-                                           fasta_path=None, 
-                                           )
-        region_bt = genomic_elements.get_region_bed_table()
-
-        output_region_list = []
-        for region in region_bt.iter_regions():
-            output_coord = Bed2TssBed.get_output_site_coord(region, args.output_site)
-            
-            output_region_dict = region.to_dict()
-            output_region_dict["start"] = output_coord
-            output_region_dict["end"] = output_coord + 1
-            output_region_list.append(output_region_dict)
-
-        output_df = pd.DataFrame(output_region_list, 
-                                 columns=region_bt.column_names, 
-                                 )
-        
-        output_bt = region_bt._clone_empty()
-        output_bt.load_from_dataframe(output_df)
-        output_bt.write(args.opath)
+        if args.chunk_size is not None:
+            GEUtils.stream_region_transform(args.region_file_path, 
+                                            args.region_file_type, 
+                                            args.opath, 
+                                            args.chunk_size, 
+                                            lambda region_df, chunk_offset: Bed2TssBed.get_output_site_df(
+                                                region_df, 
+                                                args.output_site, 
+                                            ), 
+                                            )
+            return
 
+        region_df = GEUtils.read_region_df(args.region_file_path, args.region_file_type)
+
+        output_df = Bed2TssBed.get_output_site_df(region_df, args.output_site)
+        
+        GEUtils.write_region_df(output_df, 
+                                args.opath, 
+                                args.region_file_type, 
+                                GEUtils.get_base_region_file_type(args.region_file_path, args.region_file_type), 
+                                )
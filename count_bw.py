@@ -39,26 +39,76 @@ class CountSingleBw:
 
         bw_track = SingleBwTrack(bw_path=args.bw_path)
 
+        output_list = CountSingleBw.count_regions(bw_track, 
+                                                  region_bt.iter_regions(), 
+                                                  args.quantification_type, 
+                                                  )
+
+        CountSingleBw.save_count(output_list, 
+                                 args.quantification_type, 
+                                 args.opath, 
+                                 )
+
+    @staticmethod
+    def count_regions(bw_track, regions, quantification_type):
+        '''
+        Count signal for each region.
+
+        Keyword arguments:
+        - bw_track: SingleBwTrack object.
+        - regions: Iterable of regions (anything indexable by chrom, start and end).
+        - quantification_type: Type of quantification.
+
+        Returns:
+        - output_list: List of counts, one per region.
+        '''
         output_list = []
-        for region in region_bt.iter_regions():
+        for region in regions:
 
             output_list.append(bw_track.count_single_region(region["chrom"],
                                                             region["start"],
                                                             region["end"],
-                                                            output_type=args.quantification_type,
+                                                            output_type=quantification_type,
                                                             min_len_after_padding=1, 
                                                             ),
                                )
 
-        if args.quantification_type == "full_track":
-            genomic_elements.load_region_track_from_list("count", output_list)
-        else:
-            genomic_elements.load_region_stat_from_arr("count", np.array(output_list))
+        return output_list
 
-        if args.opath.endswith(".npz"):
-            genomic_elements.save_anno_npz("count", args.opath)
+    @staticmethod
+    def get_count_arr(output_list, quantification_type):
+        '''
+        Stack the counts of the regions into an annotation array.
+
+        Keyword arguments:
+        - output_list: List of counts, one per region (see count_regions).
+        - quantification_type: Type of quantification.
+
+        Returns:
+        - count_arr: (N, 1) stat array, or (N, L) track array zero-padded to the longest 
+            region for full_track.
+        '''
+        if quantification_type == "full_track":
+            max_len = max((len(track) for track in output_list), default=0)
+            count_arr = np.zeros((len(output_list), max_len))
+            for i, track in enumerate(output_list):
+                count_arr[i, :len(track)] = track
+            return count_arr
+
+        return np.array(output_list).reshape(len(output_list), -1) if len(output_list) > 0 \
+               else np.zeros((0, 1))
+
+    @staticmethod
+    def save_count(output_list, quantification_type, opath):
+        '''
+        Save the counts of the regions as an annotation npy file, or a npz file with a single array.
+        '''
+        count_arr = CountSingleBw.get_count_arr(output_list, quantification_type)
+
+        if opath.endswith(".npz"):
+            np.savez(opath, count_arr)
         else:
-            genomic_elements.save_anno_npy("count", args.opath)
+            np.save(opath, count_arr)
 
 class CountPairedBw:
     @staticmethod
@@ -119,11 +169,43 @@ class CountPairedBw:
                                  bw_mn_path=args.bw_mn,
                                  )
 
+        output_list = CountPairedBw.count_regions(bw_track, 
+                                                  region_bt.iter_regions(), 
+                                                  args.region_file_type, 
+                                                  args.override_strand, 
+                                                  args.quantification_type, 
+                                                  args.flip_mn, 
+                                                  args.negative_mn, 
+                                                  )
+
+        CountSingleBw.save_count(output_list, 
+                                 args.quantification_type, 
+                                 args.opath, 
+                                 )
+
+    @staticmethod
+    def count_regions(bw_track, regions, region_file_type, override_strand, 
+                      quantification_type, flip_mn, negative_mn):
+        '''
+        Count signal for each region.
+
+        Keyword arguments:
+        - bw_track: PairedBwTrack object.
+        - regions: Iterable of regions (anything indexable by chrom, start, end and strand).
+        - region_file_type: Type of the region file.
+        - override_strand: Override the strand information (None if use the region strand info).
+        - quantification_type: Type of quantification.
+        - flip_mn: If to flip the minus strand signal.
+        - negative_mn: Whether to output the minus strand signal as negative.
+
+        Returns:
+        - output_list: List of counts, one per region.
+        '''
         output_list = []
-        for region in region_bt.iter_regions():
-            if args.override_strand:
-                strand = args.override_strand
-            elif args.region_file_type == "bed3":
+        for region in regions:
+            if override_strand:
+                strand = override_strand
+            elif region_file_type == "bed3":
                 strand = "."
             elif not region["strand"]:
                 strand = "."
@@ -134,20 +216,11 @@ class CountPairedBw:
                                                             region["start"],
                                                             region["end"],
                                                             strand, 
-                                                            output_type=args.quantification_type,
+                                                            output_type=quantification_type,
                                                             min_len_after_padding=1, 
-                                                            flip_mn=args.flip_mn,
-                                                            negative_mn=args.negative_mn,
+                                                            flip_mn=flip_mn,
+                                                            negative_mn=negative_mn,
                                                             ),
                                )
 
-        if args.quantification_type == "full_track":
-            genomic_elements.load_region_track_from_list("count", output_list)
-        else:
-            genomic_elements.load_region_stat_from_arr("count", np.array(output_list))
-
-        if args.opath.endswith(".npz"):
-            genomic_elements.save_anno_npz("count", args.opath)
-        else:
-            genomic_elements.save_anno_npy("count", args.opath)
-    
+        return output_list
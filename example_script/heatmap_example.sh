@@ -5,34 +5,20 @@ cat RGTools/large_files/ENCFF156JSS.bedTRE | \
     awk 'BEGIN{FS="\t"; OFS="\t"}{print $1, $2, $3}' > \
     ${OPATH}/pints_regions.bed
 
-./GenomicElementTool.py bed2tssbed \
+./GenomicElementTool.py pipeline \
     --region_file_path ${OPATH}/pints_regions.bed \
     --region_file_type bed3 \
-    --output_site center \
-    --opath ${OPATH}/pints_regions.center.bed3
-
-./GenomicElementTool.py pad_region \
-    --region_file_path ${OPATH}/pints_regions.center.bed3 \
-    --region_file_type bed3 \
-    --upstream_pad 500 \
-    --downstream_pad 499 \
+    --transform center \
+    --transform pad:500:499 \
     --ignore_strand True \
     --method_resolving_invalid_region drop \
-    --opath ${OPATH}/pints_regions.1kb.bed3
-
-./GenomicElementTool.py count_single_bw \
-    --region_file_path ${OPATH}/pints_regions.1kb.bed3 \
-    --region_file_type bed3 \
+    --region_opath ${OPATH}/pints_regions.1kb.bed3 \
+    --terminal count_single_bw \
     --bw_path RGTools/large_files/ENCFF565BWR.pl.bw \
-    --quantification_type full_track \
-    --opath ${OPATH}/pints_regions.1kb.pl.track.npy
-
-./GenomicElementTool.py count_single_bw \
-    --region_file_path ${OPATH}/pints_regions.1kb.bed3 \
-    --region_file_type bed3 \
+    --count_opath ${OPATH}/pints_regions.1kb.pl.track.npy \
     --bw_path RGTools/large_files/ENCFF775FNU.mn.bw \
-    --quantification_type full_track \
-    --opath ${OPATH}/pints_regions.1kb.mn.track.npy
+    --count_opath ${OPATH}/pints_regions.1kb.mn.track.npy \
+    --quantification_type full_track
 
 ./GenomicElementTool.py export Heatmap \
     --region_file_path ${OPATH}/pints_regions.1kb.bed3 \
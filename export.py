@@ -1,19 +1,29 @@
 
 import warnings
 import sys
+import os
+import zipfile
+import argparse
+import multiprocessing
 
 from RGTools.GenomicElements import GenomicElements
-from RGTools.ExogeneousSequences import ExogeneousSequences
 from RGTools.BedTable import BedTable6Plus
 from RGTools.SNP_utils import EnsemblRestSearch
 from RGTools.utils import str2bool
 
+from ge_utils import GEUtils
+from gebin import GEBin
+from fasta_utils import RegionSeqExtractor, ReverseComplement, FastaWriter
+
 import numpy as np
 import pandas as pd
 
 import matplotlib.pyplot as plt
 
 class GenomicElementExport:
+    # Memory-mapped heatmap tracks of the current process
+    _heatmap_track_cache = {}
+
     @staticmethod
     def set_parser(parser):
         subparsers = parser.add_subparsers(dest="oformat")
@@ -49,6 +59,11 @@ class GenomicElementExport:
                                                   )
         GenomicElementExport.set_parser_heatmap(parser_heatmap)
 
+        parser_heatmap_batch = subparsers.add_parser("HeatmapBatch", 
+                                                     help="Export heatmaps listed in a manifest in one process.",
+                                                     )
+        GenomicElementExport.set_parser_heatmap_batch(parser_heatmap_batch)
+
         parser_chrom_filtered_ge = subparsers.add_parser("ChromFilteredGE",
                                                          help="Export GenomicElements with only chromosome given.", 
                                                          )
@@ -69,6 +84,11 @@ class GenomicElementExport:
                                                 )
         GenomicElementExport.set_parser_merged_ge(parser_merged_ge)
 
+        parser_gebin = subparsers.add_parser("gebin",
+                                             help="Export regions as a binary gebin region file.",
+                                             )
+        GenomicElementExport.set_parser_gebin(parser_gebin)
+
         parser_bed6poly = subparsers.add_parser("bed6poly",
                                                 help="Export bed6 with polymorphism column from rsid names.",
                                                 )
@@ -82,8 +102,25 @@ class GenomicElementExport:
                             help="Fasta output file path.",
                             required=True,
                             )
+        GEUtils.set_parser_num_workers(parser)
+        GEUtils.set_parser_strand_aware(parser)
+        GenomicElementExport.set_parser_fasta_output(parser)
         return parser
 
+    @staticmethod
+    def set_parser_fasta_output(parser):
+        parser.add_argument("--compression",
+                            help="Compression of the fasta output. bgzip output can be indexed with samtools faidx.",
+                            type=str,
+                            default="none",
+                            choices=["none", "gzip", "bgzip"],
+                            )
+        parser.add_argument("--chunk_size",
+                            help="Number of region sequences held in memory at a time.",
+                            type=int,
+                            default=10000,
+                            )
+
     @staticmethod
     def set_parser_wtes(parser):
         GenomicElements.set_parser_genome(parser)
@@ -97,6 +134,9 @@ class GenomicElementExport:
                             help="Output path of the WTES fasta file.",
                             required=True,
                             )
+        GEUtils.set_parser_num_workers(parser)
+        GEUtils.set_parser_strand_aware(parser)
+        GenomicElementExport.set_parser_fasta_output(parser)
         return parser
 
     @staticmethod
@@ -115,16 +155,24 @@ class GenomicElementExport:
                             default=None,
                             )
         parser.add_argument("--opath",
-                            help="Output path of the allele-expanded fasta file.",
+                            help="Output path of the allele-expanded fasta file. "
+                                 "A record index is written to <opath>.index.tsv.",
                             required=True,
                             )
+        parser.add_argument("--chunk_size",
+                            help="Number of regions processed (and held in memory) at a time.",
+                            type=int,
+                            default=10000,
+                            )
+        GEUtils.set_parser_num_workers(parser)
         return parser
 
     @staticmethod
     def set_parser_count_table(parser):
         GenomicElements.set_parser_genomic_element_region(parser)
         parser.add_argument("--opath", 
-                            help="Output path of the count table.",
+                            help="Output path of the count table. The format is set by the suffix: "
+                                 ".npz, .npy, .parquet, .feather (pyarrow) or CSV otherwise.",
                             required=True,
                             )
 
@@ -141,10 +189,10 @@ class GenomicElementExport:
                             )
         
         parser.add_argument("--region_id_type", 
-                            help="Type of the region id (default, gene_symbol).",
+                            help="Type of the region id (default: chrom:start-end, name, gene_symbol).",
                             default="default",
                             type=str,
-                            choices=["default", "gene_symbol"],
+                            choices=["default", "name", "gene_symbol"],
                             )
         
         return parser
@@ -188,11 +236,51 @@ class GenomicElementExport:
                             help="Output path of the heatmap.",
                             required=True,
                             )
+
+        parser.add_argument("--image_height", 
+                            help="Number of image rows. Sorted elements are pooled into this many rows.",
+                            type=int,
+                            default=1000,
+                            )
+
+        parser.add_argument("--image_width", 
+                            help="Number of image columns. Positions are pooled into this many columns.",
+                            type=int,
+                            default=1000,
+                            )
+
+        parser.add_argument("--pooling", 
+                            help="Pooling of the elements and positions in each image pixel.",
+                            type=str,
+                            choices=["mean", "max"],
+                            default="mean",
+                            )
+
+        parser.add_argument("--chunk_size", 
+                            help="Number of elements loaded at a time.",
+                            type=int,
+                            default=10000,
+                            )
+        return parser
+
+    @staticmethod
+    def set_parser_heatmap_batch(parser):
+        parser.add_argument("--manifest", 
+                            help="Tab-separated manifest with one heatmap per row. Columns are the Heatmap "
+                                 "arguments (track_npy, title and negative comma-separated) plus an optional sort_group.",
+                            required=True,
+                            )
+
+        parser.add_argument("--num_workers", 
+                            help="If given, render the heatmaps with this many worker processes.",
+                            type=int,
+                            default=None,
+                            )
         return parser
 
     @staticmethod
     def set_parser_chrom_filtered_ge(parser):
-        GenomicElements.set_parser_genomic_element_region(parser)
+        GEUtils.set_parser_genomic_element_region(parser)
         parser.add_argument("--chrom_size", 
                             help="Chromosome size file.",
                             required=True,
@@ -201,6 +289,7 @@ class GenomicElementExport:
                             help="Output path of the filtered GenomicElements.",
                             required=True,
                             )
+        GEUtils.set_parser_chunk_size(parser)
         return parser
 
     @staticmethod
@@ -297,6 +386,19 @@ class GenomicElementExport:
                             required=True,
                             choices=["track", "stat", "mask", "array"],
                             )
+        parser.add_argument("--extra_region_file_path",
+                            help="Path to an additional region file to merge. Can be specified multiple times.",
+                            action="append",
+                            default=[],
+                            type=str,
+                            )
+        parser.add_argument("--extra_anno_path",
+                            help="Path to an annotation npy/npz file of the additional region files, "
+                                 "one per anno_name (in the order of anno_name) for each additional region file "
+                                 "(in the order of extra_region_file_path). Can be specified multiple times.",
+                            action="append",
+                            default=[],
+                            )
         parser.add_argument("--oheader",
                             help="Output header for merged files.",
                             required=True,
@@ -304,6 +406,16 @@ class GenomicElementExport:
                             )
         return parser
 
+    @staticmethod
+    def set_parser_gebin(parser):
+        GenomicElements.set_parser_genomic_element_region(parser)
+        parser.add_argument("--opath",
+                            help="Output path of the gebin region file (a directory, e.g. regions.gebin).",
+                            required=True,
+                            )
+        GEUtils.set_parser_chunk_size(parser)
+        return parser
+
     @staticmethod
     def set_parser_bed6poly(parser):
         parser.add_argument("--region_file_path",
@@ -351,13 +463,23 @@ class GenomicElementExport:
                             help="Dtype used to cast values before writing.",
                             default="str",
                             type=str,
-                            choices=["str", "np.int32", "np.int64", "np.float32", "np.float64"],
+                            choices=["str"] + list(GEUtils.get_numeric_dtype_dict().keys()),
+                            )
+        parser.add_argument("--float_format",
+                            help="If given, printf-style format of the values (e.g. %%.4g). Requires a numeric --dtype.",
+                            type=str,
+                            default=None,
+                            )
+        parser.add_argument("--chunk_size",
+                            help="Number of values formatted and written at a time.",
+                            type=int,
+                            default=1000000,
                             )
         return parser
 
     @staticmethod
     def get_oformat_options():
-        return ["stat_list", "ExogeneousSequences", "WTES", "allele_expanded_ES", "CountTable", "Heatmap", "ChromFilteredGE", "MaskedGE", "TREbed", "MergedGE", "bed6poly"]
+        return ["stat_list", "ExogeneousSequences", "WTES", "allele_expanded_ES", "CountTable", "Heatmap", "HeatmapBatch", "ChromFilteredGE", "MaskedGE", "TREbed", "MergedGE", "gebin", "bed6poly"]
 
     @staticmethod
     def export_stat_list(args):
@@ -367,23 +489,61 @@ class GenomicElementExport:
                              )
         ge.load_region_anno_from_npy("__stat_list__", args.stat_npy, anno_type="stat")
         stat_arr = ge.get_stat_arr("__stat_list__").reshape(-1,)
-        stat_arr = np.asarray(stat_arr, dtype=eval(args.dtype))
+        dtype = str if args.dtype == "str" else GEUtils.get_numeric_dtype_dict()[args.dtype]
 
-        output_handle = sys.stdout if args.opath in {"-", "stdout"} else open(args.opath, "w")
+        output_handle = sys.stdout if args.opath in {"-", "stdout"} else open(args.opath, "w", buffering=1 << 22)
         try:
-            for value in stat_arr:
-                output_handle.write(f"{value}\n")
+            for chunk_start in range(0, len(stat_arr), args.chunk_size):
+                output_handle.write(GenomicElementExport.format_stat_values(stat_arr[chunk_start:chunk_start + args.chunk_size],
+                                                                            dtype,
+                                                                            args.float_format,
+                                                                            ))
         finally:
             if output_handle is not sys.stdout:
                 output_handle.close()
 
+    @staticmethod
+    def format_stat_values(value_arr, dtype, float_format=None):
+        '''
+        Format values as lines of a list file.
+
+        Keyword arguments:
+        - value_arr: 1D array of values.
+        - dtype: Dtype the values are cast to before formatting.
+        - float_format: If given, printf-style format applied to the (numeric) values.
+
+        Returns:
+        - text: One value per line, each followed by a newline.
+        '''
+        value_arr = np.asarray(value_arr, dtype=dtype)
+        if len(value_arr) == 0:
+            return ""
+
+        if float_format is None:
+            # Same text as f"{value}" of the array items
+            value_format = {"i": "%d", "u": "%d", "f": "%r"}.get(value_arr.dtype.kind, "%s")
+        else:
+            if value_arr.dtype.kind not in "iuf":
+                raise ValueError(f"--float_format requires a numeric --dtype, got {value_arr.dtype}")
+            value_format = float_format
+
+        # One formatting call per chunk instead of one write per value
+        try:
+            return ((value_format + "\n") * len(value_arr)) % tuple(value_arr.tolist())
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid --float_format {float_format}: {e}")
+
     @staticmethod
     def export_exogeneous_sequences(args):
         ge = GenomicElements(args.region_file_path, 
                              args.region_file_type, 
                              args.fasta_path, 
                              )
-        ge.export_exogeneous_sequences(args.opath)
+        if args.num_workers is None and not args.strand_aware and args.compression == "none":
+            ge.export_exogeneous_sequences(args.opath)
+            return
+
+        GenomicElementExport.write_region_seqs_fasta(ge, args, num_replicates=None)
 
     @staticmethod
     def export_wtes(args):
@@ -394,17 +554,41 @@ class GenomicElementExport:
                              args.region_file_type,
                              args.fasta_path,
                              )
-        regions = list(ge.get_region_bed_table().iter_regions())
-        region_seqs = ge.get_all_region_seqs()
+        GenomicElementExport.write_region_seqs_fasta(ge, args, num_replicates=args.num_replicates)
 
-        seq_ids = []
-        seqs = []
-        for region, seq in zip(regions, region_seqs):
-            for ind in range(args.num_replicates):
-                seq_ids.append(f"{region['chrom']}:{region['start']}-{region['end']}_{ind}")
-                seqs.append(seq)
+    @staticmethod
+    def write_region_seqs_fasta(ge, args, num_replicates=None):
+        '''
+        Stream region sequences to a fasta file, args.chunk_size regions at a time.
 
-        ExogeneousSequences.write_sequences_to_fasta(seq_ids, seqs, args.opath)
+        Keyword arguments:
+        - ge: GenomicElements object with a genome.
+        - args: Arguments with fasta_path, num_workers, strand_aware, compression, chunk_size and opath.
+        - num_replicates: If given, write each sequence num_replicates times with ids
+            <chrom>:<start>-<end>_<replicate> (WTES). Otherwise write it once with id <chrom>:<start>-<end>.
+        '''
+        region_df = ge.get_region_bed_table().to_dataframe()
+        if args.strand_aware:
+            minus_logical = GEUtils.get_minus_strand_mask(region_df)
+        compression = None if args.compression == "none" else args.compression
+
+        with RegionSeqExtractor(ge, args.fasta_path, args.num_workers) as seq_extractor, \
+             FastaWriter(args.opath, compression) as writer:
+            for chunk_start, chunk_df, seqs in seq_extractor.iter_region_seq_chunks(region_df, args.chunk_size):
+                if args.strand_aware:
+                    seqs = ReverseComplement.reverse_complement_seqs(
+                        seqs, minus_logical[chunk_start:chunk_start + len(chunk_df)]
+                    )
+
+                region_ids = GEUtils.get_coord_ids(chunk_df["chrom"], chunk_df["start"], chunk_df["end"])
+                if num_replicates is None:
+                    writer.write_records(region_ids.tolist(), seqs)
+                    continue
+
+                replicate_ids = np.char.add(np.repeat(region_ids, num_replicates),
+                                            np.tile([f"_{ind}" for ind in range(num_replicates)], len(region_ids)),
+                                            )
+                writer.write_records(replicate_ids.tolist(), [seq for seq in seqs for _ in range(num_replicates)])
 
     @staticmethod
     def export_allele_expanded_es(args):
@@ -419,67 +603,150 @@ class GenomicElementExport:
                                          )
         polymorphisms_bt.load_from_file(args.inpath_polymorphisms)
 
-        output_seq_ids = []
-        output_sequences = []
-        for region in ge.get_region_bed_table().iter_regions():
-            overlapping_snp_bt = polymorphisms_bt.region_subset(region["chrom"],
-                                                                region["start"],
-                                                                region["end"],
-                                                                )
-            if len(overlapping_snp_bt) == 0:
-                continue
+        region_df = ge.get_region_bed_table().to_dataframe()
+        snp_df = polymorphisms_bt.to_dataframe()
+        pair_region_idx_arr, pair_snp_idx_arr = GEUtils.get_overlap_pairs(region_df, snp_df)
 
-            ref_sequence = ge.get_region_seq(region["chrom"], region["start"], region["end"])
-            if ref_sequence is None:
-                raise ValueError(
-                    f"Chromosome {region['chrom']} not found in genome file. "
-                    f"Cannot export region {region['chrom']}:{region['start']}-{region['end']}"
-                )
+        snp_region_idx_arr, pair_offset_arr = np.unique(pair_region_idx_arr, return_index=True)
+        pair_offset_arr = np.append(pair_offset_arr, len(pair_region_idx_arr))
 
-            output_seq_ids.append(f"{region['chrom']}_{region['start']}_{region['end']}_ref")
-            output_sequences.append(ref_sequence)
+        snp_start_arr = snp_df["start"].to_numpy().astype(np.int64)
+        # Upper-cased single-base alleles of each polymorphism, in file order
+        snp_alleles_list = [[b for b in (base.strip() for base in bases.split("/")) if len(b) == 1]
+                            for bases in snp_df["bases"].astype(str).str.upper()]
 
-            for snp in overlapping_snp_bt.iter_regions():
-                index2mut = snp["start"] - region["start"]
-                if index2mut < 0 or index2mut >= len(ref_sequence):
-                    continue
-                ref_base = ref_sequence[index2mut].upper()
+        region_header_arr = GEUtils.get_coord_ids(region_df["chrom"].to_numpy()[snp_region_idx_arr],
+                                                  region_df["start"].to_numpy()[snp_region_idx_arr],
+                                                  region_df["end"].to_numpy()[snp_region_idx_arr],
+                                                  chrom_sep="_",
+                                                  range_sep="_",
+                                                  )
 
-                for base in str(snp["bases"]).split("/"):
-                    mutated_base = base.upper().strip()
-                    if len(mutated_base) != 1:
-                        continue
-                    if mutated_base == ref_base:
-                        continue
+        # Contiguous blocks of regions with polymorphisms, in region file order
+        task_list = []
+        for block_start in range(0, len(snp_region_idx_arr), args.chunk_size):
+            block_region_idx_arr = snp_region_idx_arr[block_start:block_start + args.chunk_size]
+            block_pair_offset_arr = pair_offset_arr[block_start:block_start + len(block_region_idx_arr) + 1]
+            block_pair_snp_idx_arr = pair_snp_idx_arr[block_pair_offset_arr[0]:block_pair_offset_arr[-1]]
+            task_list.append({"region_idx": block_region_idx_arr,
+                              "chrom": region_df["chrom"].to_numpy()[block_region_idx_arr],
+                              "start": region_df["start"].to_numpy()[block_region_idx_arr],
+                              "end": region_df["end"].to_numpy()[block_region_idx_arr],
+                              "header": region_header_arr[block_start:block_start + len(block_region_idx_arr)],
+                              "pair_offset": block_pair_offset_arr - block_pair_offset_arr[0],
+                              "snp_start": snp_start_arr[block_pair_snp_idx_arr],
+                              "snp_alleles": [snp_alleles_list[i] for i in block_pair_snp_idx_arr],
+                              })
+
+        index_opath = args.opath + ".index.tsv"
+        GenomicElementExport.get_allele_expanded_index_df([]).to_csv(index_opath, sep="\t", index=False)
+
+        with RegionSeqExtractor(ge, args.fasta_path, args.num_workers) as seq_extractor, \
+             FastaWriter(args.opath) as writer:
+            if args.num_workers is None:
+                block_record_iter = (GenomicElementExport.get_allele_expanded_records(
+                                         task,
+                                         seq_extractor.get_region_seqs(pd.DataFrame({"chrom": task["chrom"],
+                                                                                     "start": task["start"],
+                                                                                     "end": task["end"],
+                                                                                     })),
+                                     ) for task in task_list)
+            else:
+                block_record_iter = seq_extractor.imap(GenomicElementExport._allele_expanded_block_worker, task_list)
 
-                    mutated_seq = ref_sequence[:index2mut] + mutated_base + ref_sequence[index2mut+1:]
-                    output_seq_ids.append(
-                        f"{region['chrom']}_{region['start']}_{region['end']}_{snp['start']}:{ref_base}2{mutated_base}"
-                    )
-                    output_sequences.append(mutated_seq)
+            num_records = 0
+            byte_offset = 0
+            for seq_ids, seqs, index_records in block_record_iter:
+                writer.write_records(seq_ids, seqs)
+
+                record_len_arr = np.array([len(seq_id) + len(seq) + 3 for seq_id, seq in zip(seq_ids, seqs)],
+                                          dtype=np.int64,
+                                          )
+                index_df = GenomicElementExport.get_allele_expanded_index_df(index_records)
+                index_df["record_index"] = num_records + np.arange(len(seq_ids))
+                index_df["byte_offset"] = byte_offset + np.cumsum(record_len_arr) - record_len_arr
+                index_df.to_csv(index_opath, sep="\t", index=False, header=False, mode="a")
 
-        ExogeneousSequences.write_sequences_to_fasta(output_seq_ids, output_sequences, args.opath)
+                num_records += len(seq_ids)
+                byte_offset += int(record_len_arr.sum())
+
+        # The FASTA file is flushed on close, after the last index rows; the index must not look older than it
+        os.utime(index_opath)
+
+    @staticmethod
+    def get_allele_expanded_index_df(index_records):
+        '''
+        Index table of allele_expanded_ES records. Reference records have snp_pos -1
+        and ref_base/alt_base ".".
+        '''
+        index_df = pd.DataFrame(index_records,
+                                columns=["region_index", "chrom", "start", "end", "snp_pos", "ref_base", "alt_base"],
+                                )
+        index_df.insert(0, "byte_offset", np.zeros(len(index_df), dtype=np.int64))
+        index_df.insert(0, "record_index", np.zeros(len(index_df), dtype=np.int64))
+
+        return index_df
+
+    @staticmethod
+    def _allele_expanded_block_worker(task):
+        ref_sequences = RegionSeqExtractor.get_worker_region_seqs(task["chrom"], task["start"], task["end"])
+        return GenomicElementExport.get_allele_expanded_records(task, ref_sequences)
 
     @staticmethod
-    def region2region_id(region, region_id_type):
+    def get_allele_expanded_records(task, ref_sequences):
         '''
-        Return the region id.
+        Generate the allele_expanded_ES records of a block of regions.
 
         Keyword arguments:
-        - region: Region object.
-        - region_id_type: Type of the region id (default, gene_symbol).
+        - task: Dictionary of the block with region_idx, chrom, start, end, header (per region),
+            pair_offset (per region + 1) and snp_start, snp_alleles (per overlapping polymorphism).
+        - ref_sequences: Reference sequences of the regions.
 
         Returns:
-        - region_id: Region id.
-        '''
-        if region_id_type == "default":
-            return region["chrom"] + ":" + str(region["start"]) + "-" + str(region["end"])
-        elif region_id_type == "gene_symbol":
-            if "gene_symbol" not in region.get_fields():
-                raise ValueError(f"gene_symbol not supported for this region file type.")
-            return region["gene_symbol"]
-        else:
-            raise ValueError(f"Invalid region id type: {region_id_type}")
+        - seq_ids: FASTA ids.
+        - seqs: Sequences.
+        - index_records: List of (region_index, chrom, start, end, snp_pos, ref_base, alt_base) per record.
+        '''
+        seq_ids = []
+        seqs = []
+        index_records = []
+        for i, ref_sequence in enumerate(ref_sequences):
+            region_index = int(task["region_idx"][i])
+            region_chrom = task["chrom"][i]
+            region_start = int(task["start"][i])
+            region_end = int(task["end"][i])
+            if ref_sequence is None:
+                raise ValueError(
+                    f"Chromosome {region_chrom} not found in genome file. "
+                    f"Cannot export region {region_chrom}:{region_start}-{region_end}"
+                )
+            region_header = task["header"][i]
+
+            seq_ids.append(f"{region_header}_ref")
+            seqs.append(ref_sequence)
+            index_records.append((region_index, region_chrom, region_start, region_end, -1, ".", "."))
+
+            seq_buffer = bytearray(ref_sequence.encode("ascii"))
+            for pair_idx in range(task["pair_offset"][i], task["pair_offset"][i + 1]):
+                snp_start = int(task["snp_start"][pair_idx])
+                index2mut = snp_start - region_start
+                if index2mut < 0 or index2mut >= len(seq_buffer):
+                    continue
+                ref_byte = seq_buffer[index2mut]
+                ref_base = chr(ref_byte).upper()
+
+                for mutated_base in task["snp_alleles"][pair_idx]:
+                    if mutated_base == ref_base:
+                        continue
+
+                    seq_buffer[index2mut] = ord(mutated_base)
+                    seq_ids.append(f"{region_header}_{snp_start}:{ref_base}2{mutated_base}")
+                    seqs.append(seq_buffer.decode("ascii"))
+                    index_records.append((region_index, region_chrom, region_start, region_end,
+                                          snp_start, ref_base, mutated_base))
+                seq_buffer[index2mut] = ref_byte
+
+        return seq_ids, seqs, index_records
 
     @staticmethod
     def export_count_table(args):
@@ -491,12 +758,15 @@ class GenomicElementExport:
                              None, 
                              )
 
+        table_format = GenomicElementExport.get_count_table_format(args.opath)
+        if table_format != "csv":
+            GenomicElementExport.write_binary_count_table(ge, args, table_format)
+            return
+
         for sample_name, stat_npy in zip(args.sample_name, args.stat_npy):
             ge.load_region_anno_from_npy(sample_name, stat_npy, anno_type="stat")
         
-        region_names = []
-        for region in ge.get_region_bed_table().iter_regions():
-            region_names.append(GenomicElementExport.region2region_id(region, args.region_id_type))
+        region_names = GEUtils.get_region_ids(ge.get_region_bed_table().to_dataframe(), args.region_id_type)
 
         output_df = pd.DataFrame(columns=args.sample_name, 
                                  index=region_names,
@@ -510,17 +780,98 @@ class GenomicElementExport:
                          )
 
     @staticmethod
-    def get_heatmap_vmin_vmax(track_arr, per_track_max_percentile, 
-                              vmax_percentile):
+    def get_count_table_format(opath):
+        '''
+        Get the CountTable output format from the output path suffix. Paths without a binary suffix are CSV.
+        '''
+        for suffix, table_format in [(".npz", "npz"), (".npy", "npy"), (".parquet", "parquet"), (".feather", "feather")]:
+            if opath.endswith(suffix):
+                return table_format
+        return "csv"
+
+    @staticmethod
+    def write_binary_count_table(ge, args, table_format, chunk_size=1000000):
+        '''
+        Write a CountTable in a binary format, one sample column at a time. Stat files are
+        memory-mapped, so the table is never held in memory.
+
+        - npz: compressed npz with the (num_regions, num_samples) "counts" matrix and the
+            "region_ids" and "sample_names" labels.
+        - npy: (num_regions, num_samples) npy matrix plus <opath without .npy>.labels.npz with the labels.
+        - parquet/feather: region_id column followed by one column per sample. Requires pyarrow.
+            Written in record batches of chunk_size regions (one parquet row group per batch).
+        '''
+        num_regions = ge.get_num_regions()
+        stat_arr_list = []
+        for stat_npy in args.stat_npy:
+            stat_arr = GEUtils.load_anno_arr(stat_npy, mmap_mode="r")
+            if stat_arr.shape not in [(num_regions,), (num_regions, 1)]:
+                raise ValueError(f"Stat array shape {stat_arr.shape} in {stat_npy} does not match "
+                                 f"the number of regions {num_regions}")
+            stat_arr_list.append(stat_arr.reshape(-1,))
+
+        region_ids = GEUtils.get_region_ids(ge.get_region_bed_table().to_dataframe(), args.region_id_type)
+        sample_names = np.array(args.sample_name, dtype=str)
+        dtype = np.result_type(*[stat_arr.dtype for stat_arr in stat_arr_list])
+        shape = (num_regions, len(stat_arr_list))
+
+        if table_format == "npy":
+            # Fortran order keeps each sample column contiguous on disk
+            output_arr = np.lib.format.open_memmap(args.opath, mode="w+", dtype=dtype, shape=shape, fortran_order=True)
+            for i, stat_arr in enumerate(stat_arr_list):
+                output_arr[:, i] = stat_arr
+            output_arr.flush()
+            del output_arr
+            np.savez(args.opath[:-len(".npy")] + ".labels.npz", region_ids=region_ids, sample_names=sample_names)
+
+        elif table_format == "npz":
+            with zipfile.ZipFile(args.opath, mode="w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+                with zf.open("counts.npy", mode="w", force_zip64=True) as handle:
+                    np.lib.format.write_array_header_2_0(handle, {"descr": np.lib.format.dtype_to_descr(dtype),
+                                                                  "fortran_order": True,
+                                                                  "shape": shape,
+                                                                  })
+                    for stat_arr in stat_arr_list:
+                        handle.write(np.ascontiguousarray(stat_arr, dtype=dtype).tobytes())
+                for name, label_arr in [("region_ids", region_ids), ("sample_names", sample_names)]:
+                    with zf.open(name + ".npy", mode="w", force_zip64=True) as handle:
+                        np.lib.format.write_array(handle, label_arr, allow_pickle=False)
+
+        elif table_format in ["parquet", "feather"]:
+            try:
+                import pyarrow as pa
+                import pyarrow.ipc
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError(f"pyarrow is required for {table_format} CountTable output.")
+
+            schema = pa.schema([("region_id", pa.string())] + [(name, pa.from_numpy_dtype(dtype)) for name in args.sample_name])
+            # Feather V2 is the Arrow IPC file format
+            if table_format == "parquet":
+                writer = pyarrow.parquet.ParquetWriter(args.opath, schema)
+            else:
+                writer = pyarrow.ipc.new_file(args.opath, schema)
+
+            with writer:
+                for chunk_start in range(0, num_regions, chunk_size):
+                    chunk_end = min(chunk_start + chunk_size, num_regions)
+                    batch = pa.record_batch([pa.array(region_ids[chunk_start:chunk_end])] + 
+                                            [pa.array(np.asarray(stat_arr[chunk_start:chunk_end], dtype=dtype)) for stat_arr in stat_arr_list], 
+                                            schema=schema, 
+                                            )
+                    writer.write_batch(batch)
+
+        else:
+            raise ValueError(f"Invalid CountTable format: {table_format}")
+
+    @staticmethod
+    def get_heatmap_vmin_vmax(track_max_arr, vmax_percentile):
         '''
         Get the vmin and vmax for the heatmap.
-        This function first determines the maximum value per track, 
-        then determines the vmax based on percentile of the determined 
-        maximum values.
+        The vmax is the vmax_percentile percentile of the maximum values per track.
 
         Keyword arguments:
-        - track_arr: Track array. Must be positive.
-        - per_track_max_percentile: Percentile used to determine the maximum value per track.
+        - track_max_arr: Maximum value per track (see get_heatmap_track_stats).
         - vmax_percentile: Percentile used to determine the vmax.
 
         Returns:
@@ -528,8 +879,7 @@ class GenomicElementExport:
         - vmax: Vmax.
         '''
         vmin=0
-        top_1p_signal_per_track = np.percentile(track_arr, per_track_max_percentile, axis=1)
-        vmax = np.percentile(top_1p_signal_per_track, vmax_percentile)
+        vmax = np.percentile(track_max_arr, vmax_percentile)
 
         if vmax==0: 
             vmax = 1
@@ -537,38 +887,99 @@ class GenomicElementExport:
         return vmin, vmax
 
     @staticmethod
-    def track_list_to_arr(track_list):
-        max_len = max(len(track) for track in track_list) if len(track_list) > 0 else 0
-        track_arr = np.zeros((len(track_list), max_len))
-        for i, track in enumerate(track_list):
-            track_arr[i, :len(track)] = track
-        return track_arr
+    def get_heatmap_track_stats(track_arr, per_track_max_percentile, chunk_size=10000):
+        '''
+        Get the statistics of the absolute track values needed for a heatmap, chunk_size tracks at a time.
+
+        Keyword arguments:
+        - track_arr: (N, L) track array, may be memory-mapped.
+        - per_track_max_percentile: Percentile used to determine the maximum value per track.
+        - chunk_size: Number of tracks loaded at a time.
+
+        Returns:
+        - row_max_arr: Maximum of each track.
+        - track_max_arr: per_track_max_percentile percentile of each track.
+        - mean_arr: Mean signal of each position.
+        '''
+        num_tracks, track_len = track_arr.shape
+        row_max_arr = np.zeros(num_tracks, dtype=np.float64)
+        track_max_arr = np.zeros(num_tracks, dtype=np.float64)
+        sum_arr = np.zeros(track_len, dtype=np.float64)
+        if track_len == 0:
+            return row_max_arr, track_max_arr, sum_arr
+
+        for chunk_start in range(0, num_tracks, chunk_size):
+            chunk_arr = np.abs(np.asarray(track_arr[chunk_start:chunk_start + chunk_size], dtype=np.float64))
+            row_max_arr[chunk_start:chunk_start + len(chunk_arr)] = chunk_arr.max(axis=1)
+            track_max_arr[chunk_start:chunk_start + len(chunk_arr)] = GEUtils.get_row_percentile(chunk_arr, per_track_max_percentile)
+            sum_arr += chunk_arr.sum(axis=0)
+
+        return row_max_arr, track_max_arr, sum_arr / max(num_tracks, 1)
+
+    @staticmethod
+    def get_heatmap_image(track_arr, row_bin_arr, num_row_bins, num_col_bins, pooling="mean", chunk_size=10000):
+        '''
+        Pool the absolute track values into a (num_row_bins, num_col_bins) image, chunk_size tracks at a time.
+
+        Keyword arguments:
+        - track_arr: (N, L) track array, may be memory-mapped.
+        - row_bin_arr: Image row of each track.
+        - num_row_bins: Number of image rows.
+        - num_col_bins: Number of image columns. Positions are split into contiguous, near-equal bins.
+        - pooling: mean or max.
+        - chunk_size: Number of tracks loaded at a time.
+
+        Returns:
+        - image_arr: Pooled image.
+        '''
+        if pooling not in ["mean", "max"]:
+            raise ValueError(f"Invalid pooling: {pooling}")
+
+        num_tracks, track_len = track_arr.shape
+        image_arr = np.zeros((num_row_bins, num_col_bins), dtype=np.float64)
+        if num_tracks == 0 or track_len == 0:
+            return image_arr
+
+        col_bin_arr = np.arange(track_len) * num_col_bins // track_len
+        col_start_arr = np.flatnonzero(np.diff(col_bin_arr, prepend=-1))
+        reduce_func = np.add if pooling == "mean" else np.maximum
+
+        for chunk_start in range(0, num_tracks, chunk_size):
+            chunk_arr = np.abs(np.asarray(track_arr[chunk_start:chunk_start + chunk_size], dtype=np.float64))
+            chunk_arr = reduce_func.reduceat(chunk_arr, col_start_arr, axis=1)
+
+            # Pool the tracks of each image row present in the chunk
+            chunk_row_bin_arr = row_bin_arr[chunk_start:chunk_start + len(chunk_arr)]
+            chunk_order = np.argsort(chunk_row_bin_arr, kind="stable")
+            sorted_row_bin_arr = chunk_row_bin_arr[chunk_order]
+            row_start_arr = np.flatnonzero(np.diff(sorted_row_bin_arr, prepend=-1))
+            row_bins = sorted_row_bin_arr[row_start_arr]
+            chunk_image_arr = reduce_func.reduceat(chunk_arr[chunk_order], row_start_arr, axis=0)
+            image_arr[row_bins] = reduce_func(image_arr[row_bins], chunk_image_arr)
+
+        if pooling == "mean":
+            image_arr /= np.bincount(row_bin_arr, minlength=num_row_bins)[:, None]
+            image_arr /= np.bincount(col_bin_arr, minlength=num_col_bins)[None, :]
+
+        return image_arr
 
     @staticmethod
-    def plot_heatmap_image(ax, track_arr, sort_idx, plot_cmap, 
-                           title, per_track_max_percentile, 
-                           vmax_percentile):
+    def plot_heatmap_image(ax, image_arr, plot_cmap, title, vmin, vmax):
         '''
-        Plot a heatmap with imshow.
+        Plot a heatmap image with imshow.
 
         Keyword arguments:
         - ax: Axes object.
-        - track_arr: Track array. Must be positive.
-        - sort_idx: Sort index.
+        - image_arr: Heatmap image, rows in plotting order. Must be positive.
         - plot_cmap: Plot cmap.
         - title: Title.
-        - per_track_max_percentile: Percentile used to determine the maximum value per track.
-        - vmax_percentile: Percentile used to determine the vmax.
+        - vmin: Vmin.
+        - vmax: Vmax.
 
         Returns:
         - imshow_pos: Imshow position.
         '''
-        vmin, vmax = GenomicElementExport.get_heatmap_vmin_vmax(track_arr, 
-                                                                per_track_max_percentile, 
-                                                                vmax_percentile, 
-                                                                )
-
-        imshow_pos = ax.imshow(track_arr[sort_idx, :], 
+        imshow_pos = ax.imshow(image_arr, 
                                cmap=plot_cmap,
                                aspect="auto",
                                vmin=vmin,
@@ -582,13 +993,13 @@ class GenomicElementExport:
         return imshow_pos
 
     @staticmethod
-    def plot_heatmap_mean(ax, track_arr, negative_sig):
+    def plot_heatmap_mean(ax, mean_arr, negative_sig):
         '''
         Plot the mean signal.
         '''
-        width = track_arr.shape[1]
+        width = len(mean_arr)
         ax.plot(np.arange(width), 
-                - track_arr.mean(axis=0) if negative_sig else track_arr.mean(axis=0),
+                - mean_arr if negative_sig else mean_arr,
                 color="black",
                 )
         ax.set_ylabel("Mean signal")
@@ -597,23 +1008,81 @@ class GenomicElementExport:
         ax.set_xticklabels([-width//2, 0, width//2])
 
     @staticmethod
-    def export_heatmap(args):
+    def load_heatmap_track_arr(track_npy, num_regions, max_region_len):
+        '''
+        Memory-map a heatmap track file, zero-padded to the longest region. Each file is
+        only opened once per process and shared by all heatmaps using it.
+
+        Returns:
+        - track_arr: (num_regions, max_region_len) memory-mapped track array.
+        '''
+        # Keyed by modification time and size too, so rewritten files are reloaded
+        track_stat = os.stat(track_npy)
+        cache_key = (track_npy, track_stat.st_mtime_ns, track_stat.st_size)
+        if cache_key not in GenomicElementExport._heatmap_track_cache:
+            GenomicElementExport._heatmap_track_cache[cache_key] = GEUtils.load_anno_arr(track_npy, mmap_mode="r")
+        track_arr = GenomicElementExport._heatmap_track_cache[cache_key]
+
+        if track_arr.ndim != 2 or track_arr.shape[0] != num_regions:
+            raise ValueError(f"Track array shape {track_arr.shape} in {track_npy} does not match "
+                             f"the number of regions {num_regions}")
+
+        return track_arr[:, :max_region_len]
+
+    @staticmethod
+    def load_heatmap_tracks(args):
+        '''
+        Load the regions and the memory-mapped tracks of a heatmap.
+
+        Returns:
+        - num_regions: Number of regions.
+        - track_arr_list: List of (num_regions, max_region_len) track arrays.
+        '''
+        ge = GenomicElements(args.region_file_path, 
+                             args.region_file_type, 
+                             None, 
+                             )
+        region_df = ge.get_region_bed_table().to_dataframe()
+        num_regions = len(region_df)
+        if num_regions == 0:
+            raise ValueError(f"No regions in {args.region_file_path}")
+        max_region_len = int((region_df["end"] - region_df["start"]).max())
+
+        track_arr_list = [GenomicElementExport.load_heatmap_track_arr(track_npy, num_regions, max_region_len)
+                          for track_npy in args.track_npy]
+
+        return num_regions, track_arr_list
+
+    @staticmethod
+    def export_heatmap(args, sort_idx=None, track_stats_list=None):
+        '''
+        Export a heatmap.
+
+        Keyword arguments:
+        - args: Heatmap arguments.
+        - sort_idx: If given, plotting order of the regions. Otherwise regions are sorted by
+            their maximum signal across all tracks.
+        - track_stats_list: If given, get_heatmap_track_stats of each track, so the tracks
+            are not scanned for them again.
+        '''
         if len(args.title) != len(args.track_npy):
             raise ValueError(f"Number of titles ({len(args.title)}) must match number of track_npy files ({len(args.track_npy)})")
         if len(args.title) != len(args.negative):
             raise ValueError(f"Number of titles ({len(args.title)}) must match number of negative flags ({len(args.negative)})")
         
-        ge = GenomicElements(args.region_file_path, 
-                             args.region_file_type, 
-                             None, 
-                             )
-        for track_title, track_npy in zip(args.title, args.track_npy):
-            ge.load_region_anno_from_npy(track_title, track_npy, anno_type="track")
+        num_regions, track_arr_list = GenomicElementExport.load_heatmap_tracks(args)
+
+        if track_stats_list is None:
+            track_stats_list = GenomicElementExport.get_heatmap_track_stats_list(args, track_arr_list)
 
-        track_arr_list = [
-            np.abs(GenomicElementExport.track_list_to_arr(ge.get_track_list(track_title)))
-            for track_title in args.title
-        ]
+        # Figure out sorting
+        if sort_idx is None:
+            sort_idx = GenomicElementExport.get_heatmap_sort_idx(track_stats_list)
+        elif len(sort_idx) != num_regions:
+            raise ValueError(f"Sort order length {len(sort_idx)} does not match the number of regions {num_regions}")
+        num_row_bins = min(num_regions, args.image_height)
+        row_bin_arr = np.empty(num_regions, dtype=np.int64)
+        row_bin_arr[sort_idx] = np.arange(num_regions) * num_row_bins // num_regions
 
         fig, ax = plt.subplots(2, len(args.title), 
                                figsize=(4 * len(args.title), 8),
@@ -621,53 +1090,178 @@ class GenomicElementExport:
                                squeeze=False,
                                )
 
-        # Figure out sorting
-        sort_idx = np.argsort(np.concatenate(track_arr_list, axis=1).max(axis=1))
-
         for ind, track_title in enumerate(args.title):
-            track_arr = np.abs(GenomicElementExport.track_list_to_arr(ge.get_track_list(track_title)))
+            track_arr = track_arr_list[ind]
+            _, track_max_arr, mean_arr = track_stats_list[ind]
 
             if args.negative[ind]:
                 plot_cmap = "Blues"
             else:
                 plot_cmap = "Reds"
 
+            image_arr = GenomicElementExport.get_heatmap_image(track_arr, 
+                                                               row_bin_arr, 
+                                                               num_row_bins, 
+                                                               min(track_arr.shape[1], args.image_width), 
+                                                               args.pooling, 
+                                                               args.chunk_size,
+                                                               )
+            vmin, vmax = GenomicElementExport.get_heatmap_vmin_vmax(track_max_arr, args.vmax_percentile)
             imshow_pos = GenomicElementExport.plot_heatmap_image(ax[0, ind], 
-                                                                 track_arr, 
-                                                                 sort_idx, 
+                                                                 image_arr, 
                                                                  plot_cmap, 
                                                                  track_title,
-                                                                 args.per_track_max_percentile, 
-                                                                 args.vmax_percentile,
+                                                                 vmin, 
+                                                                 vmax,
                                                                  )
 
             GenomicElementExport.plot_heatmap_mean(ax[1, ind], 
-                                                   track_arr, 
+                                                   mean_arr, 
                                                    args.negative[ind],
                                                    )
 
         fig.tight_layout()
         fig.savefig(args.opath)
+        plt.close(fig)
+
+    @staticmethod
+    def get_heatmap_track_stats_list(args, track_arr_list):
+        '''
+        get_heatmap_track_stats of each track of a heatmap, one chunked pass per track.
+        '''
+        return [GenomicElementExport.get_heatmap_track_stats(track_arr, 
+                                                             args.per_track_max_percentile, 
+                                                             args.chunk_size,
+                                                             )
+                for track_arr in track_arr_list]
+
+    @staticmethod
+    def get_heatmap_sort_idx(track_stats_list):
+        '''
+        Default plotting order of a heatmap: regions sorted by their maximum signal across all tracks.
+
+        Keyword arguments:
+        - track_stats_list: get_heatmap_track_stats of each track of the heatmap.
+        '''
+        return np.argsort(np.max([track_stats[0] for track_stats in track_stats_list], axis=0))
+
+    @staticmethod
+    def read_heatmap_manifest(manifest_path):
+        '''
+        Read a HeatmapBatch manifest. Each row is parsed with the Heatmap parser, so missing
+        optional columns take the Heatmap defaults.
+
+        Returns:
+        - heatmap_args_list: List of Heatmap arguments, one per row.
+        - sort_group_list: Sort group of each row (None if not given).
+        '''
+        heatmap_parser = argparse.ArgumentParser(prog="HeatmapBatch manifest row")
+        GenomicElementExport.set_parser_heatmap(heatmap_parser)
+        list_columns = ["track_npy", "title", "negative"]
+
+        manifest_df = pd.read_csv(manifest_path, sep="\t", dtype=str, keep_default_na=False, comment="#")
+
+        heatmap_args_list = []
+        sort_group_list = []
+        for _, row in manifest_df.iterrows():
+            argv = []
+            for column in manifest_df.columns:
+                if column == "sort_group" or row[column] == "":
+                    continue
+                values = row[column].split(",") if column in list_columns else [row[column]]
+                for value in values:
+                    argv += [f"--{column}", value.strip()]
+            heatmap_args, unknown_argv = heatmap_parser.parse_known_args(argv)
+            if len(unknown_argv) > 0:
+                raise ValueError(f"Invalid columns in manifest {manifest_path}: {unknown_argv[0][2:]}")
+            heatmap_args_list.append(heatmap_args)
+            sort_group_list.append(row["sort_group"] if row.get("sort_group", "") != "" else None)
+
+        return heatmap_args_list, sort_group_list
+
+    @staticmethod
+    def _init_heatmap_worker():
+        plt.switch_backend("Agg")
+
+    @staticmethod
+    def _export_heatmap_task(task):
+        heatmap_args, sort_idx, track_stats_list = task
+        GenomicElementExport.export_heatmap(heatmap_args, sort_idx, track_stats_list)
+        return heatmap_args.opath
+
+    @staticmethod
+    def export_heatmap_batch(args):
+        '''
+        Export all heatmaps of a manifest. Track files are memory-mapped once per process,
+        heatmaps sharing a sort_group use the plotting order of the first heatmap of the
+        group, and heatmaps are rendered in worker processes if num_workers is given. The
+        Agg backend is only set in the worker processes; the backend of the calling process
+        is left unchanged.
+
+        The track statistics of the first heatmap of a sort group are computed once, for
+        its plotting order, and passed on to its export.
+        '''
+        heatmap_args_list, sort_group_list = GenomicElementExport.read_heatmap_manifest(args.manifest)
+
+        sort_idx_dict = {}
+        task_list = []
+        for heatmap_args, sort_group in zip(heatmap_args_list, sort_group_list):
+            if sort_group is None:
+                task_list.append((heatmap_args, None, None))
+                continue
+            if sort_group in sort_idx_dict:
+                task_list.append((heatmap_args, sort_idx_dict[sort_group], None))
+                continue
+
+            _, track_arr_list = GenomicElementExport.load_heatmap_tracks(heatmap_args)
+            track_stats_list = GenomicElementExport.get_heatmap_track_stats_list(heatmap_args, track_arr_list)
+            sort_idx_dict[sort_group] = GenomicElementExport.get_heatmap_sort_idx(track_stats_list)
+            task_list.append((heatmap_args, sort_idx_dict[sort_group], track_stats_list))
+
+        if args.num_workers is None:
+            for task in task_list:
+                GenomicElementExport._export_heatmap_task(task)
+            return
+
+        with multiprocessing.Pool(args.num_workers, initializer=GenomicElementExport._init_heatmap_worker) as pool:
+            for _ in pool.imap(GenomicElementExport._export_heatmap_task, task_list):
+                pass
 
     @staticmethod
     def export_chrom_filtered_ge(args):
+        if args.chunk_size is not None or args.region_file_type == "gebin":
+            chrom_names = GEUtils.load_chrom_size_chroms(args.chrom_size)
+            chunk_size = args.chunk_size
+            if chunk_size is None:
+                chunk_size = max(GEBin(args.region_file_path).get_num_regions(), 1)
+
+            GEUtils.stream_region_transform(args.region_file_path, 
+                                            args.region_file_type, 
+                                            args.opath, 
+                                            chunk_size, 
+                                            lambda region_df, chunk_offset: region_df.loc[
+                                                GEUtils.get_chrom_filter_logical(region_df["chrom"], chrom_names)
+                                            ], 
+                                            )
+            return
+
         ge = GenomicElements(args.region_file_path, 
                              args.region_file_type, 
                              None, 
                              )
-        chrom_size_df = pd.read_csv(args.chrom_size, 
-                                    sep="\t", 
-                                    header=None, 
-                                    names=["chrom", "size"], 
-                                    )
-        chrom_size_dict = dict(zip(chrom_size_df["chrom"], chrom_size_df["size"]))
-
-        filter_logical = [c in chrom_size_dict.keys() for c in ge.get_region_bed_table().get_chrom_names()]
-        output_bt = ge.get_region_bed_table().apply_logical_filter(filter_logical)
+        region_bt = ge.get_region_bed_table()
+        filter_logical = GEUtils.get_chrom_filter_logical(region_bt.to_dataframe()["chrom"], 
+                                                          GEUtils.load_chrom_size_chroms(args.chrom_size), 
+                                                          )
+        output_bt = region_bt.apply_logical_filter(filter_logical)
         output_bt.write(args.opath)
 
     @staticmethod
     def export_masked_ge(args):
+        '''
+        Export the regions selected by a mask and the matching rows of their annotations. 
+        Annotations are streamed from memory-mapped inputs into memory-mapped outputs.
+        '''
         if len(args.anno_name) != len(args.anno_npy):
             raise ValueError(
                 f"Number of anno_name ({len(args.anno_name)}) must match "
@@ -685,16 +1279,59 @@ class GenomicElementExport:
                              args.region_file_type,
                              None,
                              )
-        ge.load_region_anno_from_npy("__mask__", args.mask_npy, anno_type="mask")
-        mask_arr = ge.get_mask_arr("__mask__").reshape(-1,)
+        region_bt = ge.get_region_bed_table()
+        mask_arr = GEUtils.load_anno_arr(args.mask_npy, mmap_mode="r").reshape(-1,).astype(bool)
+        if len(mask_arr) != len(region_bt):
+            raise ValueError(f"Number of mask values ({len(mask_arr)}) does not match "
+                             f"number of regions ({len(region_bt)})")
+
+        # Checked before writing so that a mismatch does not leave partial outputs
+        for anno_npy in args.anno_npy:
+            anno_shape = GEUtils.load_anno_arr(anno_npy, mmap_mode="r").shape
+            if len(anno_shape) == 0 or anno_shape[0] != len(mask_arr):
+                raise ValueError(f"Annotation array shape {anno_shape} in {anno_npy} does not match "
+                                 f"the number of regions {len(mask_arr)}")
 
-        for anno_name, anno_npy, anno_type in zip(args.anno_name, args.anno_npy, args.anno_type):
-            ge.load_region_anno_from_npy(anno_name, anno_npy, anno_type=anno_type)
+        region_bt.apply_logical_filter(mask_arr).write(args.opath)
+
+        for anno_name, anno_npy in zip(args.anno_name, args.anno_npy):
+            GEUtils.filter_anno_npy(anno_npy, mask_arr, f"{args.anno_oheader}.{anno_name}.npy")
+
+    @staticmethod
+    def get_trebed_df(region_df, pl_track_arr, mn_track_arr):
+        '''
+        Build the TREbed table of all regions from padded signal tracks.
 
-        result_ge = ge.apply_logical_filter(mask_arr, args.opath)
+        Keyword arguments:
+        - region_df: DataFrame of the regions.
+        - pl_track_arr: Plus strand track array of shape (N, max_region_len). Can be memory-mapped.
+        - mn_track_arr: Minus strand track array of shape (N, max_region_len). Can be memory-mapped.
 
-        for anno_name in args.anno_name:
-            result_ge.save_anno_npy(anno_name, f"{args.anno_oheader}.{anno_name}.npy")
+        Returns:
+        - trebed_df: DataFrame with chrom, start, end, name, fwdTSS and revTSS columns.
+        '''
+        start_arr = region_df["start"].to_numpy(dtype=np.int64)
+        region_len_arr = region_df["end"].to_numpy(dtype=np.int64) - start_arr
+        max_region_len = int(region_len_arr.max()) if len(region_len_arr) > 0 else 0
+
+        for track_arr in (pl_track_arr, mn_track_arr):
+            if track_arr.ndim != 2 or track_arr.shape[0] != len(region_df) or track_arr.shape[1] < max_region_len:
+                raise ValueError(f"Track array shape {track_arr.shape} does not match "
+                                 f"{len(region_df)} regions of maximum length {max_region_len}")
+
+        # TSS: position with maximum absolute signal within the region
+        # fwdTSS from the plus strand track, revTSS from the minus strand track
+        fwdTSS_arr = start_arr + GEUtils.get_masked_abs_argmax(pl_track_arr, region_len_arr)
+        revTSS_arr = start_arr + GEUtils.get_masked_abs_argmax(mn_track_arr, region_len_arr)
+
+        return pd.DataFrame({
+            "chrom": region_df["chrom"].to_numpy(),
+            "start": start_arr,
+            "end": region_df["end"].to_numpy(dtype=np.int64),
+            "name": GEUtils.get_region_ids(region_df),
+            "fwdTSS": fwdTSS_arr,
+            "revTSS": revTSS_arr,
+        })
 
     @staticmethod
     def export_trebed(args):
@@ -704,54 +1341,32 @@ class GenomicElementExport:
         Examines GROcap/PROcap signal tracks to find TSS positions:
         - fwdTSS: Absolute genomic position of maximum signal in plus strand track
         - revTSS: Absolute genomic position of maximum signal in minus strand track
+
+        .npy tracks are memory-mapped and processed in chunks of regions.
         '''
         ge = GenomicElements(args.region_file_path, 
                              args.region_file_type, 
                              None, 
                              )
-        
-        ge.load_region_anno_from_npy("pl_track", args.pl_sig_track, anno_type="track")
-        ge.load_region_anno_from_npy("mn_track", args.mn_sig_track, anno_type="track")
-        
-        pl_track_list = ge.get_track_list("pl_track")
-        mn_track_list = ge.get_track_list("mn_track")
-        
-        # Create TREbed output
+        region_df = ge.get_region_bed_table().to_dataframe()
+
+        pl_track_arr = GEUtils.load_anno_arr(args.pl_sig_track, mmap_mode="r")
+        mn_track_arr = GEUtils.load_anno_arr(args.mn_sig_track, mmap_mode="r")
+
         trebed_bt = GenomicElements.BedTableTREBed(enable_sort=False)
-        
-        output_dict_list = []
-        for i, region in enumerate(ge.get_region_bed_table().iter_regions()):
-            pl_track = np.abs(pl_track_list[i])
-            mn_track = np.abs(mn_track_list[i])
-            
-            # Find TSS positions (position with maximum signal, relative to region start)
-            # fwdTSS: forward TSS from plus strand track
-            # revTSS: reverse TSS from minus strand track
-            fwdTSS_rel_pos = np.argmax(pl_track) if len(pl_track) > 0 else 0
-            revTSS_rel_pos = np.argmax(mn_track) if len(mn_track) > 0 else 0
-            
-            # Convert to absolute genomic coordinates
-            fwdTSS = region["start"] + fwdTSS_rel_pos
-            revTSS = region["start"] + revTSS_rel_pos
-            
-            # Create region name (default: chrom:start-end)
-            region_name = f"{region['chrom']}:{region['start']}-{region['end']}"
-            
-            output_dict = {
-                "chrom": region["chrom"],
-                "start": region["start"],
-                "end": region["end"],
-                "name": region_name,
-                "fwdTSS": fwdTSS,
-                "revTSS": revTSS,
-            }
-            output_dict_list.append(output_dict)
-        
-        trebed_bt.load_from_dataframe(pd.DataFrame(output_dict_list))
+        trebed_bt.load_from_dataframe(GenomicElementExport.get_trebed_df(region_df, pl_track_arr, mn_track_arr))
         trebed_bt.write(args.opath)
 
     @staticmethod
     def export_merged_ge(args):
+        '''
+        Merge the regions and annotations of two or more GenomicElements, sorted by coordinates.
+
+        One merge order is applied to the regions and streamed through each memory-mapped 
+        annotation. Equal regions keep the input order. If every input is sorted, the merge 
+        order is built by merging the sorted inputs instead of sorting them together.
+        Each annotation is checked against its --anno_type before anything is written.
+        '''
         if len(args.anno_name) != len(args.left_anno_path):
             raise ValueError(
                 f"Number of anno_name ({len(args.anno_name)}) must match "
@@ -768,32 +1383,67 @@ class GenomicElementExport:
                 f"number of anno_type ({len(args.anno_type)})"
             )
 
-        left_ge = GenomicElements(args.left_region_file_path,
-                                  args.region_file_type,
-                                  None,
-                                  )
-        right_ge = GenomicElements(args.right_region_file_path,
-                                   args.region_file_type,
-                                   None,
-                                   )
-
-        for anno_name, anno_type, left_anno_path, right_anno_path in zip(args.anno_name,
-                                                                          args.anno_type,
-                                                                          args.left_anno_path,
-                                                                          args.right_anno_path):
-            left_ge.load_region_anno_from_npy(anno_name, left_anno_path, anno_type=anno_type)
-            right_ge.load_region_anno_from_npy(anno_name, right_anno_path, anno_type=anno_type)
+        if len(args.extra_anno_path) != len(args.anno_name) * len(args.extra_region_file_path):
+            raise ValueError(
+                f"Number of extra_anno_path ({len(args.extra_anno_path)}) must be the number of anno_name "
+                f"({len(args.anno_name)}) times the number of extra_region_file_path ({len(args.extra_region_file_path)})"
+            )
 
+        region_file_path_list = [args.left_region_file_path, args.right_region_file_path] + args.extra_region_file_path
+        # Annotation paths of each anno_name, one per region file
+        anno_path_list_list = [[left_anno_path, right_anno_path] + args.extra_anno_path[i::len(args.anno_name)]
+                               for i, (left_anno_path, right_anno_path) in enumerate(zip(args.left_anno_path, 
+                                                                                         args.right_anno_path))]
         output_region_path = args.oheader + "." + args.region_file_type
-        merged_ge = GenomicElements.merge_genomic_elements(left_ge,
-                                                           right_ge,
-                                                           output_region_path,
-                                                           args.anno_name,
-                                                           sort_new_ge=True,
-                                                           )
 
-        for anno_name in args.anno_name:
-            merged_ge.save_anno_npy(anno_name, args.oheader + "." + anno_name + ".npy")
+        region_df_list = [GEUtils.read_region_df(region_file_path, args.region_file_type) 
+                          for region_file_path in region_file_path_list]
+        presorted = all(GEUtils.is_region_df_sorted(region_df) for region_df in region_df_list)
+
+        num_regions_list = [len(region_df) for region_df in region_df_list]
+        # Checked before writing so that a mismatch does not leave partial outputs
+        for anno_type, anno_path_list in zip(args.anno_type, anno_path_list_list):
+            for anno_path, num_regions in zip(anno_path_list, num_regions_list):
+                anno_arr = GEUtils.load_anno_arr(anno_path, mmap_mode="r")
+                if anno_arr.ndim == 0 or anno_arr.shape[0] != num_regions:
+                    raise ValueError(f"Annotation array shape {anno_arr.shape} in {anno_path} does not match "
+                                     f"the number of regions {num_regions}")
+                GEUtils.check_anno_type(anno_arr, anno_type, anno_path)
+
+        # One merge order for the regions and all annotations
+        merge_order = GEUtils.get_merge_order(region_df_list, presorted=presorted)
+        GEUtils.write_region_df(pd.concat(region_df_list, ignore_index=True).iloc[merge_order], 
+                                output_region_path, 
+                                args.region_file_type, 
+                                )
+
+        for anno_name, anno_path_list in zip(args.anno_name, anno_path_list_list):
+            GEUtils.merge_anno_npy(anno_path_list, 
+                                   num_regions_list, 
+                                   merge_order, 
+                                   args.oheader + "." + anno_name + ".npy", 
+                                   )
+
+    @staticmethod
+    def export_gebin(args):
+        '''
+        Export a text region file as a gebin region file.
+        '''
+        if args.chunk_size is not None:
+            GEUtils.stream_region_transform(args.region_file_path, 
+                                            args.region_file_type, 
+                                            args.opath, 
+                                            args.chunk_size, 
+                                            lambda region_df, chunk_offset: region_df, 
+                                            output_region_file_type="gebin", 
+                                            )
+            return
+
+        GEUtils.write_region_df(GEUtils.read_region_df(args.region_file_path, args.region_file_type), 
+                                args.opath, 
+                                "gebin", 
+                                args.region_file_type, 
+                                )
 
     @staticmethod
     def export_bed6poly(args):
@@ -855,6 +1505,8 @@ class GenomicElementExport:
             GenomicElementExport.export_count_table(args)
         elif args.oformat == "Heatmap":
             GenomicElementExport.export_heatmap(args)
+        elif args.oformat == "HeatmapBatch":
+            GenomicElementExport.export_heatmap_batch(args)
         elif args.oformat == "ChromFilteredGE":
             GenomicElementExport.export_chrom_filtered_ge(args)
         elif args.oformat == "MaskedGE":
@@ -863,6 +1515,8 @@ class GenomicElementExport:
             GenomicElementExport.export_trebed(args)
         elif args.oformat == "MergedGE":
             GenomicElementExport.export_merged_ge(args)
+        elif args.oformat == "gebin":
+            GenomicElementExport.export_gebin(args)
         elif args.oformat == "bed6poly":
             GenomicElementExport.export_bed6poly(args)
         else:
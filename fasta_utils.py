@@ -0,0 +1,542 @@
+
+import gzip
+import mmap
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+class IndexedFasta:
+    '''
+    Memory-mapped FASTA file with random access through its .fai index.
+    The index is built in memory if <fasta_path>.fai does not exist or is older than the fasta file.
+    '''
+    def __init__(self, fasta_path):
+        if fasta_path.endswith(".gz"):
+            raise ValueError(f"Memory-mapped access requires an uncompressed fasta file: {fasta_path}")
+
+        self.__fasta_path = fasta_path
+        fai_path = fasta_path + ".fai"
+        if IndexedFasta.is_index_current(fasta_path, fai_path):
+            self.__fai_dict = IndexedFasta.load_fai(fai_path)
+        else:
+            self.__fai_dict = IndexedFasta.build_fai(fasta_path)
+
+        self.__handle = open(fasta_path, "rb")
+        self.__mmap = mmap.mmap(self.__handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def is_index_current(fasta_path, index_path):
+        '''
+        Check that an index file next to a fasta file exists and is not older than the fasta file.
+        '''
+        return os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(fasta_path)
+
+    @staticmethod
+    def load_fai(fai_path):
+        '''
+        Load a samtools faidx index.
+
+        Returns:
+        - fai_dict: Dictionary of chromosome name to (length, offset, line_bases, line_width).
+        '''
+        fai_dict = {}
+        with open(fai_path, "r") as handle:
+            for line in handle:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 5:
+                    continue
+                fai_dict[fields[0]] = tuple(int(f) for f in fields[1:5])
+
+        return fai_dict
+
+    @staticmethod
+    def build_fai(fasta_path):
+        '''
+        Build a samtools faidx index in memory. See IndexedFasta.load_fai.
+        '''
+        fai_dict = {}
+        name = None
+        offset = 0
+        with open(fasta_path, "rb") as handle:
+            for line in handle:
+                if line.startswith(b">"):
+                    name = line[1:].split()[0].decode()
+                    fai_dict[name] = [0, offset + len(line), 0, 0]
+                elif name is not None and len(line.strip()) > 0:
+                    entry = fai_dict[name]
+                    if entry[2] == 0:
+                        entry[2] = len(line.rstrip(b"\r\n"))
+                        entry[3] = len(line)
+                    entry[0] += len(line.rstrip(b"\r\n"))
+                offset += len(line)
+
+        return {k: tuple(v) for k, v in fai_dict.items()}
+
+    @staticmethod
+    def scan_seq_ids(fasta_path, block_size=1 << 24):
+        '''
+        Get the sequence ids of a fasta file without reading the sequences into memory.
+        Names are taken from <fasta_path>.fai if it exists and is not older than the fasta file,
+        otherwise the file (optionally gzipped) is scanned in blocks of block_size bytes for header lines.
+
+        Returns:
+        - seq_ids: List of sequence ids (first word of each header) in file order.
+        '''
+        fai_path = fasta_path + ".fai"
+        if IndexedFasta.is_index_current(fasta_path, fai_path) and not fasta_path.endswith(".gz"):
+            with open(fai_path, "r") as handle:
+                return [line.split("\t", 1)[0] for line in handle if len(line.strip()) > 0]
+
+        def get_seq_id(header):
+            fields = header.split()
+            return fields[0].decode() if len(fields) > 0 else ""
+
+        seq_ids = []
+        opener = gzip.open if fasta_path.endswith(".gz") else open
+        with opener(fasta_path, "rb") as handle:
+            # A leading newline lets a header on the first line match b"\n>"
+            carry = b"\n"
+            while True:
+                block = handle.read(block_size)
+                if not block:
+                    break
+                buf = carry + block
+                carry = buf[-1:]
+                pos = buf.find(b"\n>")
+                while pos >= 0:
+                    line_end = buf.find(b"\n", pos + 2)
+                    if line_end < 0:
+                        # Header continues in the next block
+                        carry = buf[pos:]
+                        break
+                    seq_ids.append(get_seq_id(buf[pos + 2:line_end]))
+                    pos = buf.find(b"\n>", line_end)
+
+            if carry.startswith(b"\n>"):
+                # Header on the last line without a trailing newline
+                seq_ids.append(get_seq_id(carry[2:]))
+
+        return seq_ids
+
+    def get_chrom_names(self):
+        return list(self.__fai_dict.keys())
+
+    def get_seq(self, chrom, start, end):
+        '''
+        Get the sequence of a region. Coordinates are clipped to the chromosome.
+
+        Returns:
+        - seq: Sequence string, None if the chromosome is not in the fasta file.
+        '''
+        if chrom not in self.__fai_dict:
+            return None
+
+        chrom_len, offset, line_bases, line_width = self.__fai_dict[chrom]
+        start = max(int(start), 0)
+        end = min(int(end), chrom_len)
+        if start >= end:
+            return ""
+
+        byte_start = offset + start // line_bases * line_width + start % line_bases
+        byte_end = offset + (end - 1) // line_bases * line_width + (end - 1) % line_bases + 1
+        seq = self.__mmap[byte_start:byte_end]
+        if line_width != line_bases:
+            seq = seq.replace(b"\n", b"").replace(b"\r", b"")
+
+        return seq.decode("ascii")
+
+    def close(self):
+        self.__mmap.close()
+        self.__handle.close()
+
+class FastaWriter:
+    '''
+    Streaming fasta writer. Records are written one line per sequence, same as
+    ExogeneousSequences.write_sequences_to_fasta, through a buffer of buffer_size bytes.
+
+    With compression ("gzip" or "bgzip"), buffers are compressed and written by
+    a background thread while the next buffer is filled.
+    '''
+    def __init__(self, opath, compression=None, buffer_size=1 << 22, compress_level=6):
+        if compression not in FastaWriter.get_compression_options():
+            raise ValueError(f"Invalid compression: {compression}. "
+                             f"Valid options: {FastaWriter.get_compression_options()}")
+
+        self.__handle = open(opath, "wb")
+        self.__compression = compression
+        self.__compress_level = compress_level
+        self.__buffer_size = buffer_size
+        self.__buffer = []
+        self.__buffer_len = 0
+
+        self.__queue = None
+        self.__thread = None
+        self.__thread_exception = None
+        if compression is not None:
+            self.__queue = queue.Queue(maxsize=4)
+            self.__thread = threading.Thread(target=self.__compress_worker, daemon=True)
+            self.__thread.start()
+
+    @staticmethod
+    def get_compression_options():
+        return [None, "gzip", "bgzip"]
+
+    @staticmethod
+    def get_bgzf_block(data, compress_level):
+        '''
+        Compress data (at most 65280 bytes) into one BGZF block.
+        '''
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+        header = struct.pack("<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(cdata) + 25)
+        return header + cdata + struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))
+
+    @staticmethod
+    def get_bgzf_eof_block():
+        return FastaWriter.get_bgzf_block(b"", 6)
+
+    def __compress_worker(self):
+        try:
+            if self.__compression == "gzip":
+                compressor = zlib.compressobj(self.__compress_level, zlib.DEFLATED, 31)
+                while True:
+                    data = self.__queue.get()
+                    if data is None:
+                        break
+                    self.__handle.write(compressor.compress(data))
+                self.__handle.write(compressor.flush())
+            else:
+                remainder = b""
+                bgzf_block_size = 65280
+                while True:
+                    data = self.__queue.get()
+                    if data is None:
+                        break
+                    data = remainder + data
+                    num_full_blocks = len(data) // bgzf_block_size
+                    for i in range(num_full_blocks):
+                        self.__handle.write(FastaWriter.get_bgzf_block(data[i * bgzf_block_size:(i + 1) * bgzf_block_size],
+                                                                       self.__compress_level,
+                                                                       ))
+                    remainder = data[num_full_blocks * bgzf_block_size:]
+                if len(remainder) > 0:
+                    self.__handle.write(FastaWriter.get_bgzf_block(remainder, self.__compress_level))
+                self.__handle.write(FastaWriter.get_bgzf_eof_block())
+        except Exception as e:
+            self.__thread_exception = e
+            # Keep draining so that the producer never blocks on a full queue
+            while self.__queue.get() is not None:
+                pass
+
+    def __flush_buffer(self):
+        if self.__buffer_len == 0:
+            return
+        data = "".join(self.__buffer).encode("ascii")
+        self.__buffer = []
+        self.__buffer_len = 0
+
+        if self.__queue is None:
+            self.__handle.write(data)
+        else:
+            if self.__thread_exception is not None:
+                raise self.__thread_exception
+            self.__queue.put(data)
+
+    def write(self, seq_id, seq):
+        '''
+        Write one record.
+        '''
+        record = f">{seq_id}\n{seq}\n"
+        self.__buffer.append(record)
+        self.__buffer_len += len(record)
+        if self.__buffer_len >= self.__buffer_size:
+            self.__flush_buffer()
+
+    def write_records(self, seq_ids, seqs):
+        '''
+        Write records of matching sequence ids and sequences.
+        '''
+        for seq_id, seq in zip(seq_ids, seqs):
+            self.write(seq_id, seq)
+
+    def close(self):
+        self.__flush_buffer()
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+        self.__handle.close()
+        if self.__thread_exception is not None:
+            raise self.__thread_exception
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ReverseComplement:
+    '''
+    Vectorized reverse complement of sequences and one-hot encoded arrays.
+    '''
+    @staticmethod
+    def get_translate_table():
+        '''
+        Byte translate table of the complement bases (IUPAC codes, case preserved).
+        '''
+        return bytes.maketrans(b"ACGTRYKMBVDHNacgtrykmbvdhn",
+                               b"TGCAYRMKVBHDNtgcayrmkvbhdn",
+                               )
+
+    @staticmethod
+    def reverse_complement_seqs(seq_list, rc_mask):
+        '''
+        Reverse complement a subset of sequences.
+
+        The selected sequences are concatenated into one buffer, translated and
+        reversed as a whole. Reversing the buffer also reverses the order of the
+        sequences, so the buffer is split with the reversed lengths.
+
+        Keyword arguments:
+        - seq_list: List of sequences.
+        - rc_mask: Boolean array, True for the sequences to reverse complement.
+
+        Returns:
+        - output_seq_list: List of sequences.
+        '''
+        rc_indices = np.flatnonzero(np.asarray(rc_mask, dtype=bool))
+        output_seq_list = list(seq_list)
+        if len(rc_indices) == 0:
+            return output_seq_list
+
+        rc_seq_list = [seq_list[i] for i in rc_indices]
+        buffer = "".join(rc_seq_list).encode("ascii").translate(ReverseComplement.get_translate_table())[::-1]
+        buffer = buffer.decode("ascii")
+
+        len_arr = np.fromiter((len(seq) for seq in reversed(rc_seq_list)), dtype=np.int64, count=len(rc_seq_list))
+        offset_arr = np.concatenate([[0], np.cumsum(len_arr)])
+        for i, start, end in zip(rc_indices[::-1], offset_arr[:-1], offset_arr[1:]):
+            output_seq_list[i] = buffer[start:end]
+
+        return output_seq_list
+
+    @staticmethod
+    def reverse_complement_one_hot(one_hot_arr, rc_mask):
+        '''
+        Reverse complement a subset of one-hot encoded sequences in place.
+        With ACGT channel order, the complement is the reversed channel axis.
+
+        Keyword arguments:
+        - one_hot_arr: Array of shape (num_seqs, seq_len, 4).
+        - rc_mask: Boolean array, True for the sequences to reverse complement.
+
+        Returns:
+        - one_hot_arr: The input array.
+        '''
+        rc_mask = np.asarray(rc_mask, dtype=bool)
+        one_hot_arr[rc_mask] = one_hot_arr[rc_mask][:, ::-1, ::-1]
+
+        return one_hot_arr
+
+class RegionSeqExtractor:
+    '''
+    Extract region sequences, optionally in parallel.
+
+    With num_workers=None, sequences are extracted by the GenomicElements object.
+    Otherwise regions are split into per-chromosome shards that are extracted by
+    worker processes from the memory-mapped fasta file, and the sequences are
+    returned in the original order. Unless shard_size is given, the regions of each 
+    call are split into at least num_workers shards so that all workers are used.
+    '''
+    # Per-process fasta file of the worker processes
+    _worker_fasta = None
+
+    def __init__(self, genomic_elements, fasta_path, num_workers=None, shard_size=None):
+        self.__genomic_elements = genomic_elements
+        self.__fasta_path = fasta_path
+        self.__num_workers = num_workers
+        self.__shard_size = shard_size
+        self.__pool = None
+
+        if num_workers is not None:
+            if num_workers < 1:
+                raise ValueError(f"num_workers must be >= 1, got {num_workers}")
+            if num_workers == 1:
+                RegionSeqExtractor._init_worker(fasta_path)
+            else:
+                self.__pool = multiprocessing.Pool(num_workers,
+                                                   initializer=RegionSeqExtractor._init_worker,
+                                                   initargs=(fasta_path,),
+                                                   )
+
+    @staticmethod
+    def _init_worker(fasta_path):
+        RegionSeqExtractor._worker_fasta = IndexedFasta(fasta_path)
+
+    @staticmethod
+    def _extract_shard(shard):
+        chrom, start_arr, end_arr = shard
+        return RegionSeqExtractor.get_worker_region_seqs([chrom] * len(start_arr), start_arr, end_arr)
+
+    @staticmethod
+    def get_worker_region_seqs(chrom_arr, start_arr, end_arr):
+        '''
+        Get region sequences from the memory-mapped fasta file of the current
+        worker. Only valid in functions run by RegionSeqExtractor.imap.
+        '''
+        return [RegionSeqExtractor._worker_fasta.get_seq(chrom, start, end)
+                for chrom, start, end in zip(chrom_arr, start_arr, end_arr)]
+
+    def imap(self, func, task_list):
+        '''
+        Run func over task_list in the worker processes, yielding the results in order.
+        Requires num_workers.
+        '''
+        if self.__num_workers is None:
+            raise ValueError("RegionSeqExtractor.imap requires num_workers.")
+        if self.__pool is None:
+            return map(func, task_list)
+        return self.__pool.imap(func, task_list)
+
+    def get_shards(self, chrom_arr, start_arr, end_arr):
+        '''
+        Split regions into per-chromosome shards of at most shard_size regions 
+        (default: the number of regions divided by num_workers, rounded up).
+
+        Returns:
+        - shard_list: List of (chrom, start_arr, end_arr).
+        - shard_index_list: List of original region indices of each shard.
+        '''
+        chrom_arr = np.asarray(chrom_arr).astype(str)
+        chrom_names, chrom_codes = np.unique(chrom_arr, return_inverse=True)
+        sort_idx = np.argsort(chrom_codes.reshape(-1,), kind="stable")
+        split_points = np.flatnonzero(np.diff(chrom_codes.reshape(-1,)[sort_idx])) + 1
+
+        shard_size = self.__shard_size
+        if shard_size is None:
+            shard_size = max(-(-len(chrom_arr) // (self.__num_workers or 1)), 1)
+
+        shard_list = []
+        shard_index_list = []
+        for chrom_idx in np.split(sort_idx, split_points):
+            for shard_start in range(0, len(chrom_idx), shard_size):
+                shard_idx = chrom_idx[shard_start:shard_start + shard_size]
+                shard_list.append((chrom_arr[shard_idx[0]], start_arr[shard_idx], end_arr[shard_idx]))
+                shard_index_list.append(shard_idx)
+
+        return shard_list, shard_index_list
+
+    def __submit_region_seqs(self, region_df):
+        '''
+        Start extracting the sequences of the regions in a region table.
+
+        Returns:
+        - seq_task: Task to pass to __collect_region_seqs.
+        '''
+        chrom_arr = region_df["chrom"].to_numpy()
+        start_arr = region_df["start"].to_numpy()
+        end_arr = region_df["end"].to_numpy()
+
+        if self.__num_workers is None:
+            shard_index_list = [np.arange(len(region_df))]
+            shard_seq_lists = [[self.__genomic_elements.get_region_seq(chrom, start, end)
+                                for chrom, start, end in zip(chrom_arr, start_arr, end_arr)]]
+        else:
+            shard_list, shard_index_list = self.get_shards(chrom_arr, start_arr, end_arr)
+            if self.__pool is None:
+                shard_seq_lists = list(map(RegionSeqExtractor._extract_shard, shard_list))
+            else:
+                shard_seq_lists = self.__pool.map_async(RegionSeqExtractor._extract_shard, shard_list)
+
+        return region_df, shard_index_list, shard_seq_lists
+
+    def __collect_region_seqs(self, seq_task):
+        '''
+        Wait for the sequences started by __submit_region_seqs.
+
+        Returns:
+        - seq_list: List of sequences in the order of the region table.
+        '''
+        region_df, shard_index_list, shard_seq_lists = seq_task
+        if not isinstance(shard_seq_lists, list):
+            shard_seq_lists = shard_seq_lists.get()
+
+        seq_list = [None] * len(region_df)
+        for shard_idx, shard_seq_list in zip(shard_index_list, shard_seq_lists):
+            for i, seq in zip(shard_idx, shard_seq_list):
+                seq_list[i] = seq
+
+        for chrom, start, end, seq in zip(region_df["chrom"], region_df["start"], region_df["end"], seq_list):
+            if seq is None:
+                raise ValueError(f"Chromosome {chrom} not found in genome file. "
+                                 f"Cannot get sequence of region {chrom}:{start}-{end}")
+
+        return seq_list
+
+    def get_region_seqs(self, region_df):
+        '''
+        Get the sequences of the regions in a region table.
+
+        Keyword arguments:
+        - region_df: Region table with chrom, start and end columns.
+
+        Returns:
+        - seq_list: List of sequences in the order of region_df.
+        '''
+        return self.__collect_region_seqs(self.__submit_region_seqs(region_df))
+
+    def iter_region_seq_chunks(self, region_df, chunk_size):
+        '''
+        Iterate over the sequences of a region table in chunks. The shards of 
+        the next chunk are extracted by the workers while the current chunk 
+        is processed by the caller.
+
+        Keyword arguments:
+        - region_df: Region table with chrom, start and end columns.
+        - chunk_size: Number of regions per chunk.
+
+        Yields:
+        - chunk_start: Index of the first region of the chunk.
+        - chunk_df: Region table of the chunk.
+        - seq_list: List of sequences in the order of chunk_df.
+        '''
+        chunk_start_list = list(range(0, len(region_df), chunk_size))
+        seq_task = None
+        for i, chunk_start in enumerate(chunk_start_list):
+            if seq_task is None:
+                seq_task = self.__submit_region_seqs(region_df.iloc[chunk_start:chunk_start + chunk_size])
+
+            next_seq_task = None
+            if self.__pool is not None and i + 1 < len(chunk_start_list):
+                next_chunk_start = chunk_start_list[i + 1]
+                next_seq_task = self.__submit_region_seqs(region_df.iloc[next_chunk_start:next_chunk_start + chunk_size])
+
+            chunk_df = seq_task[0]
+            yield chunk_start, chunk_df, self.__collect_region_seqs(seq_task)
+            seq_task = next_seq_task
+
+    def get_all_region_seqs(self):
+        '''
+        Get the sequences of all regions of the GenomicElements object.
+        '''
+        if self.__num_workers is None:
+            return self.__genomic_elements.get_all_region_seqs()
+
+        return self.get_region_seqs(self.__genomic_elements.get_region_bed_table().to_dataframe())
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,704 @@
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from RGTools.GenomicElements import GenomicElements
+from RGTools.exceptions import InvalidStrandnessException
+from RGTools.utils import str2bool
+
+from gebin import GEBin, GEBinWriter
+
+class GEUtils:
+    @staticmethod
+    def set_parser_genomic_element_region(parser):
+        '''
+        Same as GenomicElements.set_parser_genomic_element_region, 
+        but also accepts gebin region files.
+        '''
+        parser.add_argument("--region_file_path",
+                            help="Path to the region file.",
+                            required=True,
+                            type=str,
+                            )
+        parser.add_argument("--region_file_type",
+                            help="Type of the region file. "
+                                 "Valid types: {}".format(GEUtils.get_region_file_type_options()),
+                            required=True,
+                            type=str,
+                            choices=GEUtils.get_region_file_type_options(),
+                            )
+
+    @staticmethod
+    def get_region_file_type_options():
+        return list(GenomicElements.get_region_file_suffix2class_dict().keys()) + ["gebin"]
+
+    @staticmethod
+    def get_numeric_dtype_dict():
+        '''
+        Dtype names accepted by the --dtype arguments of stat_list import/export.
+        '''
+        return {"np.int32": np.int32,
+                "np.int64": np.int64,
+                "np.float32": np.float32,
+                "np.float64": np.float64,
+                }
+
+    @staticmethod
+    def set_parser_chunk_size(parser):
+        parser.add_argument("--chunk_size",
+                            help="If given, stream the region file in chunks of this many regions "
+                                 "instead of loading it into memory.",
+                            type=int,
+                            default=None,
+                            )
+
+    @staticmethod
+    def set_parser_num_workers(parser):
+        parser.add_argument("--num_workers",
+                            help="If given, extract region sequences with this many worker processes "
+                                 "from the memory-mapped fasta file (requires an uncompressed fasta).",
+                            type=int,
+                            default=None,
+                            )
+
+    @staticmethod
+    def set_parser_strand_aware(parser):
+        parser.add_argument("--strand_aware",
+                            help="If True, reverse complement the sequences of minus strand elements. "
+                                 "Requires a region file type with strand information.",
+                            type=str2bool,
+                            default=False,
+                            )
+
+    @staticmethod
+    def get_minus_strand_mask(region_df):
+        '''
+        Get the minus strand mask of a region table.
+
+        Keyword arguments:
+        - region_df: Region table.
+
+        Returns:
+        - minus_logical: Boolean array, True for minus strand regions.
+        '''
+        if "strand" not in region_df.columns:
+            raise InvalidStrandnessException("Strand information is required for strand aware sequences.")
+
+        strand_arr = region_df["strand"].to_numpy().astype(str)
+        minus_logical = strand_arr == "-"
+        if not np.all(minus_logical | (strand_arr == "+")):
+            raise InvalidStrandnessException("Strand information is required for strand aware sequences. "
+                                             f"Got strands: {np.unique(strand_arr).tolist()}")
+
+        return minus_logical
+
+    @staticmethod
+    def load_chrom_size_chroms(chrom_size_path):
+        '''
+        Load the chromosome names from a chromosome size file.
+        '''
+        chrom_size_df = pd.read_csv(chrom_size_path, 
+                                    sep="\t", 
+                                    header=None, 
+                                    names=["chrom", "size"], 
+                                    dtype={"chrom": str}, 
+                                    )
+        return chrom_size_df["chrom"].to_numpy().astype(str)
+
+    @staticmethod
+    def get_chrom_filter_logical(chrom_arr, chrom_names):
+        '''
+        Logical array of the regions on one of the given chromosomes. 
+        Membership is tested once per distinct chromosome of a categorical 
+        chromosome column and broadcast back to the regions.
+
+        Keyword arguments:
+        - chrom_arr: Chromosome of each region.
+        - chrom_names: Chromosomes to keep.
+
+        Returns:
+        - filter_logical: Boolean array of shape (N,).
+        '''
+        chrom_cat = pd.Categorical(chrom_arr)
+        keep_logical = np.isin(chrom_cat.categories.to_numpy().astype(str), 
+                               np.asarray(chrom_names).astype(str), 
+                               )
+        # Missing chromosomes (code -1) index the appended False
+        return np.append(keep_logical, False)[chrom_cat.codes]
+
+    @staticmethod
+    def get_region_column_names(region_file_type):
+        '''
+        Get the column names of a region file type.
+        '''
+        region_bt = GenomicElements.get_region_file_suffix2class_dict()[region_file_type](enable_sort=False)
+        return list(region_bt.column_names)
+
+    @staticmethod
+    def get_region_column_types(region_file_type):
+        '''
+        Get the column types (e.g. str, int, float) of a region file type, in column order.
+        '''
+        region_bt = GenomicElements.get_region_file_suffix2class_dict()[region_file_type](enable_sort=False)
+        return list(region_bt.column_types)
+
+    @staticmethod
+    def get_base_region_file_type(region_file_path, region_file_type):
+        '''
+        Get the text region file type of a region file. For gebin 
+        files this is the type recorded in the file.
+        '''
+        if region_file_type == "gebin":
+            return GEBin(region_file_path).get_region_file_type()
+        return region_file_type
+
+    @staticmethod
+    def read_region_df(region_file_path, region_file_type):
+        '''
+        Read a region file (any GenomicElements region file type or gebin) as a region table.
+        '''
+        if region_file_type == "gebin":
+            return GEBin(region_file_path).get_region_df()
+
+        genomic_elements = GenomicElements(region_file_path=region_file_path,
+                                           region_file_type=region_file_type,
+                                           fasta_path=None, 
+                                           )
+        return genomic_elements.get_region_bed_table().to_dataframe()
+
+    @staticmethod
+    def write_region_df(region_df, opath, region_file_type, base_region_file_type=None):
+        '''
+        Write a region table.
+
+        Keyword arguments:
+        - region_df: Region table.
+        - opath: Output path.
+        - region_file_type: Type of the output region file.
+        - base_region_file_type: Text region file type recorded in gebin outputs 
+            (default: region_file_type).
+        '''
+        if region_file_type == "gebin":
+            base_region_file_type = base_region_file_type if base_region_file_type else region_file_type
+            column_names = GEUtils.get_region_column_names(base_region_file_type)
+            with GEBinWriter(opath, 
+                             base_region_file_type, 
+                             column_names, 
+                             GEUtils.get_region_column_types(base_region_file_type), 
+                             ) as writer:
+                writer.append(region_df[column_names])
+            return
+
+        output_bt = GenomicElements.get_region_file_suffix2class_dict()[region_file_type](enable_sort=False)
+        output_bt.load_from_dataframe(region_df[output_bt.column_names].reset_index(drop=True))
+        output_bt.write(opath)
+
+    @staticmethod
+    def get_num_regions(region_file_path, region_file_type):
+        '''
+        Count the regions of a region file without parsing it. 
+        Blank lines of text region files are not counted.
+        '''
+        if region_file_type == "gebin":
+            return GEBin(region_file_path).get_num_regions()
+
+        with open(region_file_path, "rb") as handle:
+            return sum(1 for line in handle if line.strip())
+
+    @staticmethod
+    def iter_region_df_chunks(region_file_path, region_file_type, chunk_size):
+        '''
+        Iterate over a region file in chunks of DataFrames. 
+        Coordinates are parsed as int64 and all other columns 
+        of text region files are kept as the original strings.
+
+        Keyword arguments:
+        - region_file_path: Path to the region file.
+        - region_file_type: Type of the region file.
+        - chunk_size: Number of regions per chunk.
+
+        Yields:
+        - region_df: Region table of the chunk.
+        '''
+        if region_file_type == "gebin":
+            yield from GEBin(region_file_path).iter_region_df_chunks(chunk_size)
+            return
+
+        column_names = GEUtils.get_region_column_names(region_file_type)
+        column_dtype = {c: str for c in column_names}
+        column_dtype["start"] = np.int64
+        column_dtype["end"] = np.int64
+
+        with pd.read_csv(region_file_path, 
+                         sep="\t", 
+                         header=None, 
+                         names=column_names, 
+                         usecols=range(len(column_names)), 
+                         dtype=column_dtype, 
+                         keep_default_na=False, 
+                         chunksize=chunk_size, 
+                         ) as reader:
+            for region_df in reader:
+                yield region_df.reset_index(drop=True)
+
+    @staticmethod
+    def stream_region_transform(region_file_path, region_file_type, opath, 
+                                chunk_size, transform_func, output_region_file_type=None):
+        '''
+        Apply a transform to a region file chunk by chunk and 
+        append each transformed chunk to the output region file.
+        Element order is preserved.
+
+        Keyword arguments:
+        - region_file_path: Path to the input region file.
+        - region_file_type: Type of the input region file.
+        - opath: Path to the output region file.
+        - chunk_size: Number of regions per chunk.
+        - transform_func: Function taking (region_df, chunk_offset) and 
+            returning the transformed region_df.
+        - output_region_file_type: Type of the output region file (default: region_file_type).
+
+        Returns:
+        - num_regions: Number of regions read from the input.
+        '''
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be >= 1, got {chunk_size}")
+
+        if output_region_file_type is None:
+            output_region_file_type = region_file_type
+        base_region_file_type = GEUtils.get_base_region_file_type(region_file_path, region_file_type)
+
+        if output_region_file_type == "gebin":
+            writer = GEBinWriter(opath, 
+                                 base_region_file_type, 
+                                 GEUtils.get_region_column_names(base_region_file_type), 
+                                 GEUtils.get_region_column_types(base_region_file_type), 
+                                 )
+            write_func = writer.append
+        else:
+            if output_region_file_type != base_region_file_type:
+                raise ValueError(f"Cannot stream {base_region_file_type} regions into a "
+                                 f"{output_region_file_type} file.")
+            # Written next to opath and moved into place once complete
+            tmp_opath = f"{opath}.{os.getpid()}.tmp"
+            output_handle = open(tmp_opath, "w")
+            write_func = lambda output_df: output_df.to_csv(output_handle, 
+                                                            sep="\t", 
+                                                            header=False, 
+                                                            index=False, 
+                                                            )
+
+        num_regions = 0
+        try:
+            for region_df in GEUtils.iter_region_df_chunks(region_file_path, 
+                                                           region_file_type, 
+                                                           chunk_size, 
+                                                           ):
+                write_func(transform_func(region_df, num_regions))
+                num_regions += len(region_df)
+        except BaseException:
+            # Do not leave a partial output behind
+            if output_region_file_type == "gebin":
+                writer.abort()
+            else:
+                output_handle.close()
+                os.remove(tmp_opath)
+            raise
+
+        if output_region_file_type == "gebin":
+            writer.close()
+        else:
+            output_handle.close()
+            os.replace(tmp_opath, opath)
+
+        return num_regions
+
+    @staticmethod
+    def load_anno_arr(anno_path, mmap_mode=None):
+        '''
+        Load an annotation array from a npy file or a single-array npz file.
+
+        Keyword arguments:
+        - anno_path: Path to the npy/npz file.
+        - mmap_mode: Memory-map mode passed to np.load (only effective for npy files).
+
+        Returns:
+        - anno_arr: Annotation array.
+        '''
+        anno_arr = np.load(anno_path, mmap_mode=mmap_mode, allow_pickle=False)
+        if hasattr(anno_arr, "files"):
+            keys = list(anno_arr.keys())
+            if len(keys) != 1:
+                raise ValueError(
+                    f"NPZ file {anno_path} contains multiple arrays ({len(keys)}). "
+                    "Please use a single-array npz or npy."
+                )
+            anno_arr = anno_arr[keys[0]]
+
+        return anno_arr
+
+    @staticmethod
+    def check_anno_type(anno_arr, anno_type, anno_path):
+        '''
+        Check that an annotation array has the layout of its annotation type.
+
+        - stat: shape (N,) or (N, 1).
+        - mask: bool array of shape (N,) or (N, 1).
+        - track: shape (N, L).
+        - array: at least 2 dimensions, (N, ...).
+
+        Keyword arguments:
+        - anno_arr: Annotation array (may be memory-mapped).
+        - anno_type: Annotation type (stat, mask, track or array).
+        - anno_path: Path of the annotation file, for error messages.
+        '''
+        is_stat_shape = anno_arr.ndim == 1 or (anno_arr.ndim == 2 and anno_arr.shape[1] == 1)
+        if anno_type == "stat":
+            is_valid = is_stat_shape
+        elif anno_type == "mask":
+            is_valid = is_stat_shape and anno_arr.dtype == bool
+        elif anno_type == "track":
+            is_valid = anno_arr.ndim == 2
+        elif anno_type == "array":
+            is_valid = anno_arr.ndim >= 2
+        else:
+            raise ValueError(f"Invalid annotation type: {anno_type}")
+
+        if not is_valid:
+            raise ValueError(f"Annotation array of shape {anno_arr.shape} and dtype {anno_arr.dtype} "
+                             f"in {anno_path} is not a valid {anno_type} annotation")
+
+    @staticmethod
+    def filter_anno_npy(anno_path, filter_logical, opath, chunk_bytes=1 << 26):
+        '''
+        Save the rows of an annotation array selected by a logical filter. 
+        Rows are streamed in chunks from the memory-mapped input into a 
+        memory-mapped .npy output, so memory use does not grow with the array size.
+
+        Keyword arguments:
+        - anno_path: Path to the annotation npy/npz file.
+        - filter_logical: Boolean array of shape (N,).
+        - opath: Output .npy path.
+        - chunk_bytes: Approximate number of input bytes read at a time.
+
+        Returns:
+        - num_rows: Number of rows written.
+        '''
+        filter_logical = np.asarray(filter_logical, dtype=bool).reshape(-1,)
+        anno_arr = GEUtils.load_anno_arr(anno_path, mmap_mode="r")
+        if anno_arr.ndim == 0 or anno_arr.shape[0] != len(filter_logical):
+            raise ValueError(f"Annotation array shape {anno_arr.shape} in {anno_path} does not match "
+                             f"the number of regions {len(filter_logical)}")
+
+        num_rows = int(filter_logical.sum())
+        output_arr = np.lib.format.open_memmap(opath, 
+                                               mode="w+", 
+                                               dtype=anno_arr.dtype, 
+                                               shape=(num_rows,) + anno_arr.shape[1:], 
+                                               )
+
+        row_bytes = max(anno_arr[:1].nbytes, 1)
+        chunk_size = max(chunk_bytes // row_bytes, 1)
+        output_start = 0
+        for chunk_start in range(0, len(filter_logical), chunk_size):
+            chunk_logical = filter_logical[chunk_start:chunk_start + chunk_size]
+            chunk_arr = anno_arr[chunk_start:chunk_start + chunk_size][chunk_logical]
+            output_arr[output_start:output_start + len(chunk_arr)] = chunk_arr
+            output_start += len(chunk_arr)
+
+        output_arr.flush()
+        del output_arr
+
+        return num_rows
+
+    @staticmethod
+    def is_region_df_sorted(region_df):
+        '''
+        Check if a region table is sorted by chromosome (lexicographic), start and end.
+        '''
+        if len(region_df) < 2:
+            return True
+
+        chrom_arr = region_df["chrom"].to_numpy().astype(str)
+        start_arr = region_df["start"].to_numpy(dtype=np.int64)
+        end_arr = region_df["end"].to_numpy(dtype=np.int64)
+
+        same_chrom_logical = chrom_arr[:-1] == chrom_arr[1:]
+        coord_sorted_logical = (start_arr[:-1] < start_arr[1:]) | \
+            ((start_arr[:-1] == start_arr[1:]) & (end_arr[:-1] <= end_arr[1:]))
+
+        return bool(np.all((chrom_arr[:-1] < chrom_arr[1:]) | (same_chrom_logical & coord_sorted_logical)))
+
+    @staticmethod
+    def get_merge_order(region_df_list, presorted=False):
+        '''
+        Get the order of the concatenated regions of several region tables 
+        sorted by chromosome (lexicographic), start and end. Ties keep the 
+        input order.
+
+        For presorted tables each chromosome is merged from the sorted runs 
+        of the inputs with a stable argsort of packed (start, end) keys, which 
+        detects the runs and merges them in linear time per input instead of 
+        re-sorting the whole table.
+
+        Keyword arguments:
+        - region_df_list: List of region tables.
+        - presorted: Whether every region table is sorted (see is_region_df_sorted).
+
+        Returns:
+        - merge_order: Indices into the concatenated regions, in merged order.
+        '''
+        chrom_arr_list = [region_df["chrom"].to_numpy().astype(str) for region_df in region_df_list]
+        start_arr = np.concatenate([region_df["start"].to_numpy(dtype=np.int64) for region_df in region_df_list])
+        end_arr = np.concatenate([region_df["end"].to_numpy(dtype=np.int64) for region_df in region_df_list])
+        offset_arr = np.cumsum([0] + [len(chrom_arr) for chrom_arr in chrom_arr_list])
+
+        if not presorted:
+            _, chrom_code_arr = np.unique(np.concatenate(chrom_arr_list), return_inverse=True)
+            return np.lexsort((end_arr, start_arr, chrom_code_arr.reshape(-1,)))
+
+        # Each chromosome is one run of a sorted input
+        run_start_arr_list = [np.flatnonzero(np.r_[True, chrom_arr[1:] != chrom_arr[:-1]]) if len(chrom_arr) > 0 
+                              else np.zeros(0, dtype=np.int64)
+                              for chrom_arr in chrom_arr_list]
+        chrom_names = np.unique(np.concatenate([chrom_arr[run_start_arr] 
+                                                for chrom_arr, run_start_arr in zip(chrom_arr_list, run_start_arr_list)]))
+
+        # Region ranges of each chromosome in the concatenated regions, per input
+        chrom_range_list = [[] for _ in chrom_names]
+        for i, (chrom_arr, run_start_arr) in enumerate(zip(chrom_arr_list, run_start_arr_list)):
+            run_end_arr = np.r_[run_start_arr[1:], len(chrom_arr)]
+            for run_start, run_end in zip(run_start_arr, run_end_arr):
+                chrom_code = np.searchsorted(chrom_names, chrom_arr[run_start])
+                chrom_range_list[chrom_code].append((offset_arr[i] + run_start, offset_arr[i] + run_end))
+
+        # Packed keys need coordinates in [0, 2^32)
+        packable = len(start_arr) == 0 or (start_arr.min() >= 0 and end_arr.min() >= 0 and 
+                                           max(start_arr.max(), end_arr.max()) < (1 << 32))
+        if packable:
+            key_arr = (start_arr.astype(np.uint64) << np.uint64(32)) | end_arr.astype(np.uint64)
+
+        merge_order_list = [np.zeros(0, dtype=np.int64)]
+        for chrom_range in chrom_range_list:
+            chrom_idx_arr = np.concatenate([np.arange(range_start, range_end) 
+                                            for range_start, range_end in chrom_range])
+            if len(chrom_range) == 1:
+                chrom_order = np.arange(len(chrom_idx_arr))
+            elif packable:
+                chrom_order = np.argsort(key_arr[chrom_idx_arr], kind="stable")
+            else:
+                chrom_order = np.lexsort((end_arr[chrom_idx_arr], start_arr[chrom_idx_arr]))
+            merge_order_list.append(chrom_idx_arr[chrom_order])
+
+        return np.concatenate(merge_order_list).astype(np.int64)
+
+    @staticmethod
+    def merge_anno_npy(anno_path_list, num_regions_list, merge_order, opath, chunk_bytes=1 << 26):
+        '''
+        Save the concatenated rows of several annotation arrays in merged order. 
+        Output rows are filled in chunks from the memory-mapped inputs into a 
+        memory-mapped .npy output, so memory use does not grow with the array size. 
+        Arrays with shorter trailing dimensions (e.g. tracks padded to a shorter 
+        maximum region length) are zero-padded.
+
+        Keyword arguments:
+        - anno_path_list: Paths to the annotation npy/npz files, one per input.
+        - num_regions_list: Number of regions of each input.
+        - merge_order: Indices into the concatenated rows, in output order (see get_merge_order).
+        - opath: Output .npy path.
+        - chunk_bytes: Approximate number of output bytes filled at a time.
+        '''
+        anno_arr_list = [GEUtils.load_anno_arr(anno_path, mmap_mode="r") for anno_path in anno_path_list]
+        for anno_path, anno_arr, num_regions in zip(anno_path_list, anno_arr_list, num_regions_list):
+            if anno_arr.ndim == 0 or anno_arr.shape[0] != num_regions:
+                raise ValueError(f"Annotation array shape {anno_arr.shape} in {anno_path} does not match "
+                                 f"the number of regions {num_regions}")
+        if len(set(anno_arr.ndim for anno_arr in anno_arr_list)) != 1:
+            raise ValueError(f"Annotation arrays {anno_path_list} have different numbers of dimensions")
+
+        trailing_shape = tuple(int(max(dim_list)) for dim_list in zip(*[anno_arr.shape[1:] for anno_arr in anno_arr_list]))
+        dtype = np.result_type(*[anno_arr.dtype for anno_arr in anno_arr_list])
+        merge_order = np.asarray(merge_order, dtype=np.int64)
+        offset_arr = np.cumsum([0] + list(num_regions_list))
+
+        output_arr = np.lib.format.open_memmap(opath, 
+                                               mode="w+", 
+                                               dtype=dtype, 
+                                               shape=(len(merge_order),) + trailing_shape, 
+                                               )
+
+        row_bytes = max(int(np.prod(trailing_shape, dtype=np.int64)) * dtype.itemsize, 1)
+        chunk_size = max(chunk_bytes // row_bytes, 1)
+        for chunk_start in range(0, len(merge_order), chunk_size):
+            chunk_order = merge_order[chunk_start:chunk_start + chunk_size]
+            input_idx_arr = np.searchsorted(offset_arr, chunk_order, side="right") - 1
+            chunk_arr = np.zeros((len(chunk_order),) + trailing_shape, dtype=dtype)
+            for input_idx, anno_arr in enumerate(anno_arr_list):
+                input_logical = input_idx_arr == input_idx
+                if not input_logical.any():
+                    continue
+                row_idx_arr = chunk_order[input_logical] - offset_arr[input_idx]
+                chunk_arr[(input_logical,) + tuple(slice(0, d) for d in anno_arr.shape[1:])] = anno_arr[row_idx_arr]
+            output_arr[chunk_start:chunk_start + len(chunk_order)] = chunk_arr
+
+        output_arr.flush()
+        del output_arr
+
+    @staticmethod
+    def get_masked_abs_argmax(track_arr, region_len_arr, chunk_size=100000):
+        '''
+        Row-wise argmax of the absolute track values, 
+        only considering positions within each region's length.
+        Regions of length 0 get an argmax of 0.
+
+        Keyword arguments:
+        - track_arr: Padded track array of shape (N, max_region_len). Can be memory-mapped.
+        - region_len_arr: Array of region lengths of shape (N,).
+        - chunk_size: Number of rows processed at a time.
+
+        Returns:
+        - argmax_arr: Array of argmax positions relative to region starts.
+        '''
+        region_len_arr = np.asarray(region_len_arr, dtype=np.int64)
+        if track_arr.shape[0] != len(region_len_arr):
+            raise ValueError(f"Number of tracks ({track_arr.shape[0]}) does not match "
+                             f"number of regions ({len(region_len_arr)})")
+
+        argmax_arr = np.zeros(len(region_len_arr), dtype=np.int64)
+        if track_arr.ndim != 2 or track_arr.shape[1] == 0:
+            return argmax_arr
+
+        pos_arr = np.arange(track_arr.shape[1])
+        for chunk_start in range(0, len(region_len_arr), chunk_size):
+            chunk_end = min(chunk_start + chunk_size, len(region_len_arr))
+            abs_arr = np.abs(np.asarray(track_arr[chunk_start:chunk_end], dtype=np.float64))
+            in_region_logical = pos_arr[None, :] < region_len_arr[chunk_start:chunk_end, None]
+            abs_arr[~in_region_logical] = -np.inf
+            argmax_arr[chunk_start:chunk_end] = np.argmax(abs_arr, axis=1)
+
+        return argmax_arr
+
+    @staticmethod
+    def get_row_percentile(arr, percentile):
+        '''
+        Row-wise percentile of a 2D array with linear interpolation, same as
+        np.percentile(arr, percentile, axis=1), with a single np.partition
+        per row instead of selecting both neighboring ranks.
+
+        Keyword arguments:
+        - arr: (N, L) array with L > 0.
+        - percentile: Percentile in [0, 100].
+
+        Returns:
+        - percentile_arr: Percentile of each row (float64).
+        '''
+        arr = np.asarray(arr, dtype=np.float64)
+        pos = percentile / 100 * (arr.shape[1] - 1)
+        lo = int(np.floor(pos))
+        hi = min(lo + 1, arr.shape[1] - 1)
+
+        partitioned_arr = np.partition(arr, lo, axis=1)
+        lo_arr = partitioned_arr[:, lo]
+        # The next rank is the smallest value right of the partition point
+        hi_arr = partitioned_arr[:, hi:].min(axis=1) if hi > lo else lo_arr
+        percentile_arr = lo_arr + (hi_arr - lo_arr) * (pos - lo)
+        # np.percentile returns NaN for rows with NaN
+        percentile_arr[np.isnan(arr).any(axis=1)] = np.nan
+
+        return percentile_arr
+
+    @staticmethod
+    def get_overlap_pairs(region_df, feature_df):
+        '''
+        Find all (region, feature) pairs of overlapping intervals.
+
+        Features are indexed once per chromosome by their sorted starts, and the
+        candidates of all regions of a chromosome are found with one searchsorted pass.
+
+        Keyword arguments:
+        - region_df: Region table with chrom, start and end columns.
+        - feature_df: Feature table (e.g. polymorphisms) with chrom, start and end columns.
+
+        Returns:
+        - region_idx_arr: Region indices of the pairs.
+        - feature_idx_arr: Feature indices of the pairs.
+            Pairs are sorted by region index, then by feature index (file order).
+        '''
+        region_start_arr = region_df["start"].to_numpy().astype(np.int64)
+        region_end_arr = region_df["end"].to_numpy().astype(np.int64)
+        feature_start_arr = feature_df["start"].to_numpy().astype(np.int64)
+        feature_end_arr = feature_df["end"].to_numpy().astype(np.int64)
+
+        region_chrom_groups = pd.Series(np.arange(len(region_df))).groupby(
+            region_df["chrom"].to_numpy().astype(str)
+        ).indices
+        feature_chrom_groups = pd.Series(np.arange(len(feature_df))).groupby(
+            feature_df["chrom"].to_numpy().astype(str)
+        ).indices
+
+        region_idx_list = [np.zeros(0, dtype=np.int64)]
+        feature_idx_list = [np.zeros(0, dtype=np.int64)]
+        for chrom, region_idx in region_chrom_groups.items():
+            if chrom not in feature_chrom_groups:
+                continue
+            feature_idx = feature_chrom_groups[chrom]
+            feature_order = feature_idx[np.argsort(feature_start_arr[feature_idx], kind="stable")]
+            sorted_start_arr = feature_start_arr[feature_order]
+            # Features overlapping a region start after region_start - max_feature_len.
+            max_feature_len = int(np.max(feature_end_arr[feature_idx] - feature_start_arr[feature_idx]))
+
+            lo_arr = np.searchsorted(sorted_start_arr, region_start_arr[region_idx] - max_feature_len, side="right")
+            hi_arr = np.searchsorted(sorted_start_arr, region_end_arr[region_idx], side="left")
+            count_arr = np.maximum(hi_arr - lo_arr, 0)
+
+            pair_region_idx = np.repeat(region_idx, count_arr)
+            pair_sorted_pos = np.arange(count_arr.sum()) \
+                              - np.repeat(np.cumsum(count_arr) - count_arr, count_arr) \
+                              + np.repeat(lo_arr, count_arr)
+            pair_feature_idx = feature_order[pair_sorted_pos]
+
+            overlap_logical = feature_end_arr[pair_feature_idx] > region_start_arr[pair_region_idx]
+            region_idx_list.append(pair_region_idx[overlap_logical])
+            feature_idx_list.append(pair_feature_idx[overlap_logical])
+
+        region_idx_arr = np.concatenate(region_idx_list).astype(np.int64)
+        feature_idx_arr = np.concatenate(feature_idx_list).astype(np.int64)
+        pair_order = np.lexsort((feature_idx_arr, region_idx_arr))
+
+        return region_idx_arr[pair_order], feature_idx_arr[pair_order]
+
+    @staticmethod
+    def get_coord_ids(chrom_arr, start_arr, end_arr, chrom_sep=":", range_sep="-"):
+        '''
+        Build <chrom><chrom_sep><start><range_sep><end> ids of all regions at once.
+
+        Returns:
+        - id_arr: Array of ids (str).
+        '''
+        id_arr = np.char.add(np.asarray(chrom_arr).astype(str), chrom_sep)
+        id_arr = np.char.add(id_arr, np.asarray(start_arr).astype(np.int64).astype(str))
+        id_arr = np.char.add(id_arr, range_sep)
+        return np.char.add(id_arr, np.asarray(end_arr).astype(np.int64).astype(str))
+
+    @staticmethod
+    def get_region_ids(region_df, region_id_type="default"):
+        '''
+        Build the ids of all regions of a region table at once.
+
+        Keyword arguments:
+        - region_df: Region table.
+        - region_id_type: Type of the region id (default: chrom:start-end, name, gene_symbol).
+
+        Returns:
+        - region_id_arr: Array of region ids (str).
+        '''
+        if region_id_type == "default":
+            return GEUtils.get_coord_ids(region_df["chrom"], region_df["start"], region_df["end"])
+        elif region_id_type in ["name", "gene_symbol"]:
+            if region_id_type not in region_df.columns:
+                raise ValueError(f"{region_id_type} not supported for this region file type.")
+            return region_df[region_id_type].to_numpy().astype(str)
+        else:
+            raise ValueError(f"Invalid region id type: {region_id_type}")
@@ -0,0 +1,325 @@
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+class GEBinWriter:
+    '''
+    Writer of gebin region files. Regions are appended chunk by chunk.
+
+    A gebin region file is a directory containing:
+    - meta.json: number of regions, region file type, column layout and category names.
+    - <column>.bin: raw little-endian column arrays, one per numeric column.
+    - <column>.codes.bin: category codes for categorical columns (chrom, strand).
+    - <column>.offsets.bin and <column>.data.bin: utf-8 string heap for other string columns.
+
+    The files are written to a temporary directory next to opath, which replaces 
+    opath on close. opath must not exist, or be an empty directory or a gebin region file.
+
+    Column kinds are taken from column_types (the region file type's schema) if given,
+    otherwise they are inferred from the first appended chunk. Values that cannot be
+    stored in a numeric column without loss raise a ValueError.
+    '''
+    def __init__(self, opath, region_file_type, column_names, column_types=None):
+        self.__opath = opath
+        self.__region_file_type = region_file_type
+        self.__column_names = list(column_names)
+        self.__column_types = None if column_types is None else list(column_types)
+        self.__num_regions = 0
+        self.__column_meta = None
+        self.__category_dict = {}
+        self.__string_heap_size = {}
+
+        GEBin.check_opath(opath)
+        opath_abs = os.path.abspath(opath)
+        self.__tmp_path = tempfile.mkdtemp(prefix=f".{os.path.basename(opath_abs)}.", 
+                                           dir=os.path.dirname(opath_abs), 
+                                           )
+        # mkdtemp creates the directory as private, outputs get the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self.__tmp_path, 0o777 & ~umask)
+
+    def __get_column_meta(self, region_df):
+        column_meta = {}
+        for i, column_name in enumerate(self.__column_names):
+            if self.__column_types is not None:
+                dtype = None if self.__column_types[i] is str else np.dtype(self.__column_types[i])
+            elif pd.api.types.is_numeric_dtype(region_df[column_name]):
+                dtype = np.dtype(region_df[column_name].dtype)
+            else:
+                dtype = None
+
+            if column_name in GEBin.get_categorical_column_names():
+                column_meta[column_name] = {"kind": "category", "dtype": "<i4"}
+            elif column_name in ["start", "end"]:
+                column_meta[column_name] = {"kind": "numeric", "dtype": "<i8"}
+            elif dtype is not None and dtype.kind in "iuf":
+                column_meta[column_name] = {"kind": "numeric", "dtype": dtype.newbyteorder("<").str}
+            else:
+                column_meta[column_name] = {"kind": "string", "dtype": "<i8"}
+
+        return column_meta
+
+    @staticmethod
+    def __get_numeric_arr(column_ser, dtype):
+        '''
+        Cast a column to the dtype of a numeric gebin column. Strings are parsed.
+        Raises a ValueError if the cast changes any value.
+        '''
+        value_arr = column_ser.to_numpy()
+        if value_arr.dtype.kind in "OSU":
+            try:
+                value_arr = value_arr.astype(str).astype(dtype)
+            except ValueError as e:
+                raise ValueError(f"Column {column_ser.name} cannot be parsed as {np.dtype(dtype).name}: {e}")
+        output_arr = value_arr.astype(dtype)
+        lossy_logical = output_arr != value_arr
+        if output_arr.dtype.kind == "f":
+            # NaN is kept by float columns
+            lossy_logical &= ~np.isnan(output_arr)
+        if lossy_logical.any():
+            raise ValueError(f"Value {value_arr[np.argmax(lossy_logical)]} of column {column_ser.name} "
+                             f"cannot be stored as {np.dtype(dtype).name} without loss")
+
+        return output_arr
+
+    def __append_arr(self, fname, arr):
+        with open(os.path.join(self.__tmp_path, fname), "ab") as handle:
+            np.ascontiguousarray(arr).tofile(handle)
+
+    def append(self, region_df):
+        '''
+        Append a region table to the file.
+        '''
+        if self.__column_meta is None:
+            self.__column_meta = self.__get_column_meta(region_df)
+            for column_name, meta in self.__column_meta.items():
+                if meta["kind"] == "category":
+                    self.__category_dict[column_name] = {}
+                elif meta["kind"] == "string":
+                    self.__string_heap_size[column_name] = 0
+                    self.__append_arr(f"{column_name}.offsets.bin", np.zeros(1, dtype="<i8"))
+
+        for column_name, meta in self.__column_meta.items():
+            if meta["kind"] == "numeric":
+                self.__append_arr(f"{column_name}.bin",
+                                  GEBinWriter.__get_numeric_arr(region_df[column_name], meta["dtype"]),
+                                  )
+
+            elif meta["kind"] == "category":
+                category_dict = self.__category_dict[column_name]
+                uniques, inverse = np.unique(region_df[column_name].to_numpy().astype(str),
+                                             return_inverse=True,
+                                             )
+                unique_codes = np.array([category_dict.setdefault(u, len(category_dict)) for u in uniques],
+                                        dtype="<i4",
+                                        )
+                self.__append_arr(f"{column_name}.codes.bin", unique_codes[inverse.reshape(-1,)])
+
+            else:
+                encoded_list = [v.encode("utf-8") for v in region_df[column_name].astype(str)]
+                len_arr = np.fromiter((len(v) for v in encoded_list), dtype="<i8", count=len(encoded_list))
+                offset_arr = self.__string_heap_size[column_name] + np.cumsum(len_arr)
+                self.__string_heap_size[column_name] = int(offset_arr[-1]) if len(offset_arr) > 0 \
+                                                       else self.__string_heap_size[column_name]
+                self.__append_arr(f"{column_name}.offsets.bin", offset_arr)
+                with open(os.path.join(self.__tmp_path, f"{column_name}.data.bin"), "ab") as handle:
+                    handle.write(b"".join(encoded_list))
+
+        self.__num_regions += len(region_df)
+
+    def close(self):
+        '''
+        Write the meta data. Must be called after the last append.
+        '''
+        if self.__column_meta is None:
+            self.__column_meta = self.__get_column_meta(pd.DataFrame(columns=self.__column_names))
+            for column_name, meta in self.__column_meta.items():
+                if meta["kind"] == "category":
+                    self.__category_dict[column_name] = {}
+                elif meta["kind"] == "string":
+                    self.__append_arr(f"{column_name}.offsets.bin", np.zeros(1, dtype="<i8"))
+
+        for column_name, category_dict in self.__category_dict.items():
+            self.__column_meta[column_name]["categories"] = sorted(category_dict,
+                                                                   key=category_dict.get,
+                                                                   )
+
+        meta_dict = {"format_version": GEBin.get_format_version(),
+                     "region_file_type": self.__region_file_type,
+                     "num_regions": self.__num_regions,
+                     "column_names": self.__column_names,
+                     "columns": self.__column_meta,
+                     }
+        with open(os.path.join(self.__tmp_path, "meta.json"), "w") as handle:
+            json.dump(meta_dict, handle, indent=2)
+
+        # The previous file is only removed once the new one is in place
+        old_path = self.__tmp_path + ".old"
+        if os.path.exists(self.__opath):
+            os.replace(self.__opath, old_path)
+        os.replace(self.__tmp_path, self.__opath)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def abort(self):
+        '''
+        Remove the partially written file. opath is left unchanged.
+        '''
+        shutil.rmtree(self.__tmp_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class GEBin:
+    '''
+    Reader of gebin region files. All columns are memory-mapped.
+    '''
+    def __init__(self, path):
+        self.__path = path
+        with open(os.path.join(path, "meta.json"), "r") as handle:
+            self.__meta = json.load(handle)
+
+        if self.__meta["format_version"] != GEBin.get_format_version():
+            raise ValueError(f"Unsupported gebin format version {self.__meta['format_version']} in {path}")
+
+    @staticmethod
+    def get_format_version():
+        return 1
+
+    @staticmethod
+    def check_opath(opath):
+        '''
+        Check that a gebin region file can be written to opath, which must not exist, 
+        or be an empty directory or a gebin region file.
+        '''
+        if not os.path.exists(opath):
+            return
+        if os.path.isdir(opath) and (len(os.listdir(opath)) == 0 or 
+                                     os.path.isfile(os.path.join(opath, "meta.json"))):
+            return
+        raise ValueError(f"{opath} exists and is not a gebin region file. Refusing to overwrite it.")
+
+    @staticmethod
+    def get_categorical_column_names():
+        return ["chrom", "strand"]
+
+    @staticmethod
+    def write_region_df(region_df, region_file_type, opath):
+        '''
+        Write a region table as a gebin region file.
+
+        Keyword arguments:
+        - region_df: Region table.
+        - region_file_type: Region file type of the table (e.g. bed6), kept for export to text.
+        - opath: Output path of the gebin directory.
+        '''
+        with GEBinWriter(opath, region_file_type, region_df.columns) as writer:
+            writer.append(region_df)
+
+    def __load_bin(self, fname, dtype):
+        fpath = os.path.join(self.__path, fname)
+        if os.path.getsize(fpath) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(fpath, dtype=dtype, mode="r")
+
+    def get_num_regions(self):
+        return self.__meta["num_regions"]
+
+    def get_region_file_type(self):
+        return self.__meta["region_file_type"]
+
+    def get_column_names(self):
+        return list(self.__meta["column_names"])
+
+    def get_column_arr(self, column_name, start=None, end=None):
+        '''
+        Get a column as an array. Numeric columns are returned as
+        memory-mapped arrays, other columns are decoded.
+
+        Keyword arguments:
+        - column_name: Name of the column.
+        - start: First region index (default 0).
+        - end: Region index after the last region (default num_regions).
+
+        Returns:
+        - column_arr: Column array.
+        '''
+        start = 0 if start is None else start
+        end = self.get_num_regions() if end is None else min(end, self.get_num_regions())
+        meta = self.__meta["columns"][column_name]
+
+        if meta["kind"] == "numeric":
+            return self.__load_bin(f"{column_name}.bin", meta["dtype"])[start:end]
+
+        elif meta["kind"] == "category":
+            return self.get_category_names(column_name)[self.get_category_codes(column_name)[start:end]]
+
+        else:
+            offset_arr = np.asarray(self.__load_bin(f"{column_name}.offsets.bin", meta["dtype"])[start:end + 1])
+            data_arr = np.asarray(self.__load_bin(f"{column_name}.data.bin", np.uint8)[offset_arr[0]:offset_arr[-1]])
+            return GEBin.decode_string_heap(data_arr, offset_arr - offset_arr[0])
+
+    @staticmethod
+    def decode_string_heap(data_arr, offset_arr):
+        '''
+        Decode the strings of a utf-8 string heap at once, by scattering the 
+        bytes into a fixed-width bytes array.
+
+        Keyword arguments:
+        - data_arr: uint8 array of the concatenated utf-8 strings.
+        - offset_arr: Start offsets of the strings in data_arr, followed by the total length.
+
+        Returns:
+        - string_arr: Array of the strings (object).
+        '''
+        len_arr = np.diff(offset_arr)
+        max_len = int(len_arr.max()) if len(len_arr) > 0 else 0
+        if max_len == 0:
+            return np.full(len(len_arr), "", dtype=object)
+
+        byte_arr = np.zeros((len(len_arr), max_len), dtype=np.uint8)
+        byte_arr[np.arange(max_len)[None, :] < len_arr[:, None]] = data_arr
+        byte_arr = byte_arr.view(f"S{max_len}").reshape(-1,)
+
+        # ASCII bytes convert directly, others need utf-8 decoding
+        if data_arr.max() < 128:
+            return byte_arr.astype(str).astype(object)
+        return np.char.decode(byte_arr, "utf-8").astype(object)
+
+    def get_category_codes(self, column_name):
+        '''
+        Get the memory-mapped category codes of a categorical column.
+        '''
+        return self.__load_bin(f"{column_name}.codes.bin", self.__meta["columns"][column_name]["dtype"])
+
+    def get_category_names(self, column_name):
+        '''
+        Get the category names of a categorical column, indexed by code.
+        '''
+        return np.array(self.__meta["columns"][column_name]["categories"], dtype=object)
+
+    def get_region_df(self, start=None, end=None):
+        '''
+        Get (a slice of) the regions as a region table.
+        '''
+        return pd.DataFrame({c: self.get_column_arr(c, start, end) for c in self.get_column_names()},
+                            columns=self.get_column_names(),
+                            )
+
+    def iter_region_df_chunks(self, chunk_size):
+        '''
+        Iterate over the regions in chunks of region tables.
+        '''
+        for chunk_start in range(0, self.get_num_regions(), chunk_size):
+            yield self.get_region_df(chunk_start, chunk_start + chunk_size)
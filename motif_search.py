@@ -6,6 +6,9 @@ from RGTools.MemeMotif import MemeMotif
 
 from RGTools.utils import str2bool
 
+from ge_utils import GEUtils
+from fasta_utils import RegionSeqExtractor
+
 class MotifSearch:
     @staticmethod
     def set_parser(parser):
@@ -37,6 +40,8 @@ class MotifSearch:
                             default="+",
                             )
 
+        GEUtils.set_parser_num_workers(parser)
+
     @staticmethod
     def main(args):
         genomic_elements = GenomicElements(region_file_path=args.region_file_path,
@@ -45,7 +50,8 @@ class MotifSearch:
                                            )
         motif_dataset = MemeMotif(args.motif_file)
 
-        seq_list = genomic_elements.get_all_region_seqs()
+        with RegionSeqExtractor(genomic_elements, args.fasta_path, args.num_workers) as seq_extractor:
+            seq_list = seq_extractor.get_all_region_seqs()
 
         for motif in motif_dataset.get_motif_list():
             motif_pwm = motif_dataset.get_motif_pwm(motif)
@@ -3,17 +3,59 @@ import numpy as np
 
 from RGTools.GenomicElements import GenomicElements
 
+from ge_utils import GEUtils
+from fasta_utils import RegionSeqExtractor, ReverseComplement
+from seq_pack import PackedSeqWriter, PackedSeqs
+
 class OneHot:
     @staticmethod
     def main(args):
         genomic_elements = GenomicElements(region_file_path=args.region_file_path,
                                            region_file_type=args.region_file_type,
-                                           fasta_path=args.fasta_path, 
+                                           fasta_path=args.fasta_path,
                                            )
 
-        output_arr = genomic_elements.get_all_region_one_hot()
-        output_arr = output_arr.transpose(0, 2, 1)
-        np.save(args.opath, output_arr)
+        region_df = genomic_elements.get_region_bed_table().to_dataframe()
+        region_len_arr = (region_df["end"] - region_df["start"]).to_numpy()
+        is_length_homogeneous = len(region_len_arr) == 0 or np.all(region_len_arr == region_len_arr[0])
+        seq_len = int(region_len_arr[0]) if len(region_len_arr) > 0 else 0
+        if args.strand_aware:
+            minus_logical = GEUtils.get_minus_strand_mask(region_df)
+
+        if args.oformat == "npy" and not is_length_homogeneous:
+            raise ValueError("npy output only supports elements of the same size. "
+                             f"Got sizes: {np.unique(region_len_arr).tolist()}. "
+                             "Use --oformat packed for variable-length elements.")
+
+        with RegionSeqExtractor(genomic_elements, args.fasta_path, args.num_workers) as seq_extractor:
+            if args.oformat == "packed":
+                with PackedSeqWriter(args.opath, seq_len if is_length_homogeneous else None) as writer:
+                    for chunk_start, chunk_df, seq_list in seq_extractor.iter_region_seq_chunks(region_df, 
+                                                                                                 args.chunk_size):
+                        if args.strand_aware:
+                            seq_list = ReverseComplement.reverse_complement_seqs(
+                                seq_list, minus_logical[chunk_start:chunk_start + len(chunk_df)]
+                            )
+                        code_arr, chunk_len_arr = PackedSeqs.encode_ragged_base_codes(seq_list)
+                        writer.append(code_arr, chunk_len_arr)
+                return
+
+            output_arr = np.lib.format.open_memmap(args.opath,
+                                                   mode="w+",
+                                                   dtype=np.dtype(args.dtype),
+                                                   shape=(len(region_df), seq_len, 4),
+                                                   )
+
+            for chunk_start, chunk_df, seq_list in seq_extractor.iter_region_seq_chunks(region_df, args.chunk_size):
+                chunk_arr = OneHot.encode_seqs(seq_list, args.dtype)
+                if args.strand_aware:
+                    ReverseComplement.reverse_complement_one_hot(chunk_arr,
+                                                                 minus_logical[chunk_start:chunk_start + len(chunk_df)],
+                                                                 )
+                output_arr[chunk_start:chunk_start + len(chunk_df)] = chunk_arr
+
+            output_arr.flush()
+            del output_arr
 
     @staticmethod
     def set_parser(parser):
@@ -25,3 +67,44 @@ class OneHot:
                             type=str,
                             required=True,
                             )
+
+        parser.add_argument("--oformat",
+                            help="Output format. npy: one-hot encoded array of shape (N, L, 4). "
+                                 "packed: directory of 2-bit packed sequences and N-mask, "
+                                 "decoded with seq_pack.PackedSeqs. Supports elements of different sizes.",
+                            type=str,
+                            default="npy",
+                            choices=["npy", "packed"],
+                            )
+
+        parser.add_argument("--dtype",
+                            help="Dtype of the one-hot encoded array (npy output).",
+                            type=str,
+                            default="float64",
+                            choices=["float64", "float32", "float16", "uint8", "bool"],
+                            )
+
+        parser.add_argument("--chunk_size",
+                            help="Number of sequences encoded at a time.",
+                            type=int,
+                            default=10000,
+                            )
+
+        GEUtils.set_parser_num_workers(parser)
+        GEUtils.set_parser_strand_aware(parser)
+
+    @staticmethod
+    def encode_seqs(seq_list, dtype="float64"):
+        '''
+        One-hot encode sequences of the same length.
+
+        Keyword arguments:
+        - seq_list: List of sequences.
+        - dtype: Dtype of the output.
+
+        Returns:
+        - one_hot_arr: Array of shape (num_seqs, seq_len, 4).
+            Channels follow the order of PackedSeqs.get_alphabet(),
+            bases other than A/C/G/T are encoded as all zeros.
+        '''
+        return PackedSeqs.base_codes_to_one_hot(PackedSeqs.encode_base_codes(seq_list), dtype)
@@ -1,14 +1,15 @@
 
-import pandas as pd
+import numpy as np
 
-from RGTools.GenomicElements import GenomicElements
-from RGTools.exceptions import InvalidBedRegionException
+from RGTools.exceptions import InvalidBedRegionException, InvalidStrandnessException
 from RGTools.utils import str2bool
 
+from ge_utils import GEUtils
+
 class PadRegion:
     @staticmethod
     def set_parser(parser):
-        GenomicElements.set_parser_genomic_element_region(parser)
+        GEUtils.set_parser_genomic_element_region(parser)
         parser.add_argument("--upstream_pad",
                             help="Amount to extend to the upstream of the region. "
                                  "Positive value will expand the region and negative value will shrink the region.",
@@ -42,39 +43,150 @@ class PadRegion:
                             choices=["raise", "fallback", "drop"],
                             )
 
+        GEUtils.set_parser_chunk_size(parser)
+
+    @staticmethod
+    def get_padded_coord_arr(start_arr, end_arr, strand_arr, 
+                             upstream_pad, downstream_pad, ignore_strand):
+        '''
+        Pad regions given as coordinate arrays.
+
+        Keyword arguments:
+        - start_arr: Array of region starts.
+        - end_arr: Array of region ends.
+        - strand_arr: Array of region strands (None if the regions are unstranded).
+        - upstream_pad: Amount to extend to the upstream of the region.
+        - downstream_pad: Amount to extend to the downstream of the region.
+        - ignore_strand: If to treat all regions as on the positive strand.
+
+        Returns:
+        - new_start_arr: Array of padded starts.
+        - new_end_arr: Array of padded ends.
+        '''
+        start_arr = np.asarray(start_arr, dtype=np.int64)
+        end_arr = np.asarray(end_arr, dtype=np.int64)
+
+        if ignore_strand:
+            minus_logical = np.zeros(len(start_arr), dtype=bool)
+        else:
+            if strand_arr is None:
+                raise InvalidStrandnessException("Strand information is required when ignore_strand is False.")
+            strand_arr = np.asarray(strand_arr).astype(str)
+            minus_logical = strand_arr == "-"
+            if not np.all(minus_logical | (strand_arr == "+")):
+                raise InvalidStrandnessException("Strand information is required when ignore_strand is False. "
+                                                 f"Got strands: {np.unique(strand_arr).tolist()}")
+
+        new_start_arr = np.where(minus_logical, 
+                                 start_arr - downstream_pad, 
+                                 start_arr - upstream_pad, 
+                                 )
+        new_end_arr = np.where(minus_logical, 
+                               end_arr + upstream_pad, 
+                               end_arr + downstream_pad, 
+                               )
+
+        return new_start_arr, new_end_arr
+
+    @staticmethod
+    def resolve_invalid_region(region_df, new_start_arr, new_end_arr, method_resolving_invalid_region):
+        '''
+        Build the padded region table, resolving regions that are invalid after padding.
+
+        Keyword arguments:
+        - region_df: Region table before padding.
+        - new_start_arr: Array of padded starts.
+        - new_end_arr: Array of padded ends.
+        - method_resolving_invalid_region: Method to resolve invalid region (raise, fallback, drop).
+
+        Returns:
+        - output_df: Padded region table.
+        '''
+        start_arr = region_df["start"].to_numpy(dtype=np.int64)
+        end_arr = region_df["end"].to_numpy(dtype=np.int64)
+        invalid_logical = (new_start_arr < 0) | (new_start_arr >= new_end_arr)
+
+        if method_resolving_invalid_region == "raise":
+            if invalid_logical.any():
+                first_invalid = np.argmax(invalid_logical)
+                raise InvalidBedRegionException(
+                    f"Invalid region after padding: {region_df['chrom'].iloc[first_invalid]}:"
+                    f"{new_start_arr[first_invalid]}-{new_end_arr[first_invalid]}"
+                )
+        elif method_resolving_invalid_region == "fallback":
+            new_start_arr = np.where(invalid_logical, start_arr, new_start_arr)
+            new_end_arr = np.where(invalid_logical, end_arr, new_end_arr)
+        elif method_resolving_invalid_region != "drop":
+            raise ValueError(f"Unknown method to resolve invalid region: {method_resolving_invalid_region}")
+
+        output_df = region_df.copy()
+        output_df["start"] = new_start_arr
+        output_df["end"] = new_end_arr
+
+        if method_resolving_invalid_region == "drop":
+            output_df = output_df.loc[~invalid_logical].reset_index(drop=True)
+
+        return output_df
+
+    @staticmethod
+    def pad_region_df(region_df, upstream_pad, downstream_pad, 
+                      ignore_strand, method_resolving_invalid_region):
+        '''
+        Pad all regions of a region table.
+
+        Keyword arguments:
+        - region_df: Region table.
+        - upstream_pad: Amount to extend to the upstream of the region.
+        - downstream_pad: Amount to extend to the downstream of the region.
+        - ignore_strand: If to treat all regions as on the positive strand.
+        - method_resolving_invalid_region: Method to resolve invalid region (raise, fallback, drop).
+
+        Returns:
+        - output_df: Padded region table.
+        '''
+        new_start_arr, new_end_arr = PadRegion.get_padded_coord_arr(
+            region_df["start"].to_numpy(dtype=np.int64), 
+            region_df["end"].to_numpy(dtype=np.int64), 
+            region_df["strand"].to_numpy() if "strand" in region_df.columns else None, 
+            upstream_pad, 
+            downstream_pad, 
+            ignore_strand, 
+        )
+
+        return PadRegion.resolve_invalid_region(region_df, 
+                                                new_start_arr, 
+                                                new_end_arr, 
+                                                method_resolving_invalid_region, 
+                                                )
+
     @staticmethod
     def main(args):
-        genomic_elements = GenomicElements(region_file_path=args.region_file_path,
-                                           region_file_type=args.region_file_type,
-                                           fasta_path=None, 
-                                           )
-        
-        region_bt = genomic_elements.get_region_bed_table()
-
-        output_dict_list = []
-
-        for i, region in enumerate(region_bt.iter_regions()):
-            try:
-                new_region = region.pad_region(upstream_padding=args.upstream_pad,
-                                               downstream_padding=args.downstream_pad,
-                                               ignore_strand=args.ignore_strand,
-                                               )
-            except InvalidBedRegionException as e:
-                if args.method_resolving_invalid_region == "raise":
-                    raise e
-                elif args.method_resolving_invalid_region == "fallback":
-                    new_region = region
-                elif args.method_resolving_invalid_region == "drop":
-                    continue
-                else:
-                    raise ValueError(f"Unknown method to resolve invalid region: {args.method_resolving_invalid_region}")
-
-            output_dict_list.append(new_region.to_dict())
-        
-        output_region_bt = region_bt._clone_empty()
-        output_region_bt.load_from_dataframe(pd.DataFrame(output_dict_list,
-                                                          columns=region_bt.column_names,
-                                                          ))
-            
-        output_region_bt.write(args.opath)
+        if args.chunk_size is not None:
+            GEUtils.stream_region_transform(args.region_file_path, 
+                                            args.region_file_type, 
+                                            args.opath, 
+                                            args.chunk_size, 
+                                            lambda region_df, chunk_offset: PadRegion.pad_region_df(
+                                                region_df, 
+                                                args.upstream_pad, 
+                                                args.downstream_pad, 
+                                                args.ignore_strand, 
+                                                args.method_resolving_invalid_region, 
+                                            ), 
+                                            )
+            return
+
+        region_df = GEUtils.read_region_df(args.region_file_path, args.region_file_type)
+
+        output_df = PadRegion.pad_region_df(region_df, 
+                                            args.upstream_pad, 
+                                            args.downstream_pad, 
+                                            args.ignore_strand, 
+                                            args.method_resolving_invalid_region, 
+                                            )
 
+        GEUtils.write_region_df(output_df, 
+                                args.opath, 
+                                args.region_file_type, 
+                                GEUtils.get_base_region_file_type(args.region_file_path, args.region_file_type), 
+                                )
@@ -0,0 +1,269 @@
+
+from RGTools.BwTrack import SingleBwTrack, PairedBwTrack
+from RGTools.utils import str2bool
+
+from pad_region import PadRegion
+from bed2tss_bed import Bed2TssBed
+from count_bw import CountSingleBw, CountPairedBw
+from ge_utils import GEUtils
+
+class Pipeline:
+    @staticmethod
+    def set_parser(parser):
+        GEUtils.set_parser_genomic_element_region(parser)
+
+        parser.add_argument("--transform",
+                            help="Region transform to apply, in order. Use multiple times. "
+                                 "Valid transforms: {}.".format(", ".join(Pipeline.get_transform_help_list())),
+                            action="append",
+                            default=[],
+                            type=str,
+                            )
+
+        parser.add_argument("--ignore_strand",
+                            help="Ignore the strand information for pad transforms.",
+                            default=False,
+                            type=str2bool,
+                            )
+
+        parser.add_argument("--method_resolving_invalid_region",
+                            help="Method to resolve invalid region after pad transforms.",
+                            type=str,
+                            default="fallback",
+                            choices=["raise", "fallback", "drop"],
+                            )
+
+        parser.add_argument("--intermediate_oheader",
+                            help="If given, write the region file after each transform "
+                                 "as <intermediate_oheader>.<step>.<region_file_type>.",
+                            type=str,
+                            default=None,
+                            )
+
+        parser.add_argument("--region_opath",
+                            help="Output path for the transformed region file. "
+                                 "Required for the region terminal, optional for counting terminals.",
+                            type=str,
+                            default=None,
+                            )
+
+        parser.add_argument("--terminal",
+                            help="Terminal step run on the transformed regions. [region] ({})".format(
+                                ", ".join(Pipeline.get_terminal_types()),
+                            ),
+                            type=str,
+                            default="region",
+                            choices=Pipeline.get_terminal_types(),
+                            )
+
+        parser.add_argument("--bw_path",
+                            help="Bigwig file path (count_single_bw). Use multiple times to "
+                                 "count several bigwig files on the same regions.",
+                            action="append",
+                            default=[],
+                            type=str,
+                            )
+
+        parser.add_argument("--bw_pl",
+                            help="Plus strand bigwig file (count_paired_bw).",
+                            type=str,
+                            default=None,
+                            )
+
+        parser.add_argument("--bw_mn",
+                            help="Minus strand bigwig file (count_paired_bw).",
+                            type=str,
+                            default=None,
+                            )
+
+        parser.add_argument("--override_strand",
+                            help="Override the strand information (count_paired_bw, None if use the region strand info).",
+                            type=str,
+                            default=None,
+                            )
+
+        parser.add_argument("--negative_mn",
+                            help="Whether to output the minus strand signal as negative (count_paired_bw).",
+                            type=str2bool,
+                            default=False,
+                            )
+
+        parser.add_argument("--flip_mn",
+                            help="If to flip the minus strand signal (count_paired_bw).",
+                            type=str2bool,
+                            default=False,
+                            )
+
+        parser.add_argument("--quantification_type",
+                            help="Type of quantification for counting terminals.",
+                            type=str,
+                            default="raw_count",
+                            )
+
+        parser.add_argument("--count_opath",
+                            help="Output path for counting terminals. Use once per --bw_path "
+                                 "(count_single_bw) or once (count_paired_bw).",
+                            action="append",
+                            default=[],
+                            type=str,
+                            )
+
+    @staticmethod
+    def get_transform_help_list():
+        return ["TSS",
+                "center",
+                "pad:<upstream_pad>:<downstream_pad>",
+                "chrom_filter:<chrom_size_path>",
+                "mask:<mask_npy>",
+                ]
+
+    @staticmethod
+    def get_terminal_types():
+        return ["region", "count_single_bw", "count_paired_bw"]
+
+    @staticmethod
+    def parse_transform(transform_str):
+        '''
+        Parse a transform string into its name and parameters.
+
+        Keyword arguments:
+        - transform_str: Transform string, e.g. "pad:500:499".
+
+        Returns:
+        - transform_name: Name of the transform.
+        - transform_params: List of parameter strings.
+        '''
+        transform_name, *transform_params = transform_str.split(":")
+
+        num_params_dict = {"TSS": 0,
+                           "center": 0,
+                           "pad": 2,
+                           "chrom_filter": 1,
+                           "mask": 1,
+                           }
+        if transform_name not in num_params_dict:
+            raise ValueError(f"Unknown transform: {transform_str}")
+        if len(transform_params) != num_params_dict[transform_name]:
+            raise ValueError(f"Transform {transform_name} expects {num_params_dict[transform_name]} "
+                             f"parameters, got {len(transform_params)}: {transform_str}")
+
+        return transform_name, transform_params
+
+    @staticmethod
+    def apply_transform(region_df, transform_str, ignore_strand, method_resolving_invalid_region):
+        '''
+        Apply one transform to a region table.
+
+        Keyword arguments:
+        - region_df: Region table as a DataFrame.
+        - transform_str: Transform string.
+        - ignore_strand: Ignore the strand information for pad transforms.
+        - method_resolving_invalid_region: Method to resolve invalid region after pad transforms.
+
+        Returns:
+        - output_df: Transformed region table.
+        '''
+        transform_name, transform_params = Pipeline.parse_transform(transform_str)
+
+        output_df = region_df.copy()
+
+        if transform_name in ["TSS", "center"]:
+            output_df = Bed2TssBed.get_output_site_df(region_df, transform_name)
+
+        elif transform_name == "pad":
+            output_df = PadRegion.pad_region_df(region_df,
+                                                int(transform_params[0]),
+                                                int(transform_params[1]),
+                                                ignore_strand,
+                                                method_resolving_invalid_region,
+                                                )
+
+        elif transform_name == "chrom_filter":
+            output_df = output_df.loc[GEUtils.get_chrom_filter_logical(output_df["chrom"].to_numpy(),
+                                                                       GEUtils.load_chrom_size_chroms(transform_params[0]),
+                                                                       )]
+
+        elif transform_name == "mask":
+            mask_arr = GEUtils.load_anno_arr(transform_params[0]).reshape(-1,).astype(bool)
+            if len(mask_arr) != len(region_df):
+                raise ValueError(f"Mask length ({len(mask_arr)}) in {transform_params[0]} does not match "
+                                 f"number of regions ({len(region_df)}) at transform {transform_str}")
+            output_df = output_df.loc[mask_arr]
+
+        return output_df.reset_index(drop=True)
+
+    @staticmethod
+    def main(args):
+        if args.terminal == "count_single_bw":
+            if len(args.bw_path) == 0 or len(args.bw_path) != len(args.count_opath):
+                raise ValueError(f"Number of --bw_path ({len(args.bw_path)}) must be positive and match "
+                                 f"number of --count_opath ({len(args.count_opath)}).")
+        elif args.terminal == "count_paired_bw":
+            if args.bw_pl is None or args.bw_mn is None or len(args.count_opath) != 1:
+                raise ValueError("count_paired_bw terminal requires --bw_pl, --bw_mn and one --count_opath.")
+        elif args.region_opath is None:
+            raise ValueError("region terminal requires --region_opath.")
+
+        base_region_file_type = GEUtils.get_base_region_file_type(args.region_file_path, args.region_file_type)
+        region_df = GEUtils.read_region_df(args.region_file_path, args.region_file_type)
+
+        for step, transform_str in enumerate(args.transform):
+            region_df = Pipeline.apply_transform(region_df,
+                                                 transform_str,
+                                                 args.ignore_strand,
+                                                 args.method_resolving_invalid_region,
+                                                 )
+            if args.intermediate_oheader is not None:
+                GEUtils.write_region_df(region_df,
+                                        f"{args.intermediate_oheader}.{step}.{args.region_file_type}",
+                                        args.region_file_type,
+                                        base_region_file_type,
+                                        )
+
+        if args.region_opath is not None:
+            GEUtils.write_region_df(region_df,
+                                    args.region_opath,
+                                    args.region_file_type,
+                                    base_region_file_type,
+                                    )
+
+        if args.terminal == "region":
+            return
+
+        Pipeline.run_count_terminal(args, region_df, base_region_file_type)
+
+    @staticmethod
+    def run_count_terminal(args, region_df, base_region_file_type):
+        '''
+        Count the bigwig signal of the transformed regions and save the counts.
+        The regions are counted from the in-memory region table; no region file is needed.
+        '''
+        regions = region_df.to_dict("records")
+
+        if args.terminal == "count_single_bw":
+            for bw_path, count_opath in zip(args.bw_path, args.count_opath):
+                output_list = CountSingleBw.count_regions(SingleBwTrack(bw_path=bw_path),
+                                                          regions,
+                                                          args.quantification_type,
+                                                          )
+                CountSingleBw.save_count(output_list,
+                                         args.quantification_type,
+                                         count_opath,
+                                         )
+        elif args.terminal == "count_paired_bw":
+            output_list = CountPairedBw.count_regions(PairedBwTrack(bw_pl_path=args.bw_pl,
+                                                                    bw_mn_path=args.bw_mn,
+                                                                    ),
+                                                      regions,
+                                                      base_region_file_type,
+                                                      args.override_strand,
+                                                      args.quantification_type,
+                                                      args.flip_mn,
+                                                      args.negative_mn,
+                                                      )
+            CountSingleBw.save_count(output_list,
+                                     args.quantification_type,
+                                     args.count_opath[0],
+                                     )
+        else:
+            raise ValueError(f"Unknown terminal: {args.terminal}")
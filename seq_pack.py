@@ -0,0 +1,407 @@
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+class PackedSeqWriter:
+    '''
+    Writer of packed sequence files. Sequences are appended chunk by chunk.
+
+    A packed sequence file is a directory containing:
+    - meta.json: number of sequences and sequence length (null for variable-length sequences).
+    - seq.bin: 2-bit base codes (A=0, C=1, G=2, T=3) of all sequences concatenated,
+        4 bases per byte, first base in the lowest bits.
+    - nmask.bin: np.packbits bit mask of the bases other than A/C/G/T (stored as A in seq.bin).
+    - offsets.bin: int64 start positions of the sequences in the concatenated sequence,
+        followed by the total length. Only for variable-length sequences.
+
+    The files are written to a temporary directory next to opath, which replaces 
+    opath on close. opath must not exist, or be an empty directory or a packed sequence file.
+    '''
+    def __init__(self, opath, seq_len=None):
+        self.__opath = opath
+        self.__seq_len = seq_len
+        self.__num_seqs = 0
+        self.__num_bases = 0
+        self.__carry_arr = np.zeros(0, dtype=np.uint8)
+
+        if os.path.exists(opath) and not (os.path.isdir(opath) and 
+                                          (len(os.listdir(opath)) == 0 or 
+                                           os.path.isfile(os.path.join(opath, "meta.json")))):
+            raise ValueError(f"{opath} exists and is not a packed sequence file. Refusing to overwrite it.")
+
+        opath_abs = os.path.abspath(opath)
+        self.__tmp_path = tempfile.mkdtemp(prefix=f".{os.path.basename(opath_abs)}.", 
+                                           dir=os.path.dirname(opath_abs), 
+                                           )
+        # mkdtemp creates the directory as private, outputs get the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self.__tmp_path, 0o777 & ~umask)
+        for fname in ["seq.bin", "nmask.bin"]:
+            open(os.path.join(self.__tmp_path, fname), "wb").close()
+        if seq_len is None:
+            self.__append_offsets(np.zeros(1, dtype="<i8"))
+
+    def __append_offsets(self, offset_arr):
+        with open(os.path.join(self.__tmp_path, "offsets.bin"), "ab") as handle:
+            offset_arr.astype("<i8").tofile(handle)
+
+    def __write_codes(self, code_arr):
+        with open(os.path.join(self.__tmp_path, "seq.bin"), "ab") as handle:
+            PackedSeqs.pack_base_codes(code_arr).tofile(handle)
+        with open(os.path.join(self.__tmp_path, "nmask.bin"), "ab") as handle:
+            np.packbits(code_arr >= len(PackedSeqs.get_alphabet())).tofile(handle)
+
+    def append(self, code_arr, seq_len_arr=None):
+        '''
+        Append sequences to the file.
+
+        Keyword arguments:
+        - code_arr: Base codes (see PackedSeqs.encode_base_codes) of shape (num_seqs, seq_len),
+            or concatenated base codes of variable-length sequences (see PackedSeqs.encode_ragged_base_codes).
+        - seq_len_arr: Lengths of the concatenated sequences. Only for variable-length sequences.
+        '''
+        if seq_len_arr is None:
+            if code_arr.ndim != 2:
+                raise ValueError(f"Expected base codes of shape (num_seqs, seq_len), got {code_arr.shape}")
+            seq_len_arr = np.full(code_arr.shape[0], code_arr.shape[1], dtype=np.int64)
+            code_arr = code_arr.reshape(-1,)
+
+        seq_len_arr = np.asarray(seq_len_arr, dtype=np.int64)
+        if seq_len_arr.sum() != len(code_arr):
+            raise ValueError(f"Sum of sequence lengths ({seq_len_arr.sum()}) does not match "
+                             f"number of bases ({len(code_arr)})")
+
+        if self.__seq_len is None:
+            self.__append_offsets(self.__num_bases + np.cumsum(seq_len_arr))
+        elif np.any(seq_len_arr != self.__seq_len):
+            raise ValueError(f"Expected sequences of length {self.__seq_len}. "
+                             "Use seq_len=None for variable-length sequences.")
+
+        self.__num_seqs += len(seq_len_arr)
+        self.__num_bases += len(code_arr)
+
+        # Bases are written 8 at a time so that seq.bin and nmask.bin stay byte aligned across chunks.
+        code_arr = np.concatenate([self.__carry_arr, code_arr])
+        num_aligned_bases = len(code_arr) // 8 * 8
+        self.__write_codes(code_arr[:num_aligned_bases])
+        self.__carry_arr = code_arr[num_aligned_bases:]
+
+    def close(self):
+        '''
+        Write the remaining bases and the meta data. Must be called after the last append.
+        '''
+        if len(self.__carry_arr) > 0:
+            self.__write_codes(self.__carry_arr)
+            self.__carry_arr = np.zeros(0, dtype=np.uint8)
+
+        meta_dict = {"format_version": PackedSeqs.get_format_version(),
+                     "alphabet": PackedSeqs.get_alphabet(),
+                     "num_seqs": self.__num_seqs,
+                     "seq_len": self.__seq_len,
+                     }
+        with open(os.path.join(self.__tmp_path, "meta.json"), "w") as handle:
+            json.dump(meta_dict, handle, indent=2)
+
+        # The previous file is only removed once the new one is in place
+        old_path = self.__tmp_path + ".old"
+        if os.path.exists(self.__opath):
+            os.replace(self.__opath, old_path)
+        os.replace(self.__tmp_path, self.__opath)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def abort(self):
+        '''
+        Remove the partially written file. opath is left unchanged.
+        '''
+        shutil.rmtree(self.__tmp_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class PackedSeqs:
+    '''
+    Reader of packed sequence files. The files are memory-mapped and
+    only the requested sequences are decoded. Sequences of variable length
+    are located by their offsets in the concatenated sequence.
+
+    Only depends on NumPy so it can be copied into training code as is.
+    '''
+    def __init__(self, path):
+        self.__path = path
+        with open(os.path.join(path, "meta.json"), "r") as handle:
+            self.__meta = json.load(handle)
+
+        if self.__meta["format_version"] != PackedSeqs.get_format_version():
+            raise ValueError(f"Unsupported packed sequence format version {self.__meta['format_version']} in {path}")
+
+        self.__seq_arr = self.__load_bin("seq.bin", np.uint8)
+        self.__nmask_arr = self.__load_bin("nmask.bin", np.uint8)
+        if self.get_seq_len() is None:
+            self.__offset_arr = self.__load_bin("offsets.bin", "<i8")
+        else:
+            self.__offset_arr = np.arange(self.get_num_seqs() + 1, dtype=np.int64) * self.get_seq_len()
+
+    @staticmethod
+    def get_format_version():
+        return 1
+
+    @staticmethod
+    def get_alphabet():
+        return "ACGT"
+
+    @staticmethod
+    def get_base_code_lut():
+        '''
+        Lookup table from ASCII code to base code.
+        A/C/G/T (either case) map to 0-3, everything else to 4.
+        '''
+        lut = np.full(256, len(PackedSeqs.get_alphabet()), dtype=np.uint8)
+        for i, base in enumerate(PackedSeqs.get_alphabet()):
+            lut[ord(base)] = i
+            lut[ord(base.lower())] = i
+        return lut
+
+    @staticmethod
+    def encode_base_codes(seq_list):
+        '''
+        Encode sequences of the same length as base codes.
+
+        Keyword arguments:
+        - seq_list: List of sequences.
+
+        Returns:
+        - code_arr: uint8 array of shape (num_seqs, seq_len).
+            A/C/G/T are encoded as 0-3, other bases as 4.
+        '''
+        seq_len = len(seq_list[0]) if len(seq_list) > 0 else 0
+        seq_buffer = np.frombuffer("".join(seq_list).encode("ascii"), dtype=np.uint8)
+        if len(seq_buffer) != len(seq_list) * seq_len:
+            raise ValueError("All sequences must be of the same length.")
+
+        return PackedSeqs.get_base_code_lut()[seq_buffer].reshape(len(seq_list), seq_len)
+
+    @staticmethod
+    def encode_ragged_base_codes(seq_list):
+        '''
+        Encode sequences of any length as concatenated base codes.
+
+        Keyword arguments:
+        - seq_list: List of sequences.
+
+        Returns:
+        - code_arr: 1D uint8 array of the concatenated base codes.
+        - seq_len_arr: int64 array of the sequence lengths.
+        '''
+        seq_len_arr = np.fromiter((len(seq) for seq in seq_list), dtype=np.int64, count=len(seq_list))
+        seq_buffer = np.frombuffer("".join(seq_list).encode("ascii"), dtype=np.uint8)
+
+        return PackedSeqs.get_base_code_lut()[seq_buffer], seq_len_arr
+
+    @staticmethod
+    def base_codes_to_one_hot(code_arr, dtype="float64"):
+        '''
+        One-hot encode base codes along a new last axis. Base codes
+        other than 0-3 are encoded as all zeros.
+        '''
+        alphabet_size = len(PackedSeqs.get_alphabet())
+        return (code_arr[..., None] == np.arange(alphabet_size, dtype=np.uint8)).astype(dtype)
+
+    @staticmethod
+    def pack_base_codes(code_arr):
+        '''
+        Pack a 1D array of base codes into 2-bit codes, 4 bases per byte.
+        Base codes other than 0-3 are packed as 0.
+        '''
+        code_arr = np.where(code_arr < 4, code_arr, 0).astype(np.uint8)
+        code_arr = np.concatenate([code_arr, np.zeros((-len(code_arr)) % 4, dtype=np.uint8)]).reshape(-1, 4)
+        return code_arr[:, 0] | (code_arr[:, 1] << 2) | (code_arr[:, 2] << 4) | (code_arr[:, 3] << 6)
+
+    def __load_bin(self, fname, dtype):
+        fpath = os.path.join(self.__path, fname)
+        if os.path.getsize(fpath) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(fpath, dtype=dtype, mode="r")
+
+    def get_num_seqs(self):
+        return self.__meta["num_seqs"]
+
+    def get_seq_len(self):
+        '''
+        Get the sequence length. None for variable-length sequences.
+        '''
+        return self.__meta["seq_len"]
+
+    def get_seq_offset_arr(self):
+        '''
+        Get the start positions of the sequences in the concatenated sequence,
+        followed by the total length. Memory-mapped for variable-length sequences.
+        '''
+        return self.__offset_arr
+
+    def get_seq_len_arr(self):
+        return np.diff(self.__offset_arr)
+
+    def get_base_codes(self, pos_arr):
+        '''
+        Decode the bases at positions of the concatenated sequence.
+
+        Keyword arguments:
+        - pos_arr: Integer array of positions.
+
+        Returns:
+        - code_arr: uint8 array of the same shape as pos_arr. A/C/G/T are 0-3, other bases are 4.
+        '''
+        pos_arr = np.asarray(pos_arr, dtype=np.int64)
+        code_arr = (self.__seq_arr[pos_arr >> 2] >> ((pos_arr & 3) << 1).astype(np.uint8)) & 3
+        nmask_arr = (self.__nmask_arr[pos_arr >> 3] >> (7 - (pos_arr & 7)).astype(np.uint8)) & 1
+
+        return np.where(nmask_arr == 1, len(PackedSeqs.get_alphabet()), code_arr).astype(np.uint8)
+
+    def get_seq_base_codes(self, seq_index):
+        '''
+        Decode one sequence as base codes. Only the bytes of the sequence are read.
+        '''
+        if seq_index < 0 or seq_index >= self.get_num_seqs():
+            raise IndexError(f"Sequence index {seq_index} out of range [0, {self.get_num_seqs()})")
+
+        return self.get_base_codes(np.arange(self.__offset_arr[seq_index],
+                                             self.__offset_arr[seq_index + 1],
+                                             dtype=np.int64,
+                                             ))
+
+    def get_packed(self, seq_index):
+        '''
+        Get the packed bytes of one sequence without decoding or copying them.
+
+        Both byte views start at the same 8-base boundary, so base k of the sequence is at
+        position q = base_offset + k of the views: its 2-bit code is 
+        (seq_bytes[q >> 2] >> ((q & 3) << 1)) & 3 and it is a non-ACGT base if
+        (nmask_bytes[q >> 3] >> (7 - (q & 7))) & 1 is 1.
+
+        Returns:
+        - seq_bytes: Memory-mapped uint8 view of the 2-bit packed bases (seq.bin).
+        - nmask_bytes: Memory-mapped uint8 view of the non-ACGT bit mask (nmask.bin).
+        - base_offset: Position of the first base of the sequence in the views (0-7).
+        - seq_len: Length of the sequence.
+        '''
+        if seq_index < 0 or seq_index >= self.get_num_seqs():
+            raise IndexError(f"Sequence index {seq_index} out of range [0, {self.get_num_seqs()})")
+
+        start = int(self.__offset_arr[seq_index])
+        end = int(self.__offset_arr[seq_index + 1])
+        block_start = start >> 3
+
+        return self.__seq_arr[block_start * 2:(end + 3) >> 2], \
+               self.__nmask_arr[block_start:(end + 7) >> 3], \
+               start & 7, \
+               end - start
+
+    def get_batch_base_codes(self, seq_indices, pad_len=None):
+        '''
+        Decode a batch of sequences as base codes. Sequences shorter than
+        the output are padded at the end with code 4 (all zeros in one-hot).
+
+        Keyword arguments:
+        - seq_indices: Indices of the sequences.
+        - pad_len: Length of the output. Default: sequence length, or longest sequence in the batch
+            for variable-length sequences.
+
+        Returns:
+        - code_arr: uint8 array of shape (batch_size, pad_len).
+        '''
+        seq_indices = np.asarray(seq_indices, dtype=np.int64).reshape(-1,)
+        if np.any((seq_indices < 0) | (seq_indices >= self.get_num_seqs())):
+            raise IndexError(f"Sequence indices out of range [0, {self.get_num_seqs()})")
+
+        start_arr = self.__offset_arr[seq_indices]
+        seq_len_arr = self.__offset_arr[seq_indices + 1] - start_arr
+        if pad_len is None and self.get_seq_len() is not None:
+            pad_len = self.get_seq_len()
+        elif pad_len is None:
+            pad_len = int(seq_len_arr.max()) if len(seq_len_arr) > 0 else 0
+        elif len(seq_len_arr) > 0 and seq_len_arr.max() > pad_len:
+            raise ValueError(f"pad_len ({pad_len}) is shorter than the longest sequence ({seq_len_arr.max()})")
+
+        rel_pos_arr = np.arange(pad_len, dtype=np.int64)
+        valid_mask = rel_pos_arr[None, :] < seq_len_arr[:, None]
+        code_arr = np.full((len(seq_indices), pad_len), len(PackedSeqs.get_alphabet()), dtype=np.uint8)
+        code_arr[valid_mask] = self.get_base_codes((start_arr[:, None] + rel_pos_arr[None, :])[valid_mask])
+
+        return code_arr
+
+    def get_batch_one_hot(self, seq_indices, dtype="float32", pad_len=None):
+        '''
+        Decode a batch of sequences as one-hot encoded array.
+
+        Keyword arguments:
+        - seq_indices: Indices of the sequences.
+        - dtype: Dtype of the output.
+        - pad_len: Length of the output. Default: sequence length, or longest sequence in the batch
+            for variable-length sequences.
+
+        Returns:
+        - one_hot_arr: Array of shape (batch_size, pad_len, 4), same layout as the onehot npy output.
+            Padding positions are all zeros.
+        '''
+        return PackedSeqs.base_codes_to_one_hot(self.get_batch_base_codes(seq_indices, pad_len), dtype)
+
+    def iter_batch_one_hot(self, batch_size, dtype="float32"):
+        '''
+        Iterate over all sequences in order in one-hot encoded batches.
+        '''
+        for batch_start in range(0, self.get_num_seqs(), batch_size):
+            yield self.get_batch_one_hot(np.arange(batch_start, min(batch_start + batch_size, self.get_num_seqs())),
+                                         dtype,
+                                         )
+
+    def get_length_bucket_batches(self, batch_size, shuffle=False, seed=None):
+        '''
+        Group the sequences into batches of similar length so that padding
+        each batch to its longest sequence wastes little space.
+
+        Keyword arguments:
+        - batch_size: Number of sequences per batch.
+        - shuffle: If True, shuffle sequences of the same length and the order of the batches.
+        - seed: Random seed for shuffling.
+
+        Returns:
+        - batch_list: List of sequence index arrays.
+        '''
+        seq_len_arr = self.get_seq_len_arr()
+        if shuffle:
+            rng = np.random.default_rng(seed)
+            # Random tie-breaking within the same length, then a stable sort by length.
+            perm_arr = rng.permutation(len(seq_len_arr))
+            sorted_indices = perm_arr[np.argsort(seq_len_arr[perm_arr], kind="stable")]
+        else:
+            sorted_indices = np.argsort(seq_len_arr, kind="stable")
+
+        batch_list = [sorted_indices[i:i + batch_size] for i in range(0, len(sorted_indices), batch_size)]
+        if shuffle:
+            batch_list = [batch_list[i] for i in rng.permutation(len(batch_list))]
+
+        return batch_list
+
+    def iter_bucketed_batch_one_hot(self, batch_size, dtype="float32", shuffle=False, seed=None):
+        '''
+        Iterate over length-bucketed batches (see get_length_bucket_batches).
+
+        Yields:
+        - seq_indices: Indices of the sequences in the batch.
+        - one_hot_arr: One-hot encoded batch, padded to its longest sequence.
+        - seq_len_arr: Lengths of the sequences in the batch.
+        '''
+        seq_len_arr = self.get_seq_len_arr()
+        for seq_indices in self.get_length_bucket_batches(batch_size, shuffle, seed):
+            yield seq_indices, self.get_batch_one_hot(seq_indices, dtype), seq_len_arr[seq_indices]
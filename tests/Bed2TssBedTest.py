@@ -4,6 +4,8 @@ import argparse
 import shutil
 import os
 
+import numpy as np
+
 from RGTools.GenomicElements import GenomicElements
 from RGTools.BedTable import BedTable6
 
@@ -35,6 +37,7 @@ class Bed2TssBedTest(unittest.TestCase):
         args.region_file_type = "bed6"
         args.opath = os.path.join(self._test_path, "bed2tssbed_output.bed6")
         args.output_site = "TSS"
+        args.chunk_size = None
 
         return args
     
@@ -67,3 +70,26 @@ class Bed2TssBedTest(unittest.TestCase):
         self.assertEqual(out_bt.get_end_locs()[0], 75279326)
         self.assertEqual(out_bt.get_region_extra_column("gene_symbol")[0], "gene2")
 
+    def test_get_output_site_coord_arr(self):
+        start_arr = np.array([100, 100, 200])
+        end_arr = np.array([200, 200, 301])
+        strand_arr = np.array(["+", "-", "+"])
+
+        tss_arr = Bed2TssBed.get_output_site_coord_arr(start_arr, end_arr, strand_arr, "TSS")
+        np.testing.assert_array_equal(tss_arr, np.array([100, 199, 200]))
+
+        center_arr = Bed2TssBed.get_output_site_coord_arr(start_arr, end_arr, None, "center")
+        np.testing.assert_array_equal(center_arr, np.array([150, 150, 250]))
+
+    def test_bed2tssbed_chunked(self):
+        args = self.get_bed2tssbed_simple_args()
+        args.chunk_size = 2
+
+        Bed2TssBed.main(args)
+
+        output_bt = BedTable6(enable_sort=False)
+        output_bt.load_from_file(args.opath)
+
+        self.assertEqual(len(output_bt), 3)
+        np.testing.assert_array_equal(output_bt.get_start_locs(), np.array([75279325, 45894026, 170553801]))
+        np.testing.assert_array_equal(output_bt.get_end_locs(), np.array([75279326, 45894027, 170553802]))
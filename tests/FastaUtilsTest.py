@@ -0,0 +1,172 @@
+
+import unittest
+import shutil
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+
+from fasta_utils import IndexedFasta, RegionSeqExtractor, ReverseComplement, FastaWriter
+
+class FastaUtilsTest(unittest.TestCase):
+    def setUp(self):
+        self._test_path = "fasta_utils_test_dir"
+
+        if not os.path.exists(self._test_path):
+            os.makedirs(self._test_path)
+
+        rng = np.random.default_rng(0)
+        self._chrom_seqs = {"chr1": "".join(rng.choice(list("ACGTNacgt"), 157)),
+                            "chr2": "".join(rng.choice(list("ACGT"), 60)),
+                            "chr3": "".join(rng.choice(list("ACGT"), 33)),
+                            }
+        self._fasta_path = os.path.join(self._test_path, "test.fa")
+        with open(self._fasta_path, "w") as handle:
+            for chrom, seq in self._chrom_seqs.items():
+                handle.write(f">{chrom} description\n")
+                for i in range(0, len(seq), 60):
+                    handle.write(seq[i:i + 60] + "\n")
+
+    def tearDown(self):
+        if os.path.exists(self._test_path):
+            shutil.rmtree(self._test_path)
+        super().tearDown()
+
+    def test_build_fai(self):
+        fai_dict = IndexedFasta.build_fai(self._fasta_path)
+
+        self.assertEqual(list(fai_dict.keys()), ["chr1", "chr2", "chr3"])
+        self.assertEqual(fai_dict["chr1"], (157, len(">chr1 description\n"), 60, 61))
+        self.assertEqual(fai_dict["chr3"][0], 33)
+
+    def test_scan_seq_ids(self):
+        seq_ids = ["chr1", "chr2", "chr3"]
+        for block_size in [1, 7, 61, 1 << 24]:
+            self.assertEqual(IndexedFasta.scan_seq_ids(self._fasta_path, block_size=block_size), seq_ids)
+
+        # Empty sequences and no trailing newline
+        fasta_path = os.path.join(self._test_path, "empty_seqs.fa")
+        with open(fasta_path, "w") as handle:
+            handle.write(">a_ref\n>b_1:A2G\nACGT\n>c")
+        for block_size in [1, 2, 5, 100]:
+            self.assertEqual(IndexedFasta.scan_seq_ids(fasta_path, block_size=block_size), ["a_ref", "b_1:A2G", "c"])
+
+        gz_path = self._fasta_path + ".gz"
+        with open(self._fasta_path, "rb") as ihandle, gzip.open(gz_path, "wb") as ohandle:
+            ohandle.write(ihandle.read())
+        self.assertEqual(IndexedFasta.scan_seq_ids(gz_path, block_size=16), seq_ids)
+
+        with open(self._fasta_path + ".fai", "w") as handle:
+            handle.write("chrA\t1\t6\t1\t2\n")
+        self.assertEqual(IndexedFasta.scan_seq_ids(self._fasta_path), ["chrA"])
+
+        # A stale index is ignored
+        fasta_mtime = os.path.getmtime(self._fasta_path)
+        os.utime(self._fasta_path + ".fai", (fasta_mtime - 10, fasta_mtime - 10))
+        self.assertEqual(IndexedFasta.scan_seq_ids(self._fasta_path), seq_ids)
+        fasta = IndexedFasta(self._fasta_path)
+        self.assertEqual(fasta.get_chrom_names(), seq_ids)
+        fasta.close()
+
+    def test_get_seq(self):
+        fasta = IndexedFasta(self._fasta_path)
+
+        for chrom, start, end in [("chr1", 0, 157), ("chr1", 59, 61), ("chr1", 60, 121),
+                                  ("chr1", 100, 101), ("chr2", 0, 60), ("chr3", 5, 30)]:
+            self.assertEqual(fasta.get_seq(chrom, start, end), self._chrom_seqs[chrom][start:end])
+
+        # Coordinates are clipped to the chromosome
+        self.assertEqual(fasta.get_seq("chr3", 20, 100), self._chrom_seqs["chr3"][20:])
+        self.assertEqual(fasta.get_seq("chr3", 40, 50), "")
+        self.assertIsNone(fasta.get_seq("chrFake", 0, 10))
+
+        fasta.close()
+
+    def test_region_seq_extractor(self):
+        rng = np.random.default_rng(1)
+        chrom_arr = rng.choice(["chr1", "chr2", "chr3"], 200)
+        start_arr = np.array([rng.integers(0, len(self._chrom_seqs[c]) - 10) for c in chrom_arr])
+        end_arr = start_arr + rng.integers(1, 10, len(start_arr))
+        region_df = pd.DataFrame({"chrom": chrom_arr, "start": start_arr, "end": end_arr})
+        expected_seqs = [self._chrom_seqs[c][s:e] for c, s, e in zip(chrom_arr, start_arr, end_arr)]
+
+        for num_workers in [1, 3]:
+            with RegionSeqExtractor(None, self._fasta_path, num_workers, shard_size=16) as seq_extractor:
+                self.assertEqual(seq_extractor.get_region_seqs(region_df), expected_seqs)
+
+        with RegionSeqExtractor(None, self._fasta_path, 2) as seq_extractor:
+            with self.assertRaises(ValueError):
+                seq_extractor.get_region_seqs(pd.DataFrame({"chrom": ["chrFake"], "start": [0], "end": [1]}))
+
+    def test_region_seq_extractor_chunks(self):
+        rng = np.random.default_rng(2)
+        start_arr = rng.integers(0, 100, 10000)
+        region_df = pd.DataFrame({"chrom": ["chr1"] * len(start_arr), 
+                                  "start": start_arr, 
+                                  "end": start_arr + 5, 
+                                  })
+        expected_seqs = [self._chrom_seqs["chr1"][s:s + 5] for s in start_arr]
+
+        with RegionSeqExtractor(None, self._fasta_path, 4) as seq_extractor:
+            # A sorted chunk of the default size is split among all workers
+            shard_list, _ = seq_extractor.get_shards(region_df["chrom"].to_numpy(), 
+                                                     region_df["start"].to_numpy(), 
+                                                     region_df["end"].to_numpy(), 
+                                                     )
+            self.assertEqual(len(shard_list), 4)
+
+            seq_list = []
+            for chunk_start, chunk_df, chunk_seq_list in seq_extractor.iter_region_seq_chunks(region_df, 3000):
+                self.assertEqual(chunk_start, len(seq_list))
+                self.assertEqual(len(chunk_df), len(chunk_seq_list))
+                seq_list += chunk_seq_list
+            self.assertEqual(seq_list, expected_seqs)
+
+    def test_fasta_writer(self):
+        seq_ids = [f"seq{i}" for i in range(500)]
+        seqs = ["ACGT" * (i % 50) for i in range(500)]
+        expected_content = "".join(f">{seq_id}\n{seq}\n" for seq_id, seq in zip(seq_ids, seqs))
+
+        opath = os.path.join(self._test_path, "out.fa")
+        with FastaWriter(opath, buffer_size=1000) as writer:
+            writer.write_records(seq_ids, seqs)
+        with open(opath, "r") as handle:
+            self.assertEqual(handle.read(), expected_content)
+
+        for compression in ["gzip", "bgzip"]:
+            opath = os.path.join(self._test_path, f"out.{compression}.fa.gz")
+            with FastaWriter(opath, compression, buffer_size=1000) as writer:
+                for seq_id, seq in zip(seq_ids, seqs):
+                    writer.write(seq_id, seq)
+            with gzip.open(opath, "rt") as handle:
+                self.assertEqual(handle.read(), expected_content)
+
+        # bgzip output ends with the BGZF EOF block
+        with open(opath, "rb") as handle:
+            self.assertEqual(handle.read()[-28:], FastaWriter.get_bgzf_eof_block())
+
+        with self.assertRaises(ValueError):
+            FastaWriter(opath, "zip")
+
+    def test_reverse_complement_seqs(self):
+        seq_list = ["AACG", "GTTn", "", "CCaN", "AT"]
+
+        self.assertEqual(ReverseComplement.reverse_complement_seqs(seq_list, [True, False, True, True, False]),
+                         ["CGTT", "GTTn", "", "NtGG", "AT"])
+        self.assertEqual(ReverseComplement.reverse_complement_seqs(seq_list, np.zeros(5, dtype=bool)), seq_list)
+
+    def test_reverse_complement_one_hot(self):
+        # ACGT channel order
+        one_hot_arr = np.array([[[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 0]],
+                                [[0, 0, 1, 0], [0, 0, 0, 1], [1, 0, 0, 0]],
+                                ], dtype=np.uint8)  # "ACN", "GTA"
+
+        output_arr = ReverseComplement.reverse_complement_one_hot(one_hot_arr.copy(), [False, True])
+
+        self.assertTrue(np.array_equal(output_arr[0], one_hot_arr[0]))
+        # reverse complement of "GTA" is "TAC"
+        self.assertTrue(np.array_equal(output_arr[1], np.array([[0, 0, 0, 1], [1, 0, 0, 0], [0, 1, 0, 0]])))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+
+import unittest
+import argparse
+import shutil
+import os
+
+import numpy as np
+import pandas as pd
+
+from RGTools.BedTable import BedTable6
+
+from gebin import GEBin, GEBinWriter
+from ge_utils import GEUtils
+from export import GenomicElementExport
+from GenomicElementImport import GenomicElementImport
+from pad_region import PadRegion
+
+class GEBinTest(unittest.TestCase):
+    def setUp(self):
+        self._test_path = "GEBinTest_temp_data"
+
+        if not os.path.exists(self._test_path):
+            os.makedirs(self._test_path)
+
+        self._bed6_path = os.path.join("example_data", "three_genes.bed6")
+        self._gebin_path = os.path.join(self._test_path, "three_genes.gebin")
+
+        return super().setUp()
+
+    def tearDown(self):
+        if os.path.exists(self._test_path):
+            shutil.rmtree(self._test_path)
+
+        return super().tearDown()
+
+    def export_gebin(self, chunk_size=None):
+        args = argparse.Namespace(
+            region_file_path=self._bed6_path,
+            region_file_type="bed6",
+            opath=self._gebin_path,
+            chunk_size=chunk_size,
+            oformat="gebin",
+        )
+        GenomicElementExport.export_gebin(args)
+
+    def test_gebin_columns(self):
+        self.export_gebin()
+
+        gebin = GEBin(self._gebin_path)
+        self.assertEqual(gebin.get_num_regions(), 3)
+        self.assertEqual(gebin.get_region_file_type(), "bed6")
+        self.assertEqual(gebin.get_column_names(), ["chrom", "start", "end", "name", "score", "strand"])
+
+        start_arr = gebin.get_column_arr("start")
+        self.assertIsInstance(start_arr, np.memmap)
+        np.testing.assert_array_equal(start_arr, np.array([75278325, 45894026, 170553801]))
+        np.testing.assert_array_equal(gebin.get_column_arr("chrom"), np.array(["chr14", "chr17", "chr6"]))
+        np.testing.assert_array_equal(gebin.get_column_arr("strand", 1, 3), np.array(["+", "+"]))
+        np.testing.assert_array_equal(gebin.get_column_arr("name", 1), np.array(["MAPT", "TBP"]))
+
+    def test_gebin_round_trip(self):
+        for chunk_size in [None, 2]:
+            self.export_gebin(chunk_size)
+
+            args = argparse.Namespace(
+                inpath=self._gebin_path,
+                opath=os.path.join(self._test_path, "round_trip.bed6"),
+                chunk_size=chunk_size,
+                informat="gebin",
+            )
+            GenomicElementImport.import_gebin(args)
+
+            input_bt = BedTable6(enable_sort=False)
+            input_bt.load_from_file(self._bed6_path)
+            output_bt = BedTable6(enable_sort=False)
+            output_bt.load_from_file(args.opath)
+
+            pd.testing.assert_frame_equal(output_bt.to_dataframe(), input_bt.to_dataframe())
+
+    def test_gebin_streamed_matches(self):
+        self.export_gebin()
+        streamed_path = os.path.join(self._test_path, "streamed.gebin")
+        GEUtils.stream_region_transform(self._bed6_path, 
+                                        "bed6", 
+                                        streamed_path, 
+                                        2, 
+                                        lambda region_df, chunk_offset: region_df, 
+                                        output_region_file_type="gebin", 
+                                        )
+
+        # Column kinds come from the bed6 schema, not from the parsed text
+        self.assertEqual(sorted(os.listdir(streamed_path)), sorted(os.listdir(self._gebin_path)))
+        for fname in os.listdir(self._gebin_path):
+            with open(os.path.join(self._gebin_path, fname), "rb") as handle, \
+                 open(os.path.join(streamed_path, fname), "rb") as streamed_handle:
+                self.assertEqual(streamed_handle.read(), handle.read(), fname)
+        self.assertEqual(GEBin(streamed_path).get_column_arr("score").dtype, np.float64)
+
+    def test_gebin_lossy_cast(self):
+        region_df = pd.DataFrame({"chrom": ["chr1", "chr1"],
+                                  "start": [0, 10],
+                                  "end": [5, 15],
+                                  "score": [1, 2],
+                                  })
+        with self.assertRaises(ValueError):
+            with GEBinWriter(self._gebin_path, "bed3", region_df.columns) as writer:
+                writer.append(region_df)
+                writer.append(region_df.assign(score=[1.5, 2.0]))
+        self.assertFalse(os.path.exists(self._gebin_path))
+
+    def test_gebin_string_column(self):
+        region_df = pd.DataFrame({"chrom": ["chr1", "chr1", "chr2"],
+                                  "start": [0, 10, 20],
+                                  "end": [5, 15, 25],
+                                  "name": ["GAPDH", "", "é漢"],
+                                  })
+        GEBin.write_region_df(region_df, "bed3", self._gebin_path)
+
+        gebin = GEBin(self._gebin_path)
+        self.assertEqual(gebin.get_column_arr("name").tolist(), ["GAPDH", "", "é漢"])
+        self.assertEqual(gebin.get_column_arr("name", 1, 2).tolist(), [""])
+
+    def test_gebin_opath(self):
+        self.export_gebin()
+        # Existing gebin region files are replaced
+        self.export_gebin(chunk_size=2)
+        self.assertEqual(GEBin(self._gebin_path).get_num_regions(), 3)
+
+        other_path = os.path.join(self._test_path, "other")
+        os.makedirs(other_path)
+        open(os.path.join(other_path, "notes.txt"), "w").close()
+        with self.assertRaises(ValueError):
+            GEBin.write_region_df(GEBin(self._gebin_path).get_region_df(), "bed6", other_path)
+        self.assertEqual(os.listdir(other_path), ["notes.txt"])
+
+    def test_stream_region_transform_failure(self):
+        def failing_transform(region_df, chunk_offset):
+            if chunk_offset > 0:
+                raise RuntimeError("Failed transform")
+            return region_df
+
+        for output_region_file_type in ["bed6", "gebin"]:
+            opath = os.path.join(self._test_path, f"failed.{output_region_file_type}")
+            with self.assertRaises(RuntimeError):
+                GEUtils.stream_region_transform(self._bed6_path, 
+                                                "bed6", 
+                                                opath, 
+                                                2, 
+                                                failing_transform, 
+                                                output_region_file_type=output_region_file_type, 
+                                                )
+            self.assertEqual(os.listdir(self._test_path), [])
+
+    def test_pad_region_gebin(self):
+        self.export_gebin()
+
+        args = argparse.Namespace(
+            region_file_path=self._gebin_path,
+            region_file_type="gebin",
+            upstream_pad=100,
+            downstream_pad=100,
+            ignore_strand=False,
+            method_resolving_invalid_region="fallback",
+            opath=os.path.join(self._test_path, "padded.gebin"),
+            chunk_size=None,
+        )
+        PadRegion.main(args)
+
+        output_gebin = GEBin(args.opath)
+        self.assertEqual(output_gebin.get_region_file_type(), "bed6")
+        self.assertEqual(output_gebin.get_column_arr("start")[0], 75278225)
+        self.assertEqual(output_gebin.get_column_arr("end")[0], 75279426)
@@ -0,0 +1,130 @@
+
+import unittest
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ge_utils import GEUtils
+
+class GEUtilsTest(unittest.TestCase):
+    def test_get_overlap_pairs(self):
+        region_df = pd.DataFrame({"chrom": ["chr1", "chr2", "chr1", "chr3"],
+                                  "start": [100, 100, 0, 0],
+                                  "end": [200, 200, 150, 10],
+                                  })
+        feature_df = pd.DataFrame({"chrom": ["chr1", "chr1", "chr2", "chr1", "chr1", "chr1"],
+                                   "start": [150, 120, 199, 90, 200, 99],
+                                   "end": [151, 121, 200, 110, 201, 100],
+                                   })
+
+        region_idx_arr, feature_idx_arr = GEUtils.get_overlap_pairs(region_df, feature_df)
+
+        # Pairs are ordered by region, then by feature file order
+        self.assertEqual(list(zip(region_idx_arr.tolist(), feature_idx_arr.tolist())),
+                         [(0, 0), (0, 1), (0, 3),
+                          (1, 2),
+                          (2, 1), (2, 3), (2, 5),
+                          ])
+
+    def test_get_overlap_pairs_brute_force(self):
+        rng = np.random.default_rng(0)
+        region_start_arr = rng.integers(0, 1000, 50)
+        region_df = pd.DataFrame({"chrom": rng.choice(["chr1", "chr2"], 50),
+                                  "start": region_start_arr,
+                                  "end": region_start_arr + rng.integers(0, 100, 50),
+                                  })
+        feature_start_arr = rng.integers(0, 1100, 300)
+        feature_df = pd.DataFrame({"chrom": rng.choice(["chr1", "chr2", "chr3"], 300),
+                                   "start": feature_start_arr,
+                                   "end": feature_start_arr + rng.integers(0, 30, 300),
+                                   })
+
+        region_idx_arr, feature_idx_arr = GEUtils.get_overlap_pairs(region_df, feature_df)
+
+        expected_pairs = [(i, j) for i in range(len(region_df)) for j in range(len(feature_df))
+                          if region_df["chrom"][i] == feature_df["chrom"][j] and
+                             feature_df["start"][j] < region_df["end"][i] and
+                             feature_df["end"][j] > region_df["start"][i]]
+        self.assertEqual(list(zip(region_idx_arr.tolist(), feature_idx_arr.tolist())), expected_pairs)
+
+    def test_get_row_percentile(self):
+        rng = np.random.default_rng(0)
+        arr = rng.normal(size=(20, 37))
+        arr[3, 5] = np.nan
+
+        for percentile in [0, 12.5, 50, 99, 100]:
+            self.assertTrue(np.allclose(GEUtils.get_row_percentile(arr, percentile),
+                                        np.percentile(arr, percentile, axis=1),
+                                        equal_nan=True,
+                                        ))
+
+    def test_get_num_regions(self):
+        with tempfile.TemporaryDirectory() as wdir:
+            region_file_path = os.path.join(wdir, "regions.bed3")
+            with open(region_file_path, "w") as handle:
+                handle.write("chr1\t0\t10\nchr1\t20\t30\n\nchr2\t5\t8")
+
+            self.assertEqual(GEUtils.get_num_regions(region_file_path, "bed3"), 3)
+
+    def test_get_chrom_filter_logical(self):
+        chrom_arr = np.array(["chr2", "chr1", "chrUn", "chr2", "chrX"])
+
+        np.testing.assert_array_equal(GEUtils.get_chrom_filter_logical(chrom_arr, ["chr1", "chr2"]),
+                                      [True, True, False, True, False])
+
+    def test_filter_anno_npy(self):
+        with tempfile.TemporaryDirectory() as wdir:
+            anno_path = os.path.join(wdir, "track.npy")
+            opath = os.path.join(wdir, "track.filtered.npy")
+            anno_arr = np.arange(7 * 3, dtype=np.float32).reshape(7, 3)
+            np.save(anno_path, anno_arr)
+            filter_logical = np.array([True, False, False, True, True, False, True])
+
+            # 2 rows per chunk
+            num_rows = GEUtils.filter_anno_npy(anno_path, filter_logical, opath, chunk_bytes=24)
+
+            self.assertEqual(num_rows, 4)
+            output_arr = np.load(opath)
+            self.assertEqual(output_arr.dtype, np.float32)
+            np.testing.assert_array_equal(output_arr, anno_arr[filter_logical])
+
+            with self.assertRaises(ValueError):
+                GEUtils.filter_anno_npy(anno_path, filter_logical[:-1], opath)
+
+    def test_get_merge_order(self):
+        rng = np.random.default_rng(0)
+        region_df_list = []
+        for num_regions in [50, 30, 0, 20]:
+            start_arr = rng.integers(0, 100, num_regions)
+            region_df_list.append(pd.DataFrame({"chrom": rng.choice(["chr1", "chr10", "chr2"], num_regions),
+                                                "start": start_arr,
+                                                "end": start_arr + rng.integers(1, 3, num_regions),
+                                                }).sort_values(["chrom", "start", "end"]))
+        self.assertTrue(all(GEUtils.is_region_df_sorted(region_df) for region_df in region_df_list))
+
+        merged_df = pd.concat(region_df_list, ignore_index=True)
+        self.assertFalse(GEUtils.is_region_df_sorted(merged_df))
+        expected_order = merged_df.sort_values(["chrom", "start", "end"], kind="stable").index.to_numpy()
+        np.testing.assert_array_equal(GEUtils.get_merge_order(region_df_list, presorted=True), expected_order)
+        np.testing.assert_array_equal(GEUtils.get_merge_order(region_df_list), expected_order)
+
+    def test_get_region_ids(self):
+        region_df = pd.DataFrame({"chrom": ["chr1", "chrX"],
+                                  "start": [0, 150],
+                                  "end": [100, 1200],
+                                  "gene_symbol": ["GAPDH", "XIST"],
+                                  })
+
+        self.assertEqual(GEUtils.get_region_ids(region_df).tolist(), ["chr1:0-100", "chrX:150-1200"])
+        self.assertEqual(GEUtils.get_region_ids(region_df, "gene_symbol").tolist(), ["GAPDH", "XIST"])
+        self.assertEqual(GEUtils.get_coord_ids(region_df["chrom"], region_df["start"], region_df["end"],
+                                               chrom_sep="_", range_sep="_").tolist(),
+                         ["chr1_0_100", "chrX_150_1200"])
+
+        with self.assertRaises(ValueError):
+            GEUtils.get_region_ids(region_df, "name")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,7 @@ import argparse
 import shutil
 import os
 import io
+import gzip
 import contextlib
 
 import pandas as pd
@@ -14,6 +15,7 @@ from export import GenomicElementExport
 from RGTools.BedTable import BedTable3, BedTable6, BedTable6Plus
 from RGTools.ExogeneousSequences import ExogeneousSequences
 from RGTools.GenomicElements import GenomicElements
+from RGTools.exceptions import InvalidStrandnessException
 
 class GenomicElementExportTest(unittest.TestCase):
     def setUp(self):
@@ -98,6 +100,10 @@ class GenomicElementExportTest(unittest.TestCase):
             fasta_path=self.__fasta_path,
             opath=ofile,
             oformat="ExogeneousSequences",
+            num_workers=None,
+            strand_aware=False,
+            compression="none",
+            chunk_size=2,
         )
         GenomicElementExport.export_exogeneous_sequences(args)
 
@@ -106,6 +112,42 @@ class GenomicElementExportTest(unittest.TestCase):
             self.assertEqual(len(lines), 6)
             self.assertEqual(lines[1][:10], "CCCCATCCCC")
 
+        args.num_workers = 2
+        args.opath = os.path.join(self.__wdir, "test.parallel.fa")
+        GenomicElementExport.export_exogeneous_sequences(args)
+
+        parallel_records = self.__read_fasta_records(args.opath)
+        self.assertEqual([r[0] for r in parallel_records],
+                         ["chr14:75278325-75279326", "chr17:45894026-45895027", "chr6:170553801-170554802"])
+        self.assertEqual([r[1] for r in parallel_records], [r[1] for r in self.__read_fasta_records(ofile)])
+
+    def test_export_exogeneous_sequences_strand_aware(self):
+        args = argparse.Namespace(
+            region_file_path=self.__bed6gene_path,
+            region_file_type="bed6gene",
+            fasta_path=self.__fasta_path,
+            opath=os.path.join(self.__wdir, "test.stranded.fa"),
+            oformat="ExogeneousSequences",
+            num_workers=None,
+            strand_aware=True,
+            compression="none",
+            chunk_size=2,
+        )
+        GenomicElementExport.export_exogeneous_sequences(args)
+        records = self.__read_fasta_records(args.opath)
+
+        ref_seqs = GenomicElements(self.__bed6gene_path, "bed6gene", self.__fasta_path).get_all_region_seqs()
+        complement = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+        # FOS is on the minus strand, MAPT and TBP on the plus strand
+        self.assertEqual(records[0][1], ref_seqs[0].translate(complement)[::-1])
+        self.assertEqual(records[1][1], ref_seqs[1])
+        self.assertEqual(records[2][1], ref_seqs[2])
+
+        args.region_file_path = self.__bed3_path
+        args.region_file_type = "bed3"
+        with self.assertRaises(InvalidStrandnessException):
+            GenomicElementExport.export_exogeneous_sequences(args)
+
     def test_export_stat_list(self):
         args = argparse.Namespace(
             region_file_path=self.__bed3_path,
@@ -113,6 +155,8 @@ class GenomicElementExportTest(unittest.TestCase):
             stat_npy=self.__sample1_npy_path,
             opath=os.path.join(self.__wdir, "test.stat_list.txt"),
             dtype="np.int64",
+            float_format=None,
+            chunk_size=1000000,
             oformat="stat_list",
         )
         GenomicElementExport.export_stat_list(args)
@@ -122,6 +166,26 @@ class GenomicElementExportTest(unittest.TestCase):
 
         self.assertEqual(lines, ["1", "2", "3"])
 
+    def test_export_stat_list_float_format(self):
+        args = argparse.Namespace(
+            region_file_path=self.__bed3_path,
+            region_file_type="bed3",
+            stat_npy=self.__sample1_npy_path,
+            opath=os.path.join(self.__wdir, "test.stat_list.txt"),
+            dtype="np.float64",
+            float_format="%.2f",
+            chunk_size=2,
+            oformat="stat_list",
+        )
+        GenomicElementExport.export_stat_list(args)
+
+        with open(args.opath, "r") as handle:
+            self.assertEqual(handle.read(), "1.00\n2.00\n3.00\n")
+
+        args.dtype = "str"
+        with self.assertRaises(ValueError):
+            GenomicElementExport.export_stat_list(args)
+
     def test_export_stat_list_stdout(self):
         args = argparse.Namespace(
             region_file_path=self.__bed3_path,
@@ -129,6 +193,8 @@ class GenomicElementExportTest(unittest.TestCase):
             stat_npy=self.__sample1_npy_path,
             opath="-",
             dtype="np.int64",
+            float_format=None,
+            chunk_size=1000000,
             oformat="stat_list",
         )
         stdout_buffer = io.StringIO()
@@ -145,6 +211,10 @@ class GenomicElementExportTest(unittest.TestCase):
             num_replicates=2,
             opath=os.path.join(self.__wdir, "test.wtes.fa"),
             oformat="WTES",
+            num_workers=None,
+            strand_aware=False,
+            compression="none",
+            chunk_size=2,
         )
         GenomicElementExport.export_wtes(args)
 
@@ -160,6 +230,20 @@ class GenomicElementExportTest(unittest.TestCase):
         self.assertEqual(lines[1], lines[3])
         self.assertEqual(lines[5], lines[7])
         self.assertEqual(lines[9], lines[11])
+
+        args.num_workers = 2
+        args.opath = os.path.join(self.__wdir, "test.wtes.parallel.fa")
+        GenomicElementExport.export_wtes(args)
+
+        with open(args.opath, "r") as handle:
+            self.assertEqual([line.strip() for line in handle.readlines()], lines)
+
+        args.compression = "gzip"
+        args.opath = os.path.join(self.__wdir, "test.wtes.fa.gz")
+        GenomicElementExport.export_wtes(args)
+
+        with gzip.open(args.opath, "rt") as handle:
+            self.assertEqual([line.strip() for line in handle.readlines()], lines)
     
     def test_export_count_table(self):
 
@@ -198,6 +282,70 @@ class GenomicElementExportTest(unittest.TestCase):
         self.assertEqual(output_df.iloc[2, 0], 3)
         self.assertEqual(output_df.index[1], "gene3")
 
+    def test_export_count_table_binary(self):
+        args = argparse.Namespace(
+            region_file_path=self.__bed3_path,
+            region_file_type="bed3",
+            opath=os.path.join(self.__wdir, "test.count.npz"),
+            oformat="CountTable",
+            region_id_type="default",
+            sample_name=["sample1", "sample2"],
+            stat_npy=[self.__sample1_npy_path, self.__sample2_npy_path],
+        )
+        GenomicElementExport.export_count_table(args)
+
+        args.opath = os.path.join(self.__wdir, "test.count.csv")
+        GenomicElementExport.export_count_table(args)
+        csv_df = pd.read_csv(args.opath, index_col=0)
+
+        with np.load(os.path.join(self.__wdir, "test.count.npz")) as npz:
+            self.assertTrue(np.array_equal(npz["counts"], csv_df.to_numpy()))
+            self.assertEqual(npz["region_ids"].tolist(), csv_df.index.tolist())
+            self.assertEqual(npz["sample_names"].tolist(), ["sample1", "sample2"])
+
+        args.opath = os.path.join(self.__wdir, "test.count.npy")
+        GenomicElementExport.export_count_table(args)
+        self.assertTrue(np.array_equal(np.load(args.opath, mmap_mode="r"), csv_df.to_numpy()))
+        with np.load(os.path.join(self.__wdir, "test.count.labels.npz")) as npz:
+            self.assertEqual(npz["region_ids"].tolist(), csv_df.index.tolist())
+
+    def test_get_heatmap_image(self):
+        track_arr = np.array([[1, -2, 3, 4],
+                              [0, 0, 1, 1],
+                              [5, 5, 5, -6],
+                              ], dtype=np.float32)
+        # Rows 1 and 0 share the first image row, row 2 has the second one
+        row_bin_arr = np.array([0, 0, 1])
+
+        image_arr = GenomicElementExport.get_heatmap_image(track_arr, row_bin_arr, 2, 2, "mean", chunk_size=2)
+        self.assertTrue(np.allclose(image_arr, [[0.75, 2.25], [5, 5.5]]))
+
+        image_arr = GenomicElementExport.get_heatmap_image(track_arr, row_bin_arr, 2, 2, "max", chunk_size=2)
+        self.assertTrue(np.allclose(image_arr, [[2, 4], [5, 6]]))
+
+    def test_read_heatmap_manifest(self):
+        manifest_path = os.path.join(self.__wdir, "heatmaps.tsv")
+        pd.DataFrame({
+            "region_file_path": [self.__bed3_path, self.__bed3_path],
+            "region_file_type": ["bed3", "bed3"],
+            "opath": ["a.png", "b.png"],
+            "track_npy": ["pl.npy,mn.npy", "pl.npy"],
+            "title": ["PL,MN", "PL"],
+            "negative": ["False,True", "False"],
+            "pooling": ["", "max"],
+            "sort_group": ["tre", ""],
+        }).to_csv(manifest_path, sep="\t", index=False)
+
+        heatmap_args_list, sort_group_list = GenomicElementExport.read_heatmap_manifest(manifest_path)
+
+        self.assertEqual(sort_group_list, ["tre", None])
+        self.assertEqual(heatmap_args_list[0].track_npy, ["pl.npy", "mn.npy"])
+        self.assertEqual(heatmap_args_list[0].negative, [False, True])
+        # Empty and missing columns take the Heatmap defaults
+        self.assertEqual(heatmap_args_list[0].pooling, "mean")
+        self.assertEqual(heatmap_args_list[1].pooling, "max")
+        self.assertEqual(heatmap_args_list[1].vmax_percentile, 50)
+
     def test_export_chrom_filtered_ge(self):
         args = argparse.Namespace(
             region_file_path=self.__bed3_path,
@@ -205,6 +353,7 @@ class GenomicElementExportTest(unittest.TestCase):
             chrom_size=self.__chrom_size_path,
             opath=os.path.join(self.__wdir, "test.chrom.filtered.ge"),
             oformat="ChromFilteredGE",
+            chunk_size=None,
         )
         GenomicElementExport.export_chrom_filtered_ge(args)
 
@@ -212,6 +361,14 @@ class GenomicElementExportTest(unittest.TestCase):
         output_bt.load_from_file(args.opath)
         self.assertEqual(len(output_bt), 1)
 
+        args.chunk_size = 2
+        args.opath = os.path.join(self.__wdir, "test.chrom.filtered.chunked.ge")
+        GenomicElementExport.export_chrom_filtered_ge(args)
+
+        chunked_bt = BedTable3()
+        chunked_bt.load_from_file(args.opath)
+        pd.testing.assert_frame_equal(chunked_bt.to_dataframe(), output_bt.to_dataframe())
+
     def test_export_masked_ge(self):
         args = argparse.Namespace(
             region_file_path=self.__bed3_path,
@@ -239,6 +396,17 @@ class GenomicElementExportTest(unittest.TestCase):
         np.testing.assert_array_equal(masked_stat.reshape(-1,), np.array([1, 3]))
         np.testing.assert_array_equal(masked_track[:, 0], np.array([1, 3]))
 
+        # An annotation of another region set is rejected before any output is written
+        short_npy_path = os.path.join(self.__wdir, "short_stat.npy")
+        np.save(short_npy_path, np.array([1, 2]))
+        args.opath = os.path.join(self.__wdir, "test.masked.mismatch.bed3")
+        args.anno_npy = [self.__sample1_npy_path, short_npy_path]
+        args.anno_oheader = os.path.join(self.__wdir, "masked_mismatch")
+        with self.assertRaises(ValueError):
+            GenomicElementExport.export_masked_ge(args)
+        self.assertFalse(os.path.exists(args.opath))
+        self.assertFalse(os.path.exists(args.anno_oheader + ".sample1.npy"))
+
     def test_export_trebed(self):
         args = argparse.Namespace(
             region_file_path=self.__bed3_path,
@@ -320,6 +488,32 @@ class GenomicElementExportTest(unittest.TestCase):
         # mn peak at 300 -> revTSS = 75278325 + 300 = 75278625
         self.assertEqual(regions[0]["revTSS"], 75278325 + 300)
 
+    def test_get_trebed_df(self):
+        region_df = pd.DataFrame({
+            "chrom": ["chr1", "chr2"],
+            "start": [100, 200],
+            "end": [104, 202],
+        })
+        pl_track = np.array([[0, 3, -5, 1],
+                             [2, 1, 9, 9]], dtype=np.float32)
+        mn_track = np.array([[-1, 0, 0, 2],
+                             [0, -4, -8, 0]], dtype=np.float32)
+        pl_track_path = os.path.join(self.__wdir, "trebed_pl.npy")
+        np.save(pl_track_path, pl_track)
+
+        trebed_df = GenomicElementExport.get_trebed_df(region_df, 
+                                                       np.load(pl_track_path, mmap_mode="r"), 
+                                                       mn_track,
+                                                       )
+
+        self.assertEqual(trebed_df["name"].tolist(), ["chr1:100-104", "chr2:200-202"])
+        # Padding beyond the region end is ignored
+        np.testing.assert_array_equal(trebed_df["fwdTSS"].to_numpy(), [102, 200])
+        np.testing.assert_array_equal(trebed_df["revTSS"].to_numpy(), [103, 201])
+
+        with self.assertRaises(ValueError):
+            GenomicElementExport.get_trebed_df(region_df, pl_track[:, :3], mn_track)
+
     def test_export_merged_ge(self):
         left_region_path = os.path.join(self.__wdir, "merge_left.bed3")
         right_region_path = os.path.join(self.__wdir, "merge_right.bed3")
@@ -358,6 +552,8 @@ class GenomicElementExportTest(unittest.TestCase):
             left_anno_path=[left_stat_path, left_track_path],
             right_anno_path=[right_stat_path, right_track_path],
             anno_type=["stat", "track"],
+            extra_region_file_path=[],
+            extra_anno_path=[],
             oheader=oheader,
             oformat="MergedGE",
         )
@@ -377,6 +573,132 @@ class GenomicElementExportTest(unittest.TestCase):
         np.testing.assert_array_equal(stat_arr.reshape(-1,), np.array([10, 20, 100, 200]))
         np.testing.assert_array_equal(track_arr[:, 0], np.array([3, 4, 1, 2]))
 
+    def test_export_merged_ge_unsorted(self):
+        region_path_list = []
+        stat_path_list = []
+        for i, region_dict in enumerate([{"chrom": ["chr2", "chr1"], "start": [100, 50], "end": [110, 60]},
+                                         {"chrom": ["chr1", "chr2"], "start": [70, 100], "end": [80, 110]}]):
+            region_path_list.append(os.path.join(self.__wdir, f"merge_unsorted_{i}.bed3"))
+            region_bt = BedTable3(enable_sort=False)
+            region_bt.load_from_dataframe(pd.DataFrame(region_dict))
+            region_bt.write(region_path_list[-1])
+
+            stat_path_list.append(os.path.join(self.__wdir, f"merge_unsorted_{i}.stat.npy"))
+            np.save(stat_path_list[-1], np.array([10 * i, 10 * i + 1]))
+
+        oheader = os.path.join(self.__wdir, "merged_unsorted")
+        args = argparse.Namespace(
+            left_region_file_path=region_path_list[0],
+            right_region_file_path=region_path_list[1],
+            region_file_type="bed3",
+            anno_name=["stat"],
+            left_anno_path=[stat_path_list[0]],
+            right_anno_path=[stat_path_list[1]],
+            anno_type=["stat"],
+            extra_region_file_path=[],
+            extra_anno_path=[],
+            oheader=oheader,
+            oformat="MergedGE",
+        )
+        GenomicElementExport.export_merged_ge(args)
+
+        merged_bt = BedTable3(enable_sort=False)
+        merged_bt.load_from_file(oheader + ".bed3")
+        self.assertEqual(merged_bt.to_dataframe()["start"].tolist(), [50, 70, 100, 100])
+        # Equal regions keep the input order, as for sorted inputs
+        np.testing.assert_array_equal(np.load(oheader + ".stat.npy"), np.array([1, 10, 0, 11]))
+
+    def test_export_merged_ge_multiple_inputs(self):
+        region_dict_list = [
+            {"chrom": ["chr1", "chr2"], "start": [100, 100], "end": [110, 104]},
+            {"chrom": ["chr1", "chr1"], "start": [50, 100], "end": [60, 110]},
+            {"chrom": ["chr1", "chr3"], "start": [80, 10], "end": [88, 12]},
+        ]
+        region_path_list = []
+        stat_path_list = []
+        track_path_list = []
+        for i, region_dict in enumerate(region_dict_list):
+            region_path_list.append(os.path.join(self.__wdir, f"merge_multi_{i}.bed3"))
+            region_bt = BedTable3(enable_sort=False)
+            region_bt.load_from_dataframe(pd.DataFrame(region_dict))
+            region_bt.write(region_path_list[-1])
+
+            stat_path_list.append(os.path.join(self.__wdir, f"merge_multi_{i}.stat.npy"))
+            np.save(stat_path_list[-1], np.array([10 * i, 10 * i + 1]))
+            # Tracks padded to the longest region of each input
+            track_path_list.append(os.path.join(self.__wdir, f"merge_multi_{i}.track.npy"))
+            region_len = np.array(region_dict["end"]) - np.array(region_dict["start"])
+            np.save(track_path_list[-1], np.full((2, region_len.max()), i + 1))
+
+        oheader = os.path.join(self.__wdir, "merged_multi")
+        args = argparse.Namespace(
+            left_region_file_path=region_path_list[0],
+            right_region_file_path=region_path_list[1],
+            region_file_type="bed3",
+            anno_name=["stat", "track"],
+            left_anno_path=[stat_path_list[0], track_path_list[0]],
+            right_anno_path=[stat_path_list[1], track_path_list[1]],
+            anno_type=["stat", "track"],
+            extra_region_file_path=[region_path_list[2]],
+            extra_anno_path=[stat_path_list[2], track_path_list[2]],
+            oheader=oheader,
+            oformat="MergedGE",
+        )
+        GenomicElementExport.export_merged_ge(args)
+
+        merged_bt = BedTable3(enable_sort=False)
+        merged_bt.load_from_file(oheader + ".bed3")
+        merged_df = merged_bt.to_dataframe()
+        self.assertEqual(merged_df["chrom"].tolist(), ["chr1", "chr1", "chr1", "chr1", "chr2", "chr3"])
+        self.assertEqual(merged_df["start"].tolist(), [50, 80, 100, 100, 100, 10])
+
+        # Equal regions keep the input order
+        stat_arr = np.load(oheader + ".stat.npy")
+        np.testing.assert_array_equal(stat_arr, np.array([10, 20, 0, 11, 1, 21]))
+
+        track_arr = np.load(oheader + ".track.npy")
+        self.assertEqual(track_arr.shape, (6, 10))
+        np.testing.assert_array_equal(track_arr[:, 0], np.array([2, 3, 1, 2, 1, 3]))
+        np.testing.assert_array_equal(track_arr[1], np.array([3] * 8 + [0] * 2))
+
+    def test_export_merged_ge_anno_type(self):
+        region_path = os.path.join(self.__wdir, "merge_type.bed3")
+        region_bt = BedTable3(enable_sort=False)
+        region_bt.load_from_dataframe(pd.DataFrame({"chrom": ["chr1", "chr2"], "start": [0, 0], "end": [10, 10]}))
+        region_bt.write(region_path)
+
+        stat_path = os.path.join(self.__wdir, "merge_type.stat.npy")
+        mask_path = os.path.join(self.__wdir, "merge_type.mask.npy")
+        np.save(stat_path, np.array([1, 2]))
+        np.save(mask_path, np.array([True, False]))
+
+        oheader = os.path.join(self.__wdir, "merged_type")
+        args = argparse.Namespace(
+            left_region_file_path=region_path,
+            right_region_file_path=region_path,
+            region_file_type="bed3",
+            anno_name=["mask"],
+            left_anno_path=[mask_path],
+            right_anno_path=[mask_path],
+            anno_type=["mask"],
+            extra_region_file_path=[],
+            extra_anno_path=[],
+            oheader=oheader,
+            oformat="MergedGE",
+        )
+        GenomicElementExport.export_merged_ge(args)
+        self.assertEqual(np.load(oheader + ".mask.npy").dtype, bool)
+
+        # Integer stats are not masks, 1-D stats are not tracks
+        os.remove(oheader + ".bed3")
+        for anno_path, anno_type in [(stat_path, "mask"), (stat_path, "track"), (mask_path, "array")]:
+            args.right_anno_path = [anno_path]
+            args.anno_type = [anno_type]
+            with self.assertRaises(ValueError) as context:
+                GenomicElementExport.export_merged_ge(args)
+            self.assertIn(f"not a valid {anno_type} annotation", str(context.exception))
+            self.assertFalse(os.path.exists(oheader + ".bed3"))
+
     def test_export_bed6poly(self):
         args = argparse.Namespace(
             region_file_path=self.__bed6_path,
@@ -447,6 +769,8 @@ class GenomicElementExportTest(unittest.TestCase):
             inpath_polymorphisms=snp_path,
             opath=ofa,
             oformat="allele_expanded_ES",
+            num_workers=None,
+            chunk_size=10000,
         )
 
         GenomicElementExport.export_allele_expanded_es(args)
@@ -501,6 +825,8 @@ class GenomicElementExportTest(unittest.TestCase):
             inpath_polymorphisms=snp_path,
             opath=ofa,
             oformat="allele_expanded_ES",
+            num_workers=None,
+            chunk_size=10000,
         )
 
         GenomicElementExport.export_allele_expanded_es(args)
@@ -510,3 +836,122 @@ class GenomicElementExportTest(unittest.TestCase):
         self.assertTrue(records[0][0].endswith("_ref"))
         self.assertIn(f"{75278325 + mut_index}:{ref_base}2{alt_base}", records[1][0])
         self.assertEqual(records[1][1][mut_index].upper(), alt_base)
+
+    def test_export_allele_expanded_es_keeps_file_order(self):
+        tre_path = os.path.join(self.__wdir, "three_tres.bed3")
+        snp_path = os.path.join(self.__wdir, "three_tres.snp.bed6plus")
+        ofa = os.path.join(self.__wdir, "three_tres.allele_expanded.fa")
+
+        tre_bt = BedTable3(enable_sort=False)
+        tre_bt.load_from_dataframe(pd.DataFrame({
+            "chrom": ["chr17", "chr14", "chr6"],
+            "start": [45894026, 75278325, 170553801],
+            "end": [45895027, 75279326, 170554802],
+        }))
+        tre_bt.write(tre_path)
+
+        ge = GenomicElements(tre_path, "bed3", self.__fasta_path)
+        ref_seqs = ge.get_all_region_seqs()
+        alt_bases = ["A" if ref_seqs[1][i].upper() != "A" else "C" for i in [30, 5]]
+
+        # Polymorphisms of chr14 are listed downstream first, the chr6 region has none
+        snp_bt = BedTable6Plus(extra_column_names=["bases"],
+                               extra_column_dtype=[str],
+                               enable_sort=False,
+                               )
+        snp_bt.load_from_dataframe(pd.DataFrame({
+            "chrom": ["chr14", "chr14", "chr17"],
+            "start": [75278325 + 30, 75278325 + 5, 45894026 + 1],
+            "end": [75278325 + 31, 75278325 + 6, 45894026 + 2],
+            "name": ["rs1", "rs2", "rs3"],
+            "score": [0.0, 0.0, 0.0],
+            "strand": ["+", "+", "+"],
+            "bases": [f"{ref_seqs[1][30].upper()}/{alt_bases[0]}",
+                      f"{ref_seqs[1][5].upper()}/{alt_bases[1]}",
+                      f"{ref_seqs[0][1].upper()}/TT",
+                      ],
+        }))
+        snp_bt.write(snp_path)
+
+        args = argparse.Namespace(
+            region_file_path=tre_path,
+            region_file_type="bed3",
+            fasta_path=self.__fasta_path,
+            inpath_polymorphisms=snp_path,
+            opath=ofa,
+            oformat="allele_expanded_ES",
+            num_workers=None,
+            chunk_size=10000,
+        )
+        GenomicElementExport.export_allele_expanded_es(args)
+        records = self.__read_fasta_records(ofa)
+
+        self.assertEqual([r[0].split("_", 3)[-1] for r in records],
+                         ["ref",
+                          "ref",
+                          f"{75278325 + 30}:{ref_seqs[1][30].upper()}2{alt_bases[0]}",
+                          f"{75278325 + 5}:{ref_seqs[1][5].upper()}2{alt_bases[1]}",
+                          ])
+        self.assertTrue(records[0][0].startswith("chr17_"))
+        self.assertEqual(records[2][1], ref_seqs[1][:30] + alt_bases[0] + ref_seqs[1][31:])
+        self.assertEqual(records[3][1], ref_seqs[1][:5] + alt_bases[1] + ref_seqs[1][6:])
+
+    def test_export_allele_expanded_es_index_and_workers(self):
+        tre_path = os.path.join(self.__wdir, "two_tres.bed3")
+        snp_path = os.path.join(self.__wdir, "two_tres.snp.bed6plus")
+
+        tre_bt = BedTable3(enable_sort=False)
+        tre_bt.load_from_dataframe(pd.DataFrame({
+            "chrom": ["chr17", "chr14"],
+            "start": [45894026, 75278325],
+            "end": [45895027, 75279326],
+        }))
+        tre_bt.write(tre_path)
+
+        ge = GenomicElements(tre_path, "bed3", self.__fasta_path)
+        ref_seqs = ge.get_all_region_seqs()
+        alt_bases = ["A" if ref_seqs[i][10].upper() != "A" else "C" for i in range(2)]
+
+        snp_bt = BedTable6Plus(extra_column_names=["bases"],
+                               extra_column_dtype=[str],
+                               enable_sort=False,
+                               )
+        snp_bt.load_from_dataframe(pd.DataFrame({
+            "chrom": ["chr17", "chr14"],
+            "start": [45894026 + 10, 75278325 + 10],
+            "end": [45894026 + 11, 75278325 + 11],
+            "name": ["rs1", "rs2"],
+            "score": [0.0, 0.0],
+            "strand": ["+", "+"],
+            "bases": [f"{ref_seqs[i][10].upper()}/{alt_bases[i]}" for i in range(2)],
+        }))
+        snp_bt.write(snp_path)
+
+        ofa_list = []
+        for num_workers in [None, 2]:
+            ofa = os.path.join(self.__wdir, f"two_tres.{num_workers}.allele_expanded.fa")
+            args = argparse.Namespace(
+                region_file_path=tre_path,
+                region_file_type="bed3",
+                fasta_path=self.__fasta_path,
+                inpath_polymorphisms=snp_path,
+                opath=ofa,
+                oformat="allele_expanded_ES",
+                num_workers=num_workers,
+                chunk_size=1,
+            )
+            GenomicElementExport.export_allele_expanded_es(args)
+            ofa_list.append(ofa)
+
+        with open(ofa_list[0], "rb") as f:
+            fasta_bytes = f.read()
+        with open(ofa_list[1], "rb") as f:
+            self.assertEqual(f.read(), fasta_bytes)
+
+        index_df = pd.read_csv(ofa_list[0] + ".index.tsv", sep="\t")
+        self.assertEqual(index_df["record_index"].tolist(), [0, 1, 2, 3])
+        self.assertEqual(index_df["region_index"].tolist(), [0, 0, 1, 1])
+        self.assertEqual(index_df["snp_pos"].tolist(), [-1, 45894026 + 10, -1, 75278325 + 10])
+        self.assertEqual(index_df["alt_base"].tolist(), [".", alt_bases[0], ".", alt_bases[1]])
+        for byte_offset in index_df["byte_offset"]:
+            self.assertEqual(fasta_bytes[byte_offset:byte_offset + 1], b">")
@@ -5,6 +5,7 @@ import shutil
 import os
 
 import numpy as np
+import pandas as pd
 
 from GenomicElementImport import GenomicElementImport
 from RGTools.GenomicElements import GenomicElements
@@ -96,6 +97,38 @@ class GenomicElementImportTest(unittest.TestCase):
         self.assertEqual(loaded_arr[1], 2)
         self.assertEqual(loaded_arr[2], 3)
 
+    def test_import_float_list_chunked(self):
+        list_file = os.path.join(self.__wdir, "test_float_list.txt")
+        with open(list_file, 'w') as f:
+            f.write("0.5\n")
+            f.write("-2\n")
+            f.write("1e3\n")
+
+        args = argparse.Namespace(
+            region_file_path=self.__bed3_path,
+            region_file_type="bed3",
+            inpath=list_file,
+            opath=os.path.join(self.__wdir, "test_float_list.npy"),
+            informat="stat_list",
+            dtype="np.float32",
+            chunk_size=2,
+        )
+        GenomicElementImport.import_stat_list(args)
+
+        loaded_arr = np.load(args.opath)
+        self.assertEqual(loaded_arr.dtype, np.float32)
+        self.assertEqual(loaded_arr.shape, (3, 1))
+        self.assertTrue(np.array_equal(loaded_arr[:, 0], [0.5, -2.0, 1000.0]))
+
+        with open(list_file, 'a') as f:
+            f.write("4\n")
+        with self.assertRaises(ValueError) as context:
+            GenomicElementImport.import_stat_list(args)
+        self.assertIn("does not match", str(context.exception))
+        # A failed import leaves the previous output in place
+        self.assertTrue(np.array_equal(np.load(args.opath)[:, 0], [0.5, -2.0, 1000.0]))
+        self.assertFalse(any(f.endswith(".tmp.npy") for f in os.listdir(self.__wdir)))
+
     def test_import_list_npz(self):
         # Create a test list file with 3 lines (matching three_genes.bed3)
         list_file = os.path.join(self.__wdir, "test_list.txt")
@@ -246,4 +279,79 @@ class GenomicElementImportTest(unittest.TestCase):
 
         with self.assertRaises(ValueError) as context:
             GenomicElementImport.import_allele_expanded_es(args)
-        self.assertIn("Invalid allele_expanded_ES FASTA header", str(context.exception))
\ No newline at end of file
+        self.assertIn("Invalid allele_expanded_ES FASTA header", str(context.exception))
+
+    def test_import_allele_expanded_es_with_record_index(self):
+        fasta_path = os.path.join(self.__wdir, "indexed.fa")
+        # Headers are not parsed when the record index of export allele_expanded_ES is present
+        ExogeneousSequences.write_sequences_to_fasta(
+            seq_ids=["seq0", "seq1", "seq2", "seq3"],
+            sequences=["AAAA", "AGAA", "CCCC", "ATAA"],
+            fasta_path=fasta_path,
+        )
+        pd.DataFrame({
+            "record_index": [0, 1, 2, 3],
+            "byte_offset": [0, 11, 22, 33],
+            "region_index": [0, 0, 1, 0],
+            "chrom": ["chr1", "chr1", "chr2", "chr1"],
+            "start": [100, 100, 200, 100],
+            "end": [104, 104, 204, 104],
+            "snp_pos": [-1, 101, -1, 101],
+            "ref_base": [".", "A", ".", "A"],
+            "alt_base": [".", "G", ".", "T"],
+        }).to_csv(fasta_path + ".index.tsv", sep="\t", index=False)
+
+        stat_path = os.path.join(self.__wdir, "signal.npy")
+        np.save(stat_path, np.asarray([1.0, 0.0, 3.0, 2.0]))
+
+        args = argparse.Namespace(
+            inpath=fasta_path,
+            anno_oheader=os.path.join(self.__wdir, "indexed_import"),
+            stat_name=["signal"],
+            stat_npy=[stat_path],
+            stat_selection_method=["max_abs_fc"],
+            informat="allele_expanded_ES",
+        )
+        GenomicElementImport.import_allele_expanded_es(args)
+
+        ref_arr = np.load(args.anno_oheader + ".signal.ref.npy")
+        alt_arr = np.load(args.anno_oheader + ".signal.alt.npy")
+        self.assertTrue(np.array_equal(ref_arr[:, 0], [1.0, 3.0]))
+        # Ties are broken by file order; regions without alternates get NaN
+        self.assertEqual(alt_arr[0, 0], 0.0)
+        self.assertTrue(np.isnan(alt_arr[1, 0]))
+
+    def test_read_allele_expanded_records_stale_index(self):
+        fasta_path = os.path.join(self.__wdir, "stale.fa")
+        ExogeneousSequences.write_sequences_to_fasta(
+            seq_ids=["chr1_100_104_ref", "chr1_100_104_101:A2G", "chr2_200_204_ref"],
+            sequences=["AAAA", "AGAA", "CCCC"],
+            fasta_path=fasta_path,
+        )
+        index_path = fasta_path + ".index.tsv"
+        pd.DataFrame({
+            "record_index": [0, 1],
+            "byte_offset": [0, 22],
+            "region_index": [0, 1],
+            "chrom": ["chr3", "chr4"],
+            "start": [0, 0],
+            "end": [4, 4],
+            "snp_pos": [-1, -1],
+            "ref_base": [".", "."],
+            "alt_base": [".", "."],
+        }).to_csv(index_path, sep="\t", index=False)
+
+        # The last byte offset does not point at the last record
+        record_df = GenomicElementImport.read_allele_expanded_records(fasta_path)
+        self.assertEqual(record_df["chrom"].tolist(), ["chr1", "chr1", "chr2"])
+        self.assertEqual(record_df["is_ref"].tolist(), [True, False, True])
+
+        # The index is older than the FASTA file
+        with open(index_path, "a") as f:
+            f.write("2\t50\t1\tchr4\t0\t4\t-1\t.\t.\n")
+        self.assertEqual(GenomicElementImport.read_allele_expanded_records(fasta_path)["chrom"].tolist(),
+                         ["chr3", "chr4", "chr4"])
+        fasta_mtime = os.path.getmtime(fasta_path)
+        os.utime(index_path, (fasta_mtime - 10, fasta_mtime - 10))
+        self.assertEqual(GenomicElementImport.read_allele_expanded_records(fasta_path)["chrom"].tolist(),
+                         ["chr1", "chr1", "chr2"])
@@ -44,6 +44,7 @@ class MotifSearchTest(unittest.TestCase):
         args.output_header = os.path.join(self._test_path, "three_genes.motif_search")
         args.estimate_background_freq = True
         args.strand = "+"
+        args.num_workers = None
 
         return args
 
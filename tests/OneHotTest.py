@@ -0,0 +1,125 @@
+
+import unittest
+import argparse
+import shutil
+import os
+
+import numpy as np
+
+from one_hot import OneHot
+from seq_pack import PackedSeqs
+
+from RGTools.GenomicElements import GenomicElements
+
+class OneHotTest(unittest.TestCase):
+    def setUp(self):
+        self._test_path = "one_hot_test_dir"
+
+        if not os.path.exists(self._test_path):
+            os.makedirs(self._test_path)
+
+        self._hg38_fasta_path = os.path.join("RGTools", "large_files", "hg38.fa")
+        self._bed6_path = os.path.join("example_data", "three_genes.bed6")
+
+    def tearDown(self):
+        if os.path.exists(self._test_path):
+            shutil.rmtree(self._test_path)
+        super().tearDown()
+
+    def get_onehot_simple_args(self):
+        args = argparse.Namespace()
+
+        args.subcommand = "onehot"
+        args.fasta_path = self._hg38_fasta_path
+        args.region_file_path = self._bed6_path
+        args.region_file_type = "bed6"
+        args.opath = os.path.join(self._test_path, "three_genes.onehot.npy")
+        args.oformat = "npy"
+        args.dtype = "float64"
+        args.chunk_size = 2
+        args.num_workers = None
+        args.strand_aware = False
+
+        return args
+
+    def test_encode_seqs(self):
+        one_hot_arr = OneHot.encode_seqs(["ACgN", "TTTA"], dtype="uint8")
+
+        self.assertEqual(one_hot_arr.shape, (2, 4, 4))
+        self.assertEqual(one_hot_arr.dtype, np.uint8)
+        self.assertTrue(np.array_equal(one_hot_arr[0],
+                                       np.array([[1, 0, 0, 0],
+                                                 [0, 1, 0, 0],
+                                                 [0, 0, 1, 0],
+                                                 [0, 0, 0, 0],
+                                                 ])))
+        self.assertTrue(np.array_equal(one_hot_arr[1].argmax(axis=1), np.array([3, 3, 3, 0])))
+
+        with self.assertRaises(ValueError):
+            OneHot.encode_seqs(["ACG", "TTTA"])
+
+    def test_main(self):
+        args = self.get_onehot_simple_args()
+
+        OneHot.main(args)
+
+        ge = GenomicElements(region_file_path=args.region_file_path,
+                             region_file_type=args.region_file_type,
+                             fasta_path=args.fasta_path,
+                             )
+        expected_arr = ge.get_all_region_one_hot().transpose(0, 2, 1)
+
+        output_arr = np.load(args.opath)
+        self.assertEqual(output_arr.shape, (3, 1001, 4))
+        self.assertEqual(output_arr.dtype, np.float64)
+        self.assertTrue(np.array_equal(output_arr, expected_arr))
+
+        args.num_workers = 2
+        OneHot.main(args)
+        self.assertTrue(np.array_equal(np.load(args.opath), expected_arr))
+
+        args.dtype = "bool"
+        OneHot.main(args)
+
+        output_arr = np.load(args.opath)
+        self.assertEqual(output_arr.dtype, np.bool_)
+        self.assertTrue(np.array_equal(output_arr, expected_arr.astype(bool)))
+
+    def test_main_packed(self):
+        args = self.get_onehot_simple_args()
+        OneHot.main(args)
+        expected_arr = np.load(args.opath)
+
+        args.oformat = "packed"
+        args.opath = os.path.join(self._test_path, "three_genes.packed")
+        OneHot.main(args)
+
+        packed_seqs = PackedSeqs(args.opath)
+        self.assertEqual(packed_seqs.get_num_seqs(), 3)
+        self.assertEqual(packed_seqs.get_seq_len(), 1001)
+        self.assertTrue(np.array_equal(packed_seqs.get_batch_one_hot([0, 1, 2], dtype="float64"),
+                                       expected_arr,
+                                       ))
+
+    def test_main_strand_aware(self):
+        args = self.get_onehot_simple_args()
+        OneHot.main(args)
+        unstranded_arr = np.load(args.opath)
+
+        args.strand_aware = True
+        OneHot.main(args)
+        stranded_arr = np.load(args.opath)
+
+        # FOS is on the minus strand, MAPT and TBP on the plus strand
+        self.assertTrue(np.array_equal(stranded_arr[0], unstranded_arr[0, ::-1, ::-1]))
+        self.assertTrue(np.array_equal(stranded_arr[1:], unstranded_arr[1:]))
+
+        args.oformat = "packed"
+        args.opath = os.path.join(self._test_path, "three_genes.stranded.packed")
+        OneHot.main(args)
+        self.assertTrue(np.array_equal(PackedSeqs(args.opath).get_batch_one_hot([0, 1, 2], dtype="float64"),
+                                       stranded_arr,
+                                       ))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,8 +4,11 @@ import argparse
 import shutil
 import os
 
+import numpy as np
+
 from RGTools.exceptions import InvalidBedRegionException
 from RGTools.BedTable import BedTable6
+from RGTools.GenomicElements import GenomicElements
 
 from pad_region import PadRegion
 
@@ -39,6 +42,7 @@ class PadRegionTest(unittest.TestCase):
         args.ignore_strand = False
         args.method_resolving_invalid_region = "fallback"
         args.opath = os.path.join(self._test_path, "output.bed6")
+        args.chunk_size = None
 
         return args
 
@@ -79,5 +83,64 @@ class PadRegionTest(unittest.TestCase):
         output_bt.load_from_file(args.opath)
         self.assertEqual(len(output_bt), 0)
 
+    def test_get_padded_coord_arr(self):
+        start_arr = np.array([1000, 1000, 1000])
+        end_arr = np.array([2000, 2000, 2000])
+        strand_arr = np.array(["+", "-", "+"])
+
+        new_start_arr, new_end_arr = PadRegion.get_padded_coord_arr(start_arr, 
+                                                                    end_arr, 
+                                                                    strand_arr, 
+                                                                    100, 
+                                                                    10, 
+                                                                    False, 
+                                                                    )
+        np.testing.assert_array_equal(new_start_arr, np.array([900, 990, 900]))
+        np.testing.assert_array_equal(new_end_arr, np.array([2010, 2100, 2010]))
+
+        new_start_arr, new_end_arr = PadRegion.get_padded_coord_arr(start_arr, 
+                                                                    end_arr, 
+                                                                    None, 
+                                                                    100, 
+                                                                    10, 
+                                                                    True, 
+                                                                    )
+        np.testing.assert_array_equal(new_start_arr, np.array([900, 900, 900]))
+        np.testing.assert_array_equal(new_end_arr, np.array([2010, 2010, 2010]))
+
+    def test_pad_region_preserve_order(self):
+        args = self.get_pad_region_simple_args()
+        args.region_file_path = self._bed6gene_path
+        args.region_file_type = "bed6gene"
+        args.opath = os.path.join(self._test_path, "output.bed6gene")
+
+        PadRegion.main(args)
+
+        output_bt = GenomicElements.BedTable6Gene()
+        output_bt.load_from_file(args.opath)
+
+        # The first region is on the minus strand, the others on the plus strand.
+        self.assertEqual(output_bt.get_region_extra_column("gene_symbol")[0], "gene2")
+        self.assertEqual(output_bt.get_start_locs()[1], 45893926)
+        self.assertEqual(output_bt.get_end_locs()[1], 45895127)
 
+    def test_pad_region_chunked(self):
+        args = self.get_pad_region_simple_args()
+        args.upstream_pad = -450
+        args.downstream_pad = -600
+        args.method_resolving_invalid_region = "drop"
+        PadRegion.main(args)
+
+        expected_bt = BedTable6(enable_sort=False)
+        expected_bt.load_from_file(args.opath)
+
+        args.chunk_size = 2
+        args.opath = os.path.join(self._test_path, "output.chunked.bed6")
+        PadRegion.main(args)
+
+        output_bt = BedTable6(enable_sort=False)
+        output_bt.load_from_file(args.opath)
 
+        self.assertEqual(len(output_bt), len(expected_bt))
+        np.testing.assert_array_equal(output_bt.get_start_locs(), expected_bt.get_start_locs())
+        np.testing.assert_array_equal(output_bt.get_end_locs(), expected_bt.get_end_locs())
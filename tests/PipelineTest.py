@@ -0,0 +1,156 @@
+
+import unittest
+import argparse
+import shutil
+import os
+
+import numpy as np
+import pandas as pd
+
+from RGTools.BedTable import BedTable3, BedTable6
+
+from pipeline import Pipeline
+from count_bw import CountSingleBw
+from bed2tss_bed import Bed2TssBed
+from pad_region import PadRegion
+
+class PipelineTest(unittest.TestCase):
+    def setUp(self):
+        self._test_path = "PipelineTest_temp_data"
+
+        if not os.path.exists(self._test_path):
+            os.makedirs(self._test_path)
+
+        self._bed3_path = os.path.join("example_data", "three_genes.bed3")
+        self._bed6_path = os.path.join("example_data", "three_genes.bed6")
+        self._pl_bw_path = os.path.join("RGTools", "large_files", "ENCFF565BWR.pl.bw")
+
+        self._chrom_size_path = os.path.join(self._test_path, "test.chrom.sizes")
+        pd.DataFrame({"chrom": ["chr14", "chr6"],
+                      "size": [107043718, 170805979],
+                      }).to_csv(self._chrom_size_path, 
+                                sep="\t", 
+                                header=False, 
+                                index=False, 
+                                )
+
+        return super().setUp()
+
+    def tearDown(self):
+        if os.path.exists(self._test_path):
+            shutil.rmtree(self._test_path)
+
+        return super().tearDown()
+
+    def get_pipeline_simple_args(self):
+        args = argparse.Namespace()
+        args.subcommand = "pipeline"
+        args.region_file_path = self._bed6_path
+        args.region_file_type = "bed6"
+        args.transform = ["TSS", "pad:100:50"]
+        args.ignore_strand = False
+        args.method_resolving_invalid_region = "fallback"
+        args.intermediate_oheader = None
+        args.region_opath = os.path.join(self._test_path, "output.bed6")
+        args.terminal = "region"
+        args.bw_path = []
+        args.count_opath = []
+
+        return args
+
+    def test_parse_transform(self):
+        self.assertEqual(Pipeline.parse_transform("center"), ("center", []))
+        self.assertEqual(Pipeline.parse_transform("pad:500:499"), ("pad", ["500", "499"]))
+
+        with self.assertRaises(ValueError):
+            Pipeline.parse_transform("pad:500")
+
+        with self.assertRaises(ValueError):
+            Pipeline.parse_transform("unknown")
+
+    def test_pipeline_matches_separate_tools(self):
+        args = self.get_pipeline_simple_args()
+        Pipeline.main(args)
+
+        bed2tssbed_args = argparse.Namespace(region_file_path=self._bed6_path,
+                                             region_file_type="bed6",
+                                             opath=os.path.join(self._test_path, "tss.bed6"),
+                                             output_site="TSS",
+                                             chunk_size=None,
+                                             )
+        Bed2TssBed.main(bed2tssbed_args)
+
+        pad_region_args = argparse.Namespace(region_file_path=bed2tssbed_args.opath,
+                                             region_file_type="bed6",
+                                             upstream_pad=100,
+                                             downstream_pad=50,
+                                             ignore_strand=False,
+                                             method_resolving_invalid_region="fallback",
+                                             opath=os.path.join(self._test_path, "tss.pad.bed6"),
+                                             chunk_size=None,
+                                             )
+        PadRegion.main(pad_region_args)
+
+        pipeline_bt = BedTable6(enable_sort=False)
+        pipeline_bt.load_from_file(args.region_opath)
+        separate_bt = BedTable6(enable_sort=False)
+        separate_bt.load_from_file(pad_region_args.opath)
+
+        pd.testing.assert_frame_equal(pipeline_bt.to_dataframe(), separate_bt.to_dataframe())
+
+        # Minus strand TSS at 75279325, upstream is towards larger coordinates.
+        self.assertEqual(pipeline_bt.get_start_locs()[0], 75279325 - 50)
+        self.assertEqual(pipeline_bt.get_end_locs()[0], 75279326 + 100)
+
+    def test_pipeline_filters_and_intermediate(self):
+        mask_path = os.path.join(self._test_path, "mask.npy")
+        np.save(mask_path, np.array([False, True]))
+
+        args = self.get_pipeline_simple_args()
+        args.region_file_path = self._bed3_path
+        args.region_file_type = "bed3"
+        args.region_opath = os.path.join(self._test_path, "output.bed3")
+        args.transform = ["center", f"chrom_filter:{self._chrom_size_path}", f"mask:{mask_path}"]
+        args.intermediate_oheader = os.path.join(self._test_path, "intermediate")
+
+        Pipeline.main(args)
+
+        output_bt = BedTable3(enable_sort=False)
+        output_bt.load_from_file(args.region_opath)
+        self.assertEqual(len(output_bt), 1)
+        self.assertEqual(output_bt.get_start_locs()[0], (170553801 + 170554802) // 2)
+
+        for step in range(3):
+            self.assertTrue(os.path.exists(f"{args.intermediate_oheader}.{step}.bed3"))
+
+    def test_pipeline_count_without_region_opath(self):
+        args = self.get_pipeline_simple_args()
+        args.region_file_path = self._bed3_path
+        args.region_file_type = "bed3"
+        args.transform = []
+        args.region_opath = None
+        args.terminal = "count_single_bw"
+        args.bw_path = [self._pl_bw_path]
+        args.count_opath = [os.path.join(self._test_path, "pipeline.pl.npy")]
+        args.quantification_type = "full_track"
+
+        Pipeline.main(args)
+
+        count_bw_args = argparse.Namespace()
+        count_bw_args.subcommand = "count_single_bw"
+        count_bw_args.bw_path = self._pl_bw_path
+        count_bw_args.region_file_path = self._bed3_path
+        count_bw_args.region_file_type = "bed3"
+        count_bw_args.override_strand = None
+        count_bw_args.quantification_type = "full_track"
+        count_bw_args.opath = os.path.join(self._test_path, "separate.pl.npy")
+        CountSingleBw.main(count_bw_args)
+
+        np.testing.assert_array_equal(np.load(args.count_opath[0]), np.load(count_bw_args.opath))
+        # Only the count output is written
+        self.assertEqual(sorted(os.listdir(self._test_path)), 
+                         ["pipeline.pl.npy", "separate.pl.npy", "test.chrom.sizes"])
+
+        args.terminal = "region"
+        with self.assertRaises(ValueError):
+            Pipeline.main(args)
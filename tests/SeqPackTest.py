@@ -0,0 +1,136 @@
+
+import unittest
+import shutil
+import os
+
+import numpy as np
+
+from seq_pack import PackedSeqWriter, PackedSeqs
+
+class SeqPackTest(unittest.TestCase):
+    def setUp(self):
+        self._test_path = "seq_pack_test_dir"
+
+        if not os.path.exists(self._test_path):
+            os.makedirs(self._test_path)
+
+    def tearDown(self):
+        if os.path.exists(self._test_path):
+            shutil.rmtree(self._test_path)
+        super().tearDown()
+
+    def test_encode_base_codes(self):
+        code_arr = PackedSeqs.encode_base_codes(["ACgN", "TTtA"])
+
+        self.assertTrue(np.array_equal(code_arr, np.array([[0, 1, 2, 4],
+                                                           [3, 3, 3, 0],
+                                                           ])))
+
+        with self.assertRaises(ValueError):
+            PackedSeqs.encode_base_codes(["ACG", "TTTA"])
+
+    def test_pack_round_trip(self):
+        rng = np.random.default_rng(0)
+        seq_list = ["".join(rng.choice(list("ACGTNacgt"), 13)) for _ in range(11)]
+        code_arr = PackedSeqs.encode_base_codes(seq_list)
+
+        opath = os.path.join(self._test_path, "seqs.packed")
+        with PackedSeqWriter(opath, 13) as writer:
+            # Chunks that do not end on a byte boundary
+            writer.append(code_arr[:3])
+            writer.append(code_arr[3:])
+
+        packed_seqs = PackedSeqs(opath)
+        self.assertEqual(packed_seqs.get_num_seqs(), 11)
+        self.assertEqual(packed_seqs.get_seq_len(), 13)
+        self.assertEqual(os.path.getsize(os.path.join(opath, "seq.bin")), (11 * 13 + 3) // 4)
+
+        self.assertTrue(np.array_equal(packed_seqs.get_batch_base_codes([7, 0, 10]),
+                                       code_arr[[7, 0, 10]],
+                                       ))
+
+        one_hot_arr = np.concatenate(list(packed_seqs.iter_batch_one_hot(4, dtype="uint8")))
+        self.assertEqual(one_hot_arr.shape, (11, 13, 4))
+        self.assertTrue(np.array_equal(one_hot_arr, PackedSeqs.base_codes_to_one_hot(code_arr, dtype="uint8")))
+
+        with self.assertRaises(IndexError):
+            packed_seqs.get_batch_base_codes([11])
+
+    def test_writer_opath(self):
+        opath = os.path.join(self._test_path, "seqs.packed")
+        with PackedSeqWriter(opath, 4) as writer:
+            writer.append(PackedSeqs.encode_base_codes(["ACGT", "TTTA"]))
+        # Existing packed sequence files are replaced
+        with PackedSeqWriter(opath, 4) as writer:
+            writer.append(PackedSeqs.encode_base_codes(["ACGA"]))
+        self.assertEqual(PackedSeqs(opath).get_num_seqs(), 1)
+
+        # A failed write leaves the existing file unchanged
+        with self.assertRaises(ValueError):
+            with PackedSeqWriter(opath, 4) as writer:
+                writer.append(PackedSeqs.encode_base_codes(["ACG"]))
+        self.assertEqual(PackedSeqs(opath).get_num_seqs(), 1)
+        self.assertEqual(os.listdir(self._test_path), ["seqs.packed"])
+
+        other_path = os.path.join(self._test_path, "other")
+        os.makedirs(other_path)
+        open(os.path.join(other_path, "notes.txt"), "w").close()
+        with self.assertRaises(ValueError):
+            PackedSeqWriter(other_path, 4)
+        self.assertEqual(os.listdir(other_path), ["notes.txt"])
+
+    def test_ragged_round_trip(self):
+        seq_list = ["ACGTN", "", "GG", "acgtacgtacgtA", "T"]
+        code_arr, seq_len_arr = PackedSeqs.encode_ragged_base_codes(seq_list)
+        self.assertTrue(np.array_equal(seq_len_arr, np.array([5, 0, 2, 13, 1])))
+
+        opath = os.path.join(self._test_path, "ragged.packed")
+        with PackedSeqWriter(opath) as writer:
+            writer.append(code_arr[:7], seq_len_arr[:3])
+            writer.append(code_arr[7:], seq_len_arr[3:])
+
+        packed_seqs = PackedSeqs(opath)
+        self.assertIsNone(packed_seqs.get_seq_len())
+        self.assertTrue(np.array_equal(packed_seqs.get_seq_offset_arr(), np.array([0, 5, 5, 7, 20, 21])))
+        self.assertTrue(np.array_equal(packed_seqs.get_seq_len_arr(), seq_len_arr))
+
+        for i, seq in enumerate(seq_list):
+            self.assertTrue(np.array_equal(packed_seqs.get_seq_base_codes(i),
+                                           PackedSeqs.encode_ragged_base_codes([seq])[0],
+                                           ))
+
+        for i, seq in enumerate(seq_list):
+            seq_bytes, nmask_bytes, base_offset, seq_len = packed_seqs.get_packed(i)
+            self.assertIsInstance(seq_bytes, np.memmap)
+            self.assertEqual(seq_len, len(seq))
+            pos_arr = base_offset + np.arange(seq_len)
+            code_arr = (seq_bytes[pos_arr >> 2] >> ((pos_arr & 3) << 1).astype(np.uint8)) & 3
+            nmask_arr = (nmask_bytes[pos_arr >> 3] >> (7 - (pos_arr & 7)).astype(np.uint8)) & 1
+            self.assertTrue(np.array_equal(np.where(nmask_arr == 1, 4, code_arr), packed_seqs.get_seq_base_codes(i)))
+
+        one_hot_arr = packed_seqs.get_batch_one_hot([2, 0], dtype="uint8")
+        self.assertEqual(one_hot_arr.shape, (2, 5, 4))
+        self.assertTrue(np.array_equal(one_hot_arr[0].sum(axis=1), np.array([1, 1, 0, 0, 0])))
+        self.assertTrue(np.array_equal(one_hot_arr[1].argmax(axis=1)[:4], np.array([0, 1, 2, 3])))
+
+    def test_length_bucket_batches(self):
+        seq_list = ["A" * l for l in [9, 1, 5, 2, 8, 1, 7]]
+        code_arr, seq_len_arr = PackedSeqs.encode_ragged_base_codes(seq_list)
+
+        opath = os.path.join(self._test_path, "ragged.packed")
+        with PackedSeqWriter(opath) as writer:
+            writer.append(code_arr, seq_len_arr)
+        packed_seqs = PackedSeqs(opath)
+
+        batch_list = packed_seqs.get_length_bucket_batches(3)
+        self.assertEqual([b.tolist() for b in batch_list], [[1, 5, 3], [2, 6, 4], [0]])
+
+        batch_list = packed_seqs.get_length_bucket_batches(3, shuffle=True, seed=0)
+        self.assertEqual(sorted(np.concatenate(batch_list).tolist()), list(range(7)))
+
+        for seq_indices, one_hot_arr, batch_len_arr in packed_seqs.iter_bucketed_batch_one_hot(3):
+            self.assertEqual(one_hot_arr.shape, (len(seq_indices), batch_len_arr.max(), 4))
+            self.assertTrue(np.array_equal(one_hot_arr.sum(axis=(1, 2)), batch_len_arr))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -59,6 +59,19 @@ class Track2TssBedTest(unittest.TestCase):
         output = Track2TssBed.get_output_site_coord(region, track, "MaxAbsSig")
         self.assertEqual(output, 1050)
 
+    def test_get_output_site_coord_arr(self):
+        track_arr = np.zeros((3, 1000))
+        track_arr[0, 50] = 1
+        track_arr[1, 20] = -2
+        # Signal in the padded part of a shorter region is ignored.
+        track_arr[2, 10] = 1
+        track_arr[2, 800] = 5
+
+        start_arr = np.array([1000, 2000, 3000])
+        end_arr = np.array([2000, 3000, 3500])
+        output_arr = Track2TssBed.get_output_site_coord_arr(start_arr, end_arr, track_arr, "MaxAbsSig")
+        np.testing.assert_array_equal(output_arr, np.array([1050, 2020, 3010]))
+
     def test_track2tss_bed(self):
         args = argparse.Namespace()
         args.subcommand = "track2tss_bed"
@@ -67,6 +80,7 @@ class Track2TssBedTest(unittest.TestCase):
         args.track= self._pl_track_path
         args.opath = os.path.join(self._test_path, "output.bed")
         args.output_site = "MaxAbsSig"
+        args.chunk_size = None
 
         Track2TssBed.main(args)
 
@@ -88,3 +102,36 @@ class Track2TssBedTest(unittest.TestCase):
         self.assertEqual(len(output_bt), 3)
         self.assertEqual(output_df.loc[1, "start"], 45894254)
 
+    def test_track2tss_bed_chunked(self):
+        args = argparse.Namespace()
+        args.subcommand = "track2tss_bed"
+        args.region_file_path = self._bed3_path
+        args.region_file_type = "bed3"
+        args.track= self._pl_track_path
+        args.opath = os.path.join(self._test_path, "output.bed")
+        args.output_site = "MaxAbsSig"
+        args.chunk_size = None
+
+        Track2TssBed.main(args)
+
+        expected_bt = BedTable3(enable_sort=False)
+        expected_bt.load_from_file(args.opath)
+
+        args.chunk_size = 2
+        args.opath = os.path.join(self._test_path, "output.chunked.bed")
+        Track2TssBed.main(args)
+
+        output_bt = BedTable3(enable_sort=False)
+        output_bt.load_from_file(args.opath)
+
+        self.assertEqual(len(output_bt), len(expected_bt))
+        np.testing.assert_array_equal(output_bt.get_start_locs(), expected_bt.get_start_locs())
+        np.testing.assert_array_equal(output_bt.get_end_locs(), expected_bt.get_end_locs())
+
+        # A track of another region set is rejected before the output is written
+        args.track = os.path.join(self._test_path, "short_track.npy")
+        args.opath = os.path.join(self._test_path, "output.mismatch.bed")
+        np.save(args.track, np.zeros((2, 1001)))
+        with self.assertRaises(ValueError):
+            Track2TssBed.main(args)
+        self.assertFalse(os.path.exists(args.opath))
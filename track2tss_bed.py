@@ -1,15 +1,15 @@
 
-import pandas as pd
 import numpy as np
 
 from RGTools.BedTable import BedRegion
-from RGTools.GenomicElements import GenomicElements
+
+from ge_utils import GEUtils
 
 class Track2TssBed:
     @staticmethod
     def set_parser(parser):
 
-        GenomicElements.set_parser_genomic_element_region(parser)
+        GEUtils.set_parser_genomic_element_region(parser)
         parser.add_argument("--track", 
                             help="The track npy file path.",
                             type=str,
@@ -30,6 +30,8 @@ class Track2TssBed:
                             type=str,
                             )
 
+        GEUtils.set_parser_chunk_size(parser)
+
     @staticmethod
     def get_output_site_types():
         return ["MaxAbsSig"]
@@ -48,31 +50,90 @@ class Track2TssBed:
         return region["start"] + ouput_arg
 
     @staticmethod
-    def main(args):
+    def get_output_site_coord_arr(start_arr, 
+                                  end_arr, 
+                                  track_arr: "np.ndarray", 
+                                  output_site_type: str, 
+                                  ):
+        '''
+        Array version of `get_output_site_coord`.
+
+        Keyword arguments:
+        - start_arr: Array of region starts.
+        - end_arr: Array of region ends.
+        - track_arr: Padded track array of shape (N, max_region_len).
+        - output_site_type: The site for output.
+
+        Returns:
+        - site_arr: Array of output sites.
+        '''
+        start_arr = np.asarray(start_arr, dtype=np.int64)
+        end_arr = np.asarray(end_arr, dtype=np.int64)
 
-        genomic_elements = GenomicElements(region_file_path=args.region_file_path,
-                                           region_file_type=args.region_file_type,
-                                           fasta_path=None, 
-                                           )
-        genomic_elements.load_region_anno_from_npy("track", args.track, anno_type="track")
-        track_list = genomic_elements.get_track_list("track")
-
-        region_bt = genomic_elements.get_region_bed_table()
-        output_dict_list = []
-
-        for i, region in enumerate(region_bt.iter_regions()):
-            track = track_list[i]
+        if output_site_type == "MaxAbsSig":
+            output_arg_arr = GEUtils.get_masked_abs_argmax(track_arr, end_arr - start_arr)
+        else:
+            raise ValueError("Unknown output site type: {}".format(output_site_type))
 
-            output_site = Track2TssBed.get_output_site_coord(region, track, args.output_site)
-            output_region = region.to_dict()
-            output_region["start"] = output_site
-            output_region["end"] = output_site + 1
+        return start_arr + output_arg_arr
 
-            output_dict_list.append(output_region)
+    @staticmethod
+    def get_output_site_df(region_df, track_arr, output_site_type):
+        '''
+        Convert all regions of a region table to 1bp output sites 
+        based on the tracks of the regions (rows of track_arr).
+        '''
+        if track_arr.shape[0] != len(region_df):
+            raise ValueError(f"Number of tracks ({track_arr.shape[0]}) does not match "
+                             f"number of regions ({len(region_df)})")
+
+        output_site_arr = Track2TssBed.get_output_site_coord_arr(region_df["start"].to_numpy(dtype=np.int64), 
+                                                                 region_df["end"].to_numpy(dtype=np.int64), 
+                                                                 track_arr, 
+                                                                 output_site_type, 
+                                                                 )
+
+        output_df = region_df.copy()
+        output_df["start"] = output_site_arr
+        output_df["end"] = output_site_arr + 1
+
+        return output_df
 
-        output_region_bt = region_bt._clone_empty()
-        output_region_bt.load_from_dataframe(pd.DataFrame(output_dict_list,
-                                                          columns=region_bt.column_names,
-                                                          ))
-        
-        output_region_bt.write(args.opath)
\ No newline at end of file
+    @staticmethod
+    def main(args):
+        track_arr = GEUtils.load_anno_arr(args.track, mmap_mode="r")
+        if track_arr.ndim == 1:
+            track_arr = track_arr.reshape(-1, 1)
+
+        if args.chunk_size is not None:
+            # Checked before streaming so that a mismatch does not leave a partial output
+            num_regions = GEUtils.get_num_regions(args.region_file_path, args.region_file_type)
+            if num_regions != track_arr.shape[0]:
+                raise ValueError(f"Number of tracks ({track_arr.shape[0]}) does not match "
+                                 f"number of regions ({num_regions})")
+
+            GEUtils.stream_region_transform(
+                args.region_file_path, 
+                args.region_file_type, 
+                args.opath, 
+                args.chunk_size, 
+                lambda region_df, chunk_offset: Track2TssBed.get_output_site_df(
+                    region_df, 
+                    track_arr[chunk_offset:chunk_offset + len(region_df)], 
+                    args.output_site, 
+                ), 
+            )
+            return
+
+        region_df = GEUtils.read_region_df(args.region_file_path, args.region_file_type)
+
+        output_df = Track2TssBed.get_output_site_df(region_df, 
+                                                    track_arr, 
+                                                    args.output_site, 
+                                                    )
+
+        GEUtils.write_region_df(output_df, 
+                                args.opath, 
+                                args.region_file_type, 
+                                GEUtils.get_base_region_file_type(args.region_file_path, args.region_file_type), 
+                                )